@@ -14,3 +14,10 @@ from django.core.asgi import get_asgi_application
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'gestorpro.settings')
 
 application = get_asgi_application()
+
+# Com GESTORPRO_AQUECER=1 o worker monta URLs, compila templates e faz as
+# consultas mais comuns antes da primeira requisição (ver loja_app/aquecimento.py).
+if os.environ.get('GESTORPRO_AQUECER') == '1':
+    from loja_app.aquecimento import aquecer
+
+    aquecer()
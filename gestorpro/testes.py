@@ -0,0 +1,41 @@
+import tempfile
+from pathlib import Path
+
+from django.conf import settings
+from django.test.runner import DiscoverRunner
+from django.test.utils import override_settings
+
+
+class ExecutorDeTestes(DiscoverRunner):
+    """Roda os testes com métricas, caches em arquivo e resultados de tarefas num diretório temporário.
+
+    Sem isto cada execução deixava arquivos em ``BASE_DIR``, que o ``/metrics``
+    de uma execução seguinte (ou do servidor) somava.
+    """
+
+    def setup_test_environment(self, **kwargs):
+        super().setup_test_environment(**kwargs)
+        self._temporario = tempfile.TemporaryDirectory(prefix='gestorpro-testes-')
+        base = Path(self._temporario.name)
+        caches = {**settings.CACHES}
+        if not settings.CACHE_URL:
+            # Sem Redis, 'limites' e 'referencias' são arquivos em BASE_DIR.
+            for alias in ('limites', 'referencias'):
+                caches[alias] = {**caches[alias], 'LOCATION': base / alias}
+        self._configuracao = override_settings(
+            METRICAS_DIR=base / 'metricas',
+            LIMITES_DIR=base / 'limites',
+            REFERENCIAS_DIR=base / 'referencias',
+            CACHES=caches,
+            TAREFAS_RESULTADOS_DIR=base / 'tarefas_resultados',
+        )
+        self._configuracao.enable()
+
+    def teardown_test_environment(self, **kwargs):
+        from loja_app import metricas
+
+        # O atexit gravaria o que sobrou no METRICAS_DIR de verdade.
+        metricas.registro._reiniciar()
+        self._configuracao.disable()
+        self._temporario.cleanup()
+        super().teardown_test_environment(**kwargs)
@@ -14,14 +14,20 @@ Including another URLconf
     1. Import the include() function: from django.urls import include, path
     2. Add a URL to urlpatterns:  path('blog/', include('blog.urls'))
 """
+from django.conf import settings
 from django.contrib import admin
-from django.urls import path, include
+from django.urls import path, include, re_path
+
+from loja_app.estaticos import servir_estatico
 
 urlpatterns = [
     path('admin/', admin.site.urls),
     path('', include('loja_app.urls')),
 ]
 
+if settings.SERVIR_ESTATICOS:
+    urlpatterns.insert(0, re_path(r'^static/(?P<caminho>.+)$', servir_estatico))
+
 
 
 
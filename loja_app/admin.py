@@ -1,8 +1,266 @@
+import datetime
+
+from django.conf import settings
 from django.contrib import admin
-from .models import Loja
+from django.core.exceptions import ValidationError
+from django.core.paginator import Paginator
+from django.db import connections
+from django.db.models import F, Max, Min, Q, QuerySet
+from django.utils import timezone
+from django.utils.functional import cached_property
+
+from .models import Categoria, Cliente, Fornecedor, ItensVenda, Loja, MovimentacaoEstoque, Produto, Venda, somente_digitos
+
+
+def contagem_estimada(queryset):
+    """Quantidade aproximada de linhas da tabela de ``queryset`` sem percorrê-la (``None`` se não souber).
+
+    PostgreSQL e MySQL guardam a estimativa nas estatísticas; no SQLite usamos
+    o intervalo de ids, lido das pontas do índice da chave primária (linhas
+    excluídas fazem a estimativa passar um pouco do real).
+    """
+    conexao = connections[queryset.db]
+    tabela = queryset.model._meta.db_table
+    if conexao.vendor == 'postgresql':
+        sql, params = 'SELECT reltuples::bigint FROM pg_class WHERE oid = %s::regclass', [conexao.ops.quote_name(tabela)]
+    elif conexao.vendor == 'mysql':
+        sql = 'SELECT table_rows FROM information_schema.tables WHERE table_schema = DATABASE() AND table_name = %s'
+        params = [tabela]
+    else:
+        ids = queryset.model._default_manager.using(queryset.db).values_list('pk', flat=True)
+        # Duas consultas: o SQLite só otimiza MIN/MAX quando é o único agregado.
+        primeiro, ultimo = ids.order_by('pk').first(), ids.order_by('-pk').first()
+        return 0 if primeiro is None else ultimo - primeiro + 1
+    with conexao.cursor() as cursor:
+        cursor.execute(sql, params)
+        linha = cursor.fetchone()
+    # reltuples é -1 em tabela que nunca passou por ANALYZE.
+    return int(linha[0]) if linha and linha[0] is not None and linha[0] >= 0 else None
+
+
+class ContagemEstimadaPaginator(Paginator):
+    """Paginador que não faz ``COUNT(*)`` na tabela inteira.
+
+    Sem filtros usa :func:`contagem_estimada`; com filtros (ou tabela pequena)
+    conta no máximo ``LIMITE_CONTAGEM`` linhas, e as páginas param aí.
+    """
+
+    LIMITE_CONTAGEM = 10000
+
+    @cached_property
+    def count(self):
+        if not self.object_list.query.has_filters():
+            estimativa = contagem_estimada(self.object_list)
+            if estimativa is not None and estimativa > self.LIMITE_CONTAGEM:
+                return estimativa
+        # COUNT sobre um subselect com LIMIT: para de ler ao chegar ao limite.
+        return self.object_list.order_by()[:self.LIMITE_CONTAGEM].count()
+
+
+def _inicio_do_periodo(valor, tipo):
+    if tipo == 'year':
+        return valor.replace(month=1, day=1)
+    return valor.replace(day=1) if tipo == 'month' else valor
+
+
+def _proximo_periodo(dia, tipo):
+    if tipo == 'year':
+        return dia.replace(year=dia.year + 1)
+    if tipo == 'month':
+        return dia.replace(year=dia.year + dia.month // 12, month=dia.month % 12 + 1)
+    return dia + datetime.timedelta(days=1)
+
+
+class PeriodosIndexadosQuerySet(QuerySet):
+    """QuerySet da hierarquia de datas do admin que lê o índice da data em vez de varrer a tabela.
+
+    O admin lista os anos/meses/dias com ``SELECT DISTINCT`` sobre a data
+    truncada (no SQLite, uma função Python por linha) e pega o intervalo com
+    ``MIN`` e ``MAX`` na mesma consulta. Aqui cada período sai de uma busca
+    no índice (o primeiro registro a partir do fim do período anterior) e
+    ``MIN``/``MAX`` viram duas leituras nas pontas do índice.
+    """
+
+    def _primeiro(self, campo, desde=None, ordem=''):
+        consulta = self if desde is None else self.filter(**{f'{campo}__gte': desde})
+        return consulta.order_by(ordem + campo).values_list(campo, flat=True).first()
+
+    def _periodos(self, campo, tipo):
+        periodos = []
+        valor = self._primeiro(campo)
+        while valor is not None:
+            local = timezone.localtime(valor) if isinstance(valor, datetime.datetime) and timezone.is_aware(valor) else valor
+            dia = _inicio_do_periodo(local.date() if isinstance(local, datetime.datetime) else local, tipo)
+            periodos.append(dia)
+            seguinte = _proximo_periodo(dia, tipo)
+            if isinstance(valor, datetime.datetime):
+                seguinte = datetime.datetime.combine(seguinte, datetime.time())
+                if timezone.is_aware(valor):
+                    seguinte = timezone.make_aware(seguinte)
+            valor = self._primeiro(campo, desde=seguinte)
+        return periodos
+
+    def dates(self, field_name, kind, order='ASC'):
+        periodos = self._periodos(field_name, kind)
+        return periodos[::-1] if order == 'DESC' else periodos
+
+    def datetimes(self, field_name, kind, order='ASC', tzinfo=None):
+        fuso = tzinfo or (timezone.get_current_timezone() if settings.USE_TZ else None)
+        periodos = [
+            datetime.datetime.combine(dia, datetime.time(), tzinfo=fuso)
+            for dia in self._periodos(field_name, kind)
+        ]
+        return periodos[::-1] if order == 'DESC' else periodos
+
+    def aggregate(self, *args, **kwargs):
+        # Só MIN/MAX de campos simples: uma leitura na ponta do índice para cada.
+        campos = {nome: _campo_de_min_max(agregado) for nome, agregado in kwargs.items()}
+        if args or not campos or None in campos.values():
+            return super().aggregate(*args, **kwargs)
+        return {
+            nome: self._primeiro(campos[nome], ordem='' if isinstance(agregado, Min) else '-')
+            for nome, agregado in kwargs.items()
+        }
+
+
+def _campo_de_min_max(agregado):
+    if type(agregado) not in (Min, Max) or agregado.filter is not None:
+        return None
+    expressao = agregado.get_source_expressions()[0]
+    return expressao.name if isinstance(expressao, F) else None
+
+
+class TabelaGrandeAdmin(admin.ModelAdmin):
+    """Base do admin das tabelas que crescem com as vendas.
+
+    Busca só por igualdade nos campos indexados de ``busca_exata`` (a busca
+    padrão usa ``LIKE``/``UPPER`` e varre a tabela) e pagina sem contar tudo.
+    """
+
+    paginator = ContagemEstimadaPaginator
+    show_full_result_count = False
+    busca_exata = ('pk',)
+
+    def get_queryset(self, request):
+        queryset = super().get_queryset(request)
+        if not self.date_hierarchy:
+            return queryset
+        return PeriodosIndexadosQuerySet(
+            model=queryset.model, query=queryset.query.chain(), using=queryset._db, hints=queryset._hints,
+        )
+
+    def get_search_fields(self, request):
+        return self.busca_exata
+
+    def get_search_results(self, request, queryset, search_term):
+        termo = search_term.strip()
+        if not termo:
+            return queryset, False
+        condicoes = Q()
+        for nome in self.busca_exata:
+            campo = self.opts.pk if nome == 'pk' else self.opts.get_field(nome)
+            try:
+                valor = getattr(campo, 'target_field', campo).to_python(termo)
+            except ValidationError:
+                continue
+            condicoes |= Q(**{nome: valor})
+        if not condicoes:
+            return queryset.none(), False
+        return queryset.filter(condicoes), False
+
+
+class SomenteLeituraAdmin(TabelaGrandeAdmin):
+    """Vendas, itens e movimentações só para consulta.
+
+    Gravar por aqui pularia ``_gravar_venda``/``_estornar_venda`` e deixaria
+    estoque, margens, resumos de clientes, valor do estoque e o feed do
+    catálogo fora de sincronia; registros e cancelamentos passam pelas telas
+    do sistema.
+    """
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+    def has_delete_permission(self, request, obj=None):
+        return False
+
 
 @admin.register(Loja)
 class LojaAdmin(admin.ModelAdmin):
     list_display = ('nome', 'endereco', 'telefone', 'email')
     search_fields = ('nome', 'endereco')
 
+
+@admin.register(Categoria)
+class CategoriaAdmin(admin.ModelAdmin):
+    search_fields = ('nome',)
+    ordering = ('nome',)
+
+
+@admin.register(Fornecedor)
+class FornecedorAdmin(admin.ModelAdmin):
+    list_display = ('nome', 'cnpj', 'telefone', 'email')
+    search_fields = ('nome', 'cnpj')
+    ordering = ('nome',)
+
+
+@admin.register(Produto)
+class ProdutoAdmin(admin.ModelAdmin):
+    list_display = ('id', 'nome', 'loja', 'categoria', 'fornecedor', 'preco_compra', 'preco_venda')
+    list_select_related = ('loja', 'categoria', 'fornecedor')
+    list_filter = ('loja',)
+    autocomplete_fields = ('loja', 'categoria', 'fornecedor')
+    search_fields = ('^nome',)
+    search_help_text = 'Início do nome do produto.'
+    paginator = ContagemEstimadaPaginator
+    show_full_result_count = False
+    ordering = ('-id',)
+
+
+@admin.register(Cliente)
+class ClienteAdmin(TabelaGrandeAdmin):
+    list_display = ('id', 'nome', 'cpf', 'telefone')
+    busca_exata = ('pk', 'cpf_normalizado', 'telefone_normalizado')
+    search_help_text = 'Código, CPF ou telefone do cliente.'
+    raw_id_fields = ('user',)
+    ordering = ('-id',)
+
+    def get_search_results(self, request, queryset, search_term):
+        # CPF e telefone são guardados só com os dígitos.
+        digitos = somente_digitos(search_term)
+        if search_term.strip() and not digitos:
+            return queryset.none(), False
+        return super().get_search_results(request, queryset, digitos)
+
+
+@admin.register(Venda)
+class VendaAdmin(SomenteLeituraAdmin):
+    list_display = ('id', 'data_venda', 'loja', 'cliente', 'valor_total', 'status')
+    list_select_related = ('loja', 'cliente')
+    list_filter = ('loja',)
+    date_hierarchy = 'data_venda'
+    busca_exata = ('pk', 'cliente')
+    search_help_text = 'Número da venda ou código do cliente.'
+    ordering = ('-id',)
+
+
+@admin.register(ItensVenda)
+class ItensVendaAdmin(SomenteLeituraAdmin):
+    list_display = ('id', 'venda', 'produto', 'quantidade', 'preco_unitario', 'custo_unitario')
+    list_select_related = ('venda', 'produto')
+    busca_exata = ('pk', 'venda', 'produto')
+    search_help_text = 'Número do item, da venda ou código do produto.'
+    ordering = ('-id',)
+
+
+@admin.register(MovimentacaoEstoque)
+class MovimentacaoEstoqueAdmin(SomenteLeituraAdmin):
+    list_display = ('id', 'data', 'produto', 'tipo', 'quantidade', 'descricao')
+    list_select_related = ('produto',)
+    date_hierarchy = 'data'
+    busca_exata = ('pk', 'produto')
+    search_help_text = 'Número da movimentação ou código do produto.'
+    ordering = ('-id',)
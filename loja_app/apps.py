@@ -4,3 +4,7 @@ from django.apps import AppConfig
 class LojaAppConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'loja_app'
+
+    def ready(self):
+        # Registra as tarefas de segundo plano e os receivers de signals do app.
+        from . import autenticacao, catalogo, estoque, margens, referencias, reposicao, valorizacao  # noqa: F401
@@ -0,0 +1,62 @@
+"""
+Aquecimento do processo logo após subir (deploy ou reciclagem de worker).
+
+Sem isso, as primeiras requisições de cada worker pagam a montagem do
+resolver de URLs, a compilação dos templates e as primeiras consultas.
+:func:`aquecer` faz esse trabalho antes de o worker receber tráfego; é chamada
+por ``gestorpro/wsgi.py`` e ``gestorpro/asgi.py`` com ``GESTORPRO_AQUECER=1``
+e pelo comando ``manage.py aquecer``, que também mede o tempo de partida.
+"""
+import time
+from pathlib import Path
+
+from django.apps import apps
+from django.contrib.contenttypes.models import ContentType
+from django.db import connections
+from django.template import engines
+from django.urls import get_resolver
+
+from .models import Categoria, Loja
+
+
+def _urls():
+    # reverse_dict monta (e guarda) as tabelas de resolve/reverse de todos os includes.
+    return len(get_resolver().reverse_dict)
+
+
+def _templates():
+    """Compila todos os templates do app; o loader em cache guarda o resultado."""
+    raiz = Path(apps.get_app_config('loja_app').path) / 'templates'
+    nomes = [arquivo.relative_to(raiz).as_posix() for arquivo in raiz.rglob('*.html')]
+    for engine in engines.all():
+        for nome in nomes:
+            engine.get_template(nome)
+    return len(nomes)
+
+
+def _consultas():
+    """Abre cada banco e executa as consultas que quase toda página repete."""
+    for alias in connections:
+        connections[alias].ensure_connection()
+    total = len(Loja.objects.only('id', 'nome')) + len(Categoria.objects.only('id', 'nome'))
+    ContentType.objects.get_for_models(*apps.get_app_config('loja_app').get_models())
+    # Servidores com --preload fazem fork depois daqui: conexões não podem ser herdadas.
+    connections.close_all()
+    return total
+
+
+ETAPAS = {
+    'urls': _urls,
+    'templates': _templates,
+    'consultas': _consultas,
+}
+
+
+def aquecer(etapas=ETAPAS):
+    """Executa as etapas de aquecimento; devolve ``{etapa: (itens, segundos)}``."""
+    resultado = {}
+    for nome, etapa in etapas.items():
+        inicio = time.perf_counter()
+        itens = etapa()
+        resultado[nome] = (itens, time.perf_counter() - inicio)
+    return resultado
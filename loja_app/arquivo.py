@@ -0,0 +1,108 @@
+"""
+Arquivamento do histórico antigo de vendas e movimentações de estoque.
+
+``arquivar_vendas``/``arquivar_movimentacoes`` movem, em lotes e cada lote na
+própria transação, as linhas anteriores a uma data de corte para as tabelas
+``*Arquivada``. Agregados (``MargemMensal``) e ``Estoque`` não
+são tocados.
+
+Nas consultas, :func:`com_arquivo` só lê as tabelas de arquivo quando o
+período pedido começa antes da última linha arquivada.
+"""
+import heapq
+from operator import attrgetter
+
+from django.db import transaction
+from django.db.models import Max
+from django.utils import timezone
+
+from .models import (
+    ItemVendaArquivado, ItensVenda, MovimentacaoArquivada, MovimentacaoEstoque, Venda, VendaArquivada,
+)
+
+
+CAMPOS_VENDA = ['id', 'cliente_id', 'loja_id', 'data_venda', 'valor_total', 'status']
+CAMPOS_ITEM = ['id', 'venda_id', 'produto_id', 'quantidade', 'preco_unitario', 'custo_unitario']
+CAMPOS_MOVIMENTACAO = ['id', 'produto_id', 'quantidade', 'tipo', 'data', 'descricao']
+
+
+def _copiar(modelo, linhas):
+    return [modelo(**linha) for linha in linhas]
+
+
+def arquivar_vendas(corte, lote=500):
+    """Move vendas (e seus itens) com ``data_venda < corte``; gera o tamanho de cada lote movido."""
+    while True:
+        with transaction.atomic():
+            ids = list(
+                Venda.objects.filter(data_venda__lt=corte)
+                .order_by('id').values_list('id', flat=True)[:lote]
+            )
+            if not ids:
+                return
+            vendas = Venda.objects.filter(id__in=ids)
+            itens = ItensVenda.objects.filter(venda_id__in=ids)
+
+            VendaArquivada.objects.bulk_create(_copiar(VendaArquivada, vendas.values(*CAMPOS_VENDA)))
+            ItemVendaArquivado.objects.bulk_create(
+                _copiar(ItemVendaArquivado, itens.values(*CAMPOS_ITEM)), batch_size=lote,
+            )
+            itens.delete()
+            vendas.delete()
+        yield len(ids)
+
+
+def arquivar_movimentacoes(corte, lote=500):
+    """Move movimentações de estoque com ``data < corte``; gera o tamanho de cada lote movido."""
+    while True:
+        with transaction.atomic():
+            ids = list(
+                MovimentacaoEstoque.objects.filter(data__lt=corte)
+                .order_by('id').values_list('id', flat=True)[:lote]
+            )
+            if not ids:
+                return
+            movimentacoes = MovimentacaoEstoque.objects.filter(id__in=ids)
+            MovimentacaoArquivada.objects.bulk_create(
+                _copiar(MovimentacaoArquivada, movimentacoes.values(*CAMPOS_MOVIMENTACAO)),
+            )
+            movimentacoes.delete()
+        yield len(ids)
+
+
+def intercalar(fontes, chave, decrescente=True):
+    """Junta fontes já ordenadas mantendo a ordem; lê de cada uma só o necessário para a próxima linha."""
+    return heapq.merge(*fontes, key=chave, reverse=decrescente)
+
+
+def alcanca_arquivo(arquivo, campo, desde=None):
+    """Verdadeiro se o período que começa em ``desde`` (data) tem linhas em ``arquivo``.
+
+    Usa só o máximo de ``campo``, que sai do índice sem ler as linhas.
+    """
+    fim = arquivo.order_by().aggregate(fim=Max(campo))['fim']
+    if fim is None:
+        return False
+    return desde is None or timezone.localtime(fim).date() >= desde
+
+
+def com_arquivo(atual, arquivo, campo, desde=None, ate=None, carregar=list):
+    """Linhas de ``atual`` no período, unidas às de ``arquivo`` quando o período alcança o arquivo.
+
+    Os dois querysets devem vir ordenados por ``-campo``;
+    o resultado mantém essa ordem e é tão preguiçoso quanto ``carregar``: com
+    geradores as consultas só rodam quando as linhas são lidas. Sem ``desde`` o período não tem início e
+    alcança todo o arquivo. ``arquivo=None`` consulta só as linhas atuais.
+    ``carregar`` transforma cada queryset filtrado nas linhas (ex.: ``linhas_de``);
+    ``campo`` pode atravessar relacionamentos (``venda__data_venda``), e as
+    linhas são intercaladas pelo atributo com o último trecho do nome.
+    """
+    periodo = {}
+    if desde:
+        periodo[f'{campo}__date__gte'] = desde
+    if ate:
+        periodo[f'{campo}__date__lte'] = ate
+    linhas = carregar(atual.filter(**periodo))
+    if arquivo is not None and alcanca_arquivo(arquivo, campo, desde):
+        return intercalar([linhas, carregar(arquivo.filter(**periodo))], chave=attrgetter(campo.rsplit('__', 1)[-1]))
+    return linhas
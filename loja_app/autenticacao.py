@@ -0,0 +1,96 @@
+"""
+Usuário e perfil de cliente em cache para o caminho de autenticação.
+
+Com ``AUTENTICACAO_EM_CACHE`` ligado, :class:`BackendComCache` busca o
+``User`` da sessão no cache em vez do banco e :func:`cliente_do_usuario`
+faz o mesmo com o ``Cliente`` vinculado. Junto com o backend de sessão
+``cached_db``, uma requisição com sessão já aquecida não consulta o banco
+para autenticar. As entradas são apagadas por signals quando o usuário ou o
+perfil mudam; ``AUTENTICACAO_CACHE_SEGUNDOS`` limita o tempo de vida delas.
+"""
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.contrib.auth.backends import ModelBackend
+from django.core.cache import cache
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.dispatch import receiver
+
+from .models import Cliente
+
+
+# Guardado no lugar do Cliente quando o usuário não tem perfil.
+SEM_PERFIL = 'sem-perfil'
+
+
+def _chave_usuario(user_id):
+    return f'autenticacao:usuario:{user_id}'
+
+
+def _chave_cliente(user_id):
+    return f'autenticacao:cliente:{user_id}'
+
+
+def invalidar_usuario(user_id):
+    """Remove do cache o usuário e o perfil de cliente de ``user_id``."""
+    if user_id is not None:
+        cache.delete_many([_chave_usuario(user_id), _chave_cliente(user_id)])
+
+
+class BackendComCache(ModelBackend):
+    """``ModelBackend`` que lê do cache o usuário de cada requisição autenticada."""
+
+    def get_user(self, user_id):
+        if not settings.AUTENTICACAO_EM_CACHE:
+            return super().get_user(user_id)
+        chave = _chave_usuario(user_id)
+        usuario = cache.get(chave)
+        if usuario is None:
+            usuario = super().get_user(user_id)
+            if usuario is None:
+                return None
+            cache.set(chave, usuario, settings.AUTENTICACAO_CACHE_SEGUNDOS)
+        return usuario if self.user_can_authenticate(usuario) else None
+
+
+def cliente_do_usuario(usuario):
+    """``Cliente`` vinculado a ``usuario``, ou ``None`` se ele não tiver perfil.
+
+    O resultado fica guardado no próprio objeto do usuário até o fim da
+    requisição e, com ``AUTENTICACAO_EM_CACHE``, também no cache.
+    """
+    if not usuario.is_authenticated:
+        return None
+    if hasattr(usuario, '_cliente_em_cache'):
+        return usuario._cliente_em_cache
+
+    cliente = None
+    if settings.AUTENTICACAO_EM_CACHE:
+        cliente = cache.get(_chave_cliente(usuario.pk))
+    if cliente is None:
+        cliente = Cliente.objects.filter(user_id=usuario.pk).first() or SEM_PERFIL
+        if settings.AUTENTICACAO_EM_CACHE:
+            cache.set(_chave_cliente(usuario.pk), cliente, settings.AUTENTICACAO_CACHE_SEGUNDOS)
+
+    usuario._cliente_em_cache = None if cliente == SEM_PERFIL else cliente
+    return usuario._cliente_em_cache
+
+
+@receiver(post_save, sender=get_user_model())
+@receiver(post_delete, sender=get_user_model())
+def invalidar_cache_usuario(sender, instance, **kwargs):
+    invalidar_usuario(instance.pk)
+
+
+@receiver(pre_save, sender=Cliente)
+def guardar_usuario_anterior(sender, instance, **kwargs):
+    instance._user_anterior_id = None
+    if instance.pk:
+        instance._user_anterior_id = Cliente.objects.filter(pk=instance.pk).values_list('user_id', flat=True).first()
+
+
+@receiver(post_save, sender=Cliente)
+@receiver(post_delete, sender=Cliente)
+def invalidar_cache_cliente(sender, instance, **kwargs):
+    # Se o perfil trocou de usuário, o anterior também deixa de tê-lo.
+    for user_id in {instance.user_id, getattr(instance, '_user_anterior_id', None)}:
+        invalidar_usuario(user_id)
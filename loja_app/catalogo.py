@@ -0,0 +1,157 @@
+"""
+Feed de alterações do catálogo por loja.
+
+Inclusões, alterações e exclusões de ``Produto`` e mudanças de quantidade em
+``Estoque`` viram linhas de :class:`AlteracaoCatalogo`. O caixa guarda o
+último ``id`` recebido e pede só o que mudou depois dele.
+"""
+from decimal import Decimal
+
+from django.db.models import Max
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.dispatch import receiver
+
+from .models import AlteracaoCatalogo, Estoque, Loja, Produto
+
+
+CAMPOS_SINCRONIZADOS = {'nome', 'preco_venda', 'loja'}
+LOTE_ALTERACOES = 900
+
+
+def _dados_produto(produto, quantidade):
+    return _dados(produto.nome, produto.preco_venda, quantidade)
+
+
+def _dados(nome, preco_venda, quantidade):
+    return {
+        'nome': nome,
+        'preco_venda': f'{Decimal(preco_venda):.2f}',
+        'quantidade': quantidade or 0,
+    }
+
+
+def _quantidade_em_estoque(produto):
+    try:
+        return produto.estoque.quantidade
+    except Estoque.DoesNotExist:
+        return 0
+
+
+def registrar_alteracoes(produto_ids):
+    """Registra ``UPDATE`` para produtos alterados sem ``save()`` (updates em lote).
+
+    Lê os valores atuais com uma consulta por lote e grava o feed com ``bulk_create``.
+    """
+    produto_ids = list(produto_ids)
+    # Em lotes: inventários lançam dezenas de milhares de produtos de uma vez.
+    for inicio in range(0, len(produto_ids), LOTE_ALTERACOES):
+        produtos = Produto.objects.filter(pk__in=produto_ids[inicio:inicio + LOTE_ALTERACOES]).values_list(
+            'id', 'loja_id', 'nome', 'preco_venda', 'estoque__quantidade',
+        )
+        AlteracaoCatalogo.objects.bulk_create([
+            AlteracaoCatalogo(
+                loja_id=loja_id,
+                produto_id=produto_id,
+                operacao='UPDATE',
+                dados=_dados(nome, preco_venda, quantidade),
+            )
+            for produto_id, loja_id, nome, preco_venda, quantidade in produtos
+        ], batch_size=500)
+
+
+@receiver(pre_save, sender=Produto)
+def guardar_loja_anterior(sender, instance, update_fields=None, **kwargs):
+    instance._loja_anterior_id = None
+    if instance.pk and (update_fields is None or 'loja' in update_fields):
+        instance._loja_anterior_id = (
+            Produto.objects.filter(pk=instance.pk).values_list('loja_id', flat=True).first()
+        )
+
+
+@receiver(post_save, sender=Produto)
+def registrar_alteracao_produto(sender, instance, created, update_fields=None, **kwargs):
+    if update_fields is not None and not CAMPOS_SINCRONIZADOS.intersection(update_fields):
+        return
+
+    loja_anterior_id = getattr(instance, '_loja_anterior_id', None)
+    dados = _dados_produto(instance, _quantidade_em_estoque(instance))
+
+    if not created and loja_anterior_id and loja_anterior_id != instance.loja_id:
+        # Produto mudou de loja: some de uma e aparece na outra.
+        AlteracaoCatalogo.objects.create(loja_id=loja_anterior_id, produto_id=instance.pk, operacao='DELETE')
+        created = True
+
+    AlteracaoCatalogo.objects.create(
+        loja_id=instance.loja_id,
+        produto_id=instance.pk,
+        operacao='INSERT' if created else 'UPDATE',
+        dados=dados,
+    )
+
+
+@receiver(post_delete, sender=Produto)
+def registrar_exclusao_produto(sender, instance, origin=None, **kwargs):
+    # Excluir a loja apaga o feed dela junto; não há para quem avisar.
+    if isinstance(origin, Loja):
+        return
+    AlteracaoCatalogo.objects.create(loja_id=instance.loja_id, produto_id=instance.pk, operacao='DELETE')
+
+
+@receiver(post_save, sender=Estoque)
+def registrar_alteracao_estoque(sender, instance, created, update_fields=None, **kwargs):
+    # O estoque inicial já vai junto com o INSERT do produto.
+    if created or (update_fields is not None and 'quantidade' not in update_fields):
+        return
+    produto = instance.produto
+    AlteracaoCatalogo.objects.create(
+        loja_id=produto.loja_id,
+        produto_id=produto.pk,
+        operacao='UPDATE',
+        dados=_dados_produto(produto, instance.quantidade),
+    )
+
+
+def cursor_atual(loja_id):
+    return AlteracaoCatalogo.objects.filter(loja_id=loja_id).aggregate(cursor=Max('id'))['cursor'] or 0
+
+
+def snapshot_catalogo(loja_id):
+    """Catálogo completo da loja, usado na primeira sincronização."""
+    produtos = Produto.objects.filter(loja_id=loja_id).values_list(
+        'id', 'nome', 'preco_venda', 'estoque__quantidade',
+    ).order_by('id')
+    return [
+        {
+            'produto_id': produto_id,
+            'operacao': 'INSERT',
+            'dados': _dados(nome, preco_venda, quantidade),
+        }
+        for produto_id, nome, preco_venda, quantidade in produtos
+    ]
+
+
+def alteracoes_desde(loja_id, cursor, limite=500):
+    """Alterações da loja após ``cursor``, compactadas para a última de cada produto.
+
+    Retorna ``(alteracoes, novo_cursor, mais)``; ``mais`` indica que há outra página.
+    ``limite`` abaixo de 1 vale 1: com zero a página viria vazia e sem ``mais``.
+    """
+    limite = max(1, limite)
+    linhas = list(
+        AlteracaoCatalogo.objects.filter(loja_id=loja_id, id__gt=cursor)
+        .order_by('id')
+        .values_list('id', 'produto_id', 'operacao', 'dados')[:limite + 1]
+    )
+    mais = len(linhas) > limite
+    linhas = linhas[:limite]
+    if not linhas:
+        return [], cursor, False
+
+    ultimas = {}
+    for _id, produto_id, operacao, dados in linhas:
+        anterior = ultimas.pop(produto_id, None)
+        # Inclusão seguida de alteração continua sendo inclusão para quem sincroniza.
+        if anterior and anterior['operacao'] == 'INSERT' and operacao == 'UPDATE':
+            operacao = 'INSERT'
+        ultimas[produto_id] = {'produto_id': produto_id, 'operacao': operacao, 'dados': dados}
+    return list(ultimas.values()), linhas[-1][0], mais
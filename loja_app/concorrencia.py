@@ -0,0 +1,47 @@
+"""
+Retentativa de transações que falham por disputa de travas no banco.
+
+No SQLite uma transação que começou lendo e depois precisa gravar recebe
+"database is locked" na hora se outra já estiver gravando; no PostgreSQL o
+equivalente são deadlocks e falhas de serialização. Nos dois casos a
+transação inteira foi desfeita e pode ser repetida do início.
+"""
+import random
+import re
+import time
+
+from django.conf import settings
+from django.db import OperationalError, connections
+
+from . import metricas
+
+
+TRAVAMENTO = re.compile(r'database is locked|deadlock|could not serialize|lock wait timeout', re.IGNORECASE)
+
+
+def erro_de_travamento(exc):
+    return isinstance(exc, OperationalError) and bool(TRAVAMENTO.search(str(exc)))
+
+
+def com_retentativas(funcao, tentativas=None, espera=0.02, operacao='outra'):
+    """Executa ``funcao`` (que abre a própria transação) repetindo em erro de trava.
+
+    Entre as tentativas espera ``espera`` segundos, dobrando a cada vez e com
+    variação aleatória para que os concorrentes não voltem juntos. Dentro de
+    uma transação externa não há o que repetir: a função roda uma vez só.
+    Repetições e desistências entram nas métricas com o rótulo ``operacao``.
+    """
+    tentativas = tentativas or settings.RETENTATIVAS_TRAVAMENTO
+    if any(conexao.in_atomic_block for conexao in connections.all(initialized_only=True)):
+        tentativas = 1
+    for tentativa in range(1, tentativas + 1):
+        try:
+            return funcao()
+        except OperationalError as exc:
+            if not erro_de_travamento(exc):
+                raise
+            if tentativa == tentativas:
+                metricas.incrementar(metricas.TRAVAMENTOS_ESGOTADOS, operacao=operacao)
+                raise
+            metricas.incrementar(metricas.RETENTATIVAS, operacao=operacao)
+            time.sleep(espera * 2 ** (tentativa - 1) * random.uniform(0.5, 1.5))
@@ -0,0 +1,253 @@
+"""
+Registro de consultas lentas com a linha do código que as emitiu.
+
+Um ``execute_wrapper`` instalado em todas as conexões durante cada requisição
+(e cada tarefa em segundo plano) mede os comandos SQL; os que passam de
+``CONSULTAS_LENTAS_MS`` entram num buffer circular de
+``CONSULTAS_LENTAS_MAXIMO`` registros com a duração, o formato dos parâmetros
+(tipos, nunca os valores), a view e o primeiro quadro da pilha que é código
+do projeto. Com ``CONSULTAS_LENTAS_ARQUIVO`` os registros também são anexados
+a esse arquivo (uma linha JSON cada), e a página de diagnóstico passa a ler
+dele: assim mostra o que todos os workers viram e sobrevive a reinícios.
+"""
+import hashlib
+import json
+import linecache
+import logging
+import os
+import re
+import sys
+import threading
+import time
+from collections import deque
+from contextlib import ExitStack, contextmanager
+from pathlib import Path
+
+from django.conf import settings
+from django.db import connections
+from django.utils import timezone
+
+
+logger = logging.getLogger(__name__)
+
+# Acima disto o arquivo é renomeado para ``.1`` e recomeça (fica só uma geração antiga).
+ARQUIVO_MAXIMO_BYTES = 5 * 1024 * 1024
+
+_LITERAL_TEXTO = re.compile(r"'(?:[^']|'')*'")
+_NUMERO = re.compile(r'\b\d+(?:\.\d+)?\b')
+_MARCADOR = re.compile(r'%s|\?')
+_LISTA = re.compile(r'\(\s*\?(?:\s*,\s*\?)*\s*\)')
+_LINHAS_VALUES = re.compile(r'\(\.\.\.\)(?:\s*,\s*\(\.\.\.\))+')
+_ESPACOS = re.compile(r'\s+')
+
+
+def normalizar(sql):
+    """SQL sem os valores: literais e marcadores viram ``?`` e listas viram ``(...)``.
+
+    ``IN`` com 3 ou 900 ids e ``INSERT`` com 1 ou 1000 linhas têm a mesma forma.
+    """
+    sql = _LITERAL_TEXTO.sub('?', sql)
+    sql = _NUMERO.sub('?', sql)
+    sql = _MARCADOR.sub('?', sql)
+    sql = _LISTA.sub('(...)', sql)
+    sql = _LINHAS_VALUES.sub('(...)', sql)
+    return _ESPACOS.sub(' ', sql).strip()
+
+
+def impressao_digital(sql_normalizado):
+    return hashlib.sha1(sql_normalizado.encode('utf-8')).hexdigest()[:12]
+
+
+def _tipos(valores):
+    """``int×3, str`` para uma sequência de parâmetros; repetições seguidas são agrupadas."""
+    grupos = []
+    for valor in valores:
+        tipo = 'None' if valor is None else type(valor).__name__
+        if grupos and grupos[-1][0] == tipo:
+            grupos[-1][1] += 1
+        else:
+            grupos.append([tipo, 1])
+    return ', '.join(tipo if quantidade == 1 else f'{tipo}×{quantidade}' for tipo, quantidade in grupos)
+
+
+def formato_parametros(params, many):
+    if params is None:
+        return ''
+    if many:
+        params = list(params)
+        return f'{len(params)} linhas de ({_tipos(params[0]) if params else ""})'
+    if isinstance(params, dict):
+        return ', '.join(f'{chave}: {_tipos([valor])}' for chave, valor in params.items())
+    return _tipos(params)
+
+
+_RAIZ = str(Path(settings.BASE_DIR).resolve()) + os.sep
+_IGNORADOS = (os.sep + 'site-packages' + os.sep, os.sep + 'dist-packages' + os.sep, __file__)
+
+
+def quadro_da_aplicacao():
+    """``(arquivo:linha em função, código)`` do quadro mais interno que é código do projeto.
+
+    A busca começa fora da cadeia de ``execute_wrapper`` (o medidor das
+    métricas também é código do projeto, mas não foi ele que consultou).
+    """
+    quadro = sys._getframe(1)
+    inicio = quadro
+    while inicio is not None and inicio.f_code.co_name != '_execute_with_wrappers':
+        inicio = inicio.f_back
+    quadro = inicio or quadro
+    while quadro is not None:
+        arquivo = quadro.f_code.co_filename
+        if arquivo.startswith(_RAIZ) and not any(trecho in arquivo for trecho in _IGNORADOS):
+            linha = quadro.f_lineno
+            return (
+                f'{arquivo[len(_RAIZ):]}:{linha} em {quadro.f_code.co_name}',
+                linecache.getline(arquivo, linha).strip(),
+            )
+        quadro = quadro.f_back
+    return '', ''
+
+
+class BufferConsultasLentas:
+    """Buffer circular (por processo) dos registros, com cópia opcional em arquivo."""
+
+    def __init__(self, maximo):
+        self._registros = deque(maxlen=maximo)
+        self._trava = threading.Lock()
+
+    def adicionar(self, registro):
+        with self._trava:
+            self._registros.append(registro)
+        arquivo = settings.CONSULTAS_LENTAS_ARQUIVO
+        if arquivo:
+            try:
+                _anexar(Path(arquivo), json.dumps(registro, ensure_ascii=False))
+            except OSError:
+                logger.exception('Não foi possível gravar a consulta lenta em %s.', arquivo)
+
+    def registros(self):
+        """Os registros mais recentes (do arquivo, se configurado), do mais antigo ao mais novo."""
+        arquivo = settings.CONSULTAS_LENTAS_ARQUIVO
+        if not arquivo:
+            with self._trava:
+                return list(self._registros)
+        registros = deque(maxlen=settings.CONSULTAS_LENTAS_MAXIMO)
+        try:
+            with open(arquivo, encoding='utf-8') as linhas:
+                for linha in linhas:
+                    try:
+                        registros.append(json.loads(linha))
+                    except ValueError:
+                        continue  # linha cortada por uma gravação concorrente
+        except FileNotFoundError:
+            pass
+        return list(registros)
+
+    def limpar(self):
+        with self._trava:
+            self._registros.clear()
+        arquivo = settings.CONSULTAS_LENTAS_ARQUIVO
+        if arquivo:
+            Path(arquivo).unlink(missing_ok=True)
+
+
+def _anexar(arquivo, linha):
+    arquivo.parent.mkdir(parents=True, exist_ok=True)
+    try:
+        if arquivo.stat().st_size > ARQUIVO_MAXIMO_BYTES:
+            os.replace(arquivo, arquivo.with_name(arquivo.name + '.1'))
+    except FileNotFoundError:
+        pass
+    # Uma única escrita em modo append: linhas de workers diferentes não se misturam.
+    with open(arquivo, 'a', encoding='utf-8') as saida:
+        saida.write(linha + '\n')
+
+
+buffer = BufferConsultasLentas(settings.CONSULTAS_LENTAS_MAXIMO)
+
+
+def consultas_registradas():
+    return buffer.registros()
+
+
+def limpar_registro():
+    buffer.limpar()
+
+
+class _MedidorLentas:
+    def __init__(self, alias, origem):
+        self.alias = alias
+        self.origem = origem
+
+    def __call__(self, execute, sql, params, many, context):
+        inicio = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            duracao_ms = (time.perf_counter() - inicio) * 1000
+            if duracao_ms >= settings.CONSULTAS_LENTAS_MS:
+                self._registrar(sql, params, many, duracao_ms)
+
+    def _registrar(self, sql, params, many, duracao_ms):
+        normalizado = normalizar(sql)
+        local, codigo = quadro_da_aplicacao()
+        buffer.adicionar({
+            'quando': timezone.now().isoformat(),
+            'duracao_ms': round(duracao_ms, 2),
+            'banco': self.alias,
+            'origem': self.origem() if callable(self.origem) else self.origem,
+            'local': local,
+            'codigo': codigo,
+            'sql': sql[:2000],
+            'normalizado': normalizado,
+            'impressao': impressao_digital(normalizado),
+            'parametros': formato_parametros(params, many)[:500],
+        })
+
+
+@contextmanager
+def medir_consultas_lentas(origem):
+    """Registra as consultas lentas feitas no bloco, em todas as conexões.
+
+    ``origem`` (texto ou função chamada só quando há registro) identifica quem
+    consultou: o nome da view ou da tarefa. Com ``CONSULTAS_LENTAS_MS = 0`` não
+    instala nada.
+    """
+    if settings.CONSULTAS_LENTAS_MS <= 0:
+        yield
+        return
+    with ExitStack() as pilha:
+        for conexao in connections.all():
+            pilha.enter_context(conexao.execute_wrapper(_MedidorLentas(conexao.alias, origem)))
+        yield
+
+
+def agrupar_por_impressao(registros):
+    """Registros agrupados pela impressão digital do SQL, do maior tempo total para o menor."""
+    grupos = {}
+    for registro in registros:
+        grupo = grupos.get(registro['impressao'])
+        if grupo is None:
+            grupo = grupos[registro['impressao']] = {
+                'impressao': registro['impressao'],
+                'normalizado': registro['normalizado'],
+                'quantidade': 0,
+                'total_ms': 0.0,
+                'maximo_ms': 0.0,
+                'origens': {},
+                'locais': {},
+            }
+        grupo['quantidade'] += 1
+        grupo['total_ms'] += registro['duracao_ms']
+        if registro['duracao_ms'] >= grupo['maximo_ms']:
+            grupo['maximo_ms'] = registro['duracao_ms']
+            grupo['mais_lenta'] = registro
+        grupo['ultima'] = registro['quando']
+        grupo['origens'][registro['origem']] = grupo['origens'].get(registro['origem'], 0) + 1
+        grupo['locais'][registro['local']] = grupo['locais'].get(registro['local'], 0) + 1
+
+    for grupo in grupos.values():
+        grupo['media_ms'] = grupo['total_ms'] / grupo['quantidade']
+        grupo['origens'] = sorted(grupo['origens'].items(), key=lambda par: -par[1])
+        grupo['locais'] = sorted(grupo['locais'].items(), key=lambda par: -par[1])
+    return sorted(grupos.values(), key=lambda grupo: -grupo['total_ms'])
@@ -0,0 +1,200 @@
+"""
+Cubo de vendas em memória para análises ad hoc.
+
+Os itens de venda concluídos ficam em colunas ``array`` compactas (produto,
+loja, instante, hora/dia locais, quantidade e preço em centavos). Consultas de
+agrupamento e filtro percorrem as colunas com iteradores em C (``compress``,
+``map``) em vez de abrir um ``GROUP BY`` novo no banco a cada pergunta.
+
+A atualização é incremental pelo maior ``id`` já carregado. Itens antigos que
+somem (cancelamento, arquivamento) só são percebidos pela contagem abaixo da
+marca, feita no máximo a cada ``CUBO_VERIFICACAO_SEGUNDOS`` ou logo após um
+cancelamento neste processo; cancelamentos em outros workers podem aparecer no
+cubo até a próxima verificação. A carga completa inclui os itens arquivados
+(``ItemVendaArquivado``), então os períodos movidos pelo ``arquivar_historico``
+continuam nos agrupamentos.
+"""
+import operator
+import threading
+import time
+from array import array
+from collections import defaultdict
+from datetime import date
+from itertools import compress, repeat
+
+from django.conf import settings
+from django.utils import timezone
+
+from .models import ItemVendaArquivado, ItensVenda
+
+
+DIMENSOES = ('produto', 'loja', 'hora', 'dia')
+
+# Tipos das colunas: 'q' = inteiro de 8 bytes, 'l' = 4+ bytes, 'B' = 1 byte.
+COLUNAS = {
+    'produto': 'q',
+    'loja': 'q',
+    'instante': 'q',
+    'hora': 'B',
+    'dia': 'l',
+    'quantidade': 'l',
+    'preco_centavos': 'q',
+}
+
+
+def _carregar(modelo, depois_de=0):
+    """Linhas de ``modelo`` com ``id > depois_de`` convertidas para as colunas.
+
+    Retorna ``(colunas, marca, lidas)``: ``lidas`` conta também os itens de vendas não
+    concluídas, para somar na contagem abaixo da marca sem outro ``COUNT(*)``.
+    """
+    linhas = (
+        modelo.objects
+        .filter(id__gt=depois_de)
+        .order_by('id')
+        .values_list(
+            'id', 'produto_id', 'venda__loja_id', 'venda__data_venda', 'venda__status', 'quantidade',
+            'preco_unitario',
+        )
+    )
+    colunas = {nome: array(tipo) for nome, tipo in COLUNAS.items()}
+    marca = depois_de
+    lidas = 0
+    fuso = timezone.get_current_timezone()
+    for item_id, produto_id, loja_id, data_venda, status, quantidade, preco in linhas.iterator(chunk_size=5000):
+        marca = item_id
+        lidas += 1
+        if status != 'CONCLUIDA':
+            continue
+        local = data_venda.astimezone(fuso)
+        colunas['produto'].append(produto_id)
+        colunas['loja'].append(loja_id)
+        colunas['instante'].append(int(data_venda.timestamp()))
+        colunas['hora'].append(local.hour)
+        colunas['dia'].append(local.date().toordinal())
+        colunas['quantidade'].append(quantidade)
+        colunas['preco_centavos'].append(int(preco * 100))
+    return colunas, marca, lidas
+
+
+def _contar(ate_id):
+    # Só a chave primária: a contagem sai do índice, sem JOIN com a venda.
+    return ItensVenda.objects.filter(id__lte=ate_id).count()
+
+
+class CuboVendas:
+    """Colunas de ``ItensVenda`` (e dos itens arquivados) com agrupamentos feitos em memória."""
+
+    def __init__(self, verificar_a_cada=None):
+        if verificar_a_cada is None:
+            verificar_a_cada = settings.CUBO_VERIFICACAO_SEGUNDOS
+        self.verificar_a_cada = verificar_a_cada
+        self._trava = threading.Lock()
+        self._limpar()
+
+    def _limpar(self):
+        self.colunas = {nome: array(tipo) for nome, tipo in COLUNAS.items()}
+        self.marca = 0
+        self.contagem = 0
+        self._arquivo_carregado = False
+        self._proxima_verificacao = 0.0
+
+    def __len__(self):
+        return len(self.colunas['produto'])
+
+    def bytes_em_memoria(self):
+        return sum(coluna.itemsize * len(coluna) for coluna in self.colunas.values())
+
+    def invalidar(self):
+        """Antecipa a verificação de itens excluídos para a próxima ``atualizar``."""
+        self._proxima_verificacao = 0.0
+
+    def _estender(self, colunas):
+        for nome, coluna in colunas.items():
+            self.colunas[nome].extend(coluna)
+        return len(colunas['produto'])
+
+    def atualizar(self):
+        """Carrega os itens novos; retorna quantas linhas entraram."""
+        with self._trava:
+            # Itens abaixo da marca que sumiram (ou apareceram depois, por uma
+            # transação mais lenta) invalidam o cubo inteiro. A contagem percorre
+            # o índice todo, então roda só de tempos em tempos.
+            agora = time.monotonic()
+            if self.marca and agora >= self._proxima_verificacao:
+                self._proxima_verificacao = agora + self.verificar_a_cada
+                if _contar(self.marca) != self.contagem:
+                    self._limpar()
+
+            entraram = 0
+            if not self._arquivo_carregado:
+                arquivadas, _, _ = _carregar(ItemVendaArquivado)
+                entraram += self._estender(arquivadas)
+                self._arquivo_carregado = True
+                self._proxima_verificacao = agora + self.verificar_a_cada
+
+            colunas, self.marca, lidas = _carregar(ItensVenda, self.marca)
+            self.contagem += lidas
+            return entraram + self._estender(colunas)
+
+    def _mascara(self, loja=None, produto=None, desde=None, ate=None):
+        """Seletor (iterável de booleanos) das linhas que passam nos filtros, ou ``None`` para todas."""
+        filtros = []
+        if loja is not None:
+            filtros.append(map(operator.eq, self.colunas['loja'], repeat(int(loja))))
+        if produto is not None:
+            filtros.append(map(operator.eq, self.colunas['produto'], repeat(int(produto))))
+        if desde is not None:
+            filtros.append(map(operator.ge, self.colunas['dia'], repeat(desde.toordinal())))
+        if ate is not None:
+            filtros.append(map(operator.le, self.colunas['dia'], repeat(ate.toordinal())))
+        if not filtros:
+            return None
+        return [all(valores) for valores in zip(*filtros)]
+
+    def agrupar(self, por='produto', loja=None, produto=None, desde=None, ate=None):
+        """Quantidade e receita (centavos) por ``produto``, ``loja``, ``hora`` ou ``dia``.
+
+        Retorna ``{chave: (quantidade, receita_centavos)}``; para ``dia`` a chave é a data.
+        """
+        if por not in DIMENSOES:
+            raise ValueError(f'Agrupamento desconhecido: "{por}".')
+        with self._trava:
+            chaves = self.colunas[por]
+            quantidades = self.colunas['quantidade']
+            receitas = map(operator.mul, quantidades, self.colunas['preco_centavos'])
+            mascara = self._mascara(loja, produto, desde, ate)
+            if mascara is not None:
+                chaves = compress(chaves, mascara)
+                quantidades = compress(quantidades, mascara)
+                receitas = compress(receitas, mascara)
+
+            totais = defaultdict(lambda: [0, 0])
+            for chave, quantidade, receita in zip(chaves, quantidades, receitas):
+                total = totais[chave]
+                total[0] += quantidade
+                total[1] += receita
+
+        if por == 'dia':
+            return {date.fromordinal(dia): tuple(total) for dia, total in totais.items()}
+        return {chave: tuple(total) for chave, total in totais.items()}
+
+
+_cubo = None
+_cubo_trava = threading.Lock()
+
+
+def cubo_vendas():
+    """Cubo do processo, atualizado a cada chamada (só busca os itens novos)."""
+    global _cubo
+    with _cubo_trava:
+        if _cubo is None:
+            _cubo = CuboVendas()
+    _cubo.atualizar()
+    return _cubo
+
+
+def invalidar_cubo():
+    """Faz o cubo deste processo conferir exclusões na próxima consulta (ex.: após um cancelamento)."""
+    if _cubo is not None:
+        _cubo.invalidar()
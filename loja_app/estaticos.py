@@ -0,0 +1,126 @@
+"""
+Arquivos estáticos com hash no nome, pré-comprimidos e com cache longo.
+
+``collectstatic`` com :class:`ArmazenamentoComprimido` grava em ``STATIC_ROOT``
+cada arquivo com o hash do conteúdo no nome e, para os tipos textuais, as
+versões ``.gz`` e ``.br`` (esta só com o pacote opcional ``brotli``).
+:func:`servir_estatico` entrega a melhor versão aceita pelo navegador com
+``Cache-Control`` de um ano para os nomes com hash; em produção o mesmo pode
+ser feito pelo servidor web (``gzip_static``/``brotli_static`` no nginx).
+"""
+import gzip
+import mimetypes
+import os
+
+from django.conf import settings
+from django.contrib.staticfiles.storage import ManifestStaticFilesStorage, staticfiles_storage
+from django.core.exceptions import SuspiciousFileOperation
+from django.http import FileResponse, Http404
+from django.utils._os import safe_join
+from django.views.decorators.http import require_safe
+
+try:
+    import brotli
+except ImportError:  # pragma: no cover - dependência opcional
+    brotli = None
+
+
+EXTENSOES_COMPRIMIVEIS = ('.css', '.js', '.svg', '.html', '.txt', '.json', '.map', '.xml')
+
+# Nome com hash muda sempre que o conteúdo muda: pode ficar em cache por um ano.
+CACHE_IMUTAVEL = 'public, max-age=31536000, immutable'
+CACHE_CURTO = 'public, max-age=300'
+
+
+def comprimir(dados):
+    """Versões comprimidas de ``dados``: ``{'gzip': bytes, 'br': bytes}`` (br só com ``brotli``)."""
+    versoes = {'gzip': gzip.compress(dados, compresslevel=9, mtime=0)}
+    if brotli is not None:
+        versoes['br'] = brotli.compress(dados, quality=11)
+    return versoes
+
+
+SUFIXOS = {'gzip': '.gz', 'br': '.br'}
+
+
+class ArmazenamentoComprimido(ManifestStaticFilesStorage):
+    """``ManifestStaticFilesStorage`` que também grava ``.gz``/``.br`` de cada arquivo com hash."""
+
+    manifest_strict = False
+
+    def post_process(self, paths, dry_run=False, **options):
+        yield from super().post_process(paths, dry_run=dry_run, **options)
+        if dry_run:
+            return
+        for nome in set(self.hashed_files.values()):
+            if not nome.endswith(EXTENSOES_COMPRIMIVEIS):
+                continue
+            with self.open(nome) as arquivo:
+                dados = arquivo.read()
+            for codificacao, comprimido in comprimir(dados).items():
+                # Não vale a pena servir a versão comprimida se ela não for menor.
+                if len(comprimido) < len(dados):
+                    with open(self.path(nome) + SUFIXOS[codificacao], 'wb') as destino:
+                        destino.write(comprimido)
+
+    def stored_name(self, name):
+        try:
+            return super().stored_name(name)
+        except ValueError:
+            # Antes do collectstatic (desenvolvimento, testes) usa o nome original.
+            return name
+
+
+def _pesos_aceitos(cabecalho):
+    """``Accept-Encoding`` como ``{codificacao: q}``; ``q`` inválido conta como 0 (recusada)."""
+    pesos = {}
+    for parte in cabecalho.split(','):
+        nome, *parametros = (pedaco.strip() for pedaco in parte.split(';'))
+        if not nome:
+            continue
+        q = 1.0
+        for parametro in parametros:
+            chave, _, valor = parametro.partition('=')
+            if chave.strip().lower() == 'q':
+                try:
+                    q = float(valor)
+                except ValueError:
+                    q = 0.0
+        pesos[nome.lower()] = q
+    return pesos
+
+
+def _codificacoes_aceitas(request):
+    """Codificações que temos (``br``, ``gzip``) aceitas pelo cliente, da maior ``q`` para a menor."""
+    pesos = _pesos_aceitos(request.headers.get('Accept-Encoding', ''))
+    curinga = pesos.get('*', 0.0)
+    aceitas = [(pesos.get(codificacao, curinga), codificacao) for codificacao in ('br', 'gzip')]
+    # Empate no q: br antes de gzip (sorted é estável).
+    ordem = sorted((item for item in aceitas if item[0] > 0), key=lambda item: -item[0])
+    return [codificacao for _, codificacao in ordem]
+
+
+@require_safe
+def servir_estatico(request, caminho):
+    try:
+        completo = safe_join(settings.STATIC_ROOT, caminho)
+    except SuspiciousFileOperation:
+        # Caminho que sai de STATIC_ROOT ("../settings.py").
+        raise Http404('Arquivo não encontrado.')
+    if not os.path.isfile(completo):
+        raise Http404('Arquivo não encontrado.')
+
+    tipo, _ = mimetypes.guess_type(completo)
+    arquivo, codificacao = completo, None
+    for aceita in _codificacoes_aceitas(request):
+        if os.path.isfile(completo + SUFIXOS[aceita]):
+            arquivo, codificacao = completo + SUFIXOS[aceita], aceita
+            break
+
+    response = FileResponse(open(arquivo, 'rb'), content_type=tipo or 'application/octet-stream')
+    if codificacao:
+        response.headers['Content-Encoding'] = codificacao
+    response.headers['Vary'] = 'Accept-Encoding'
+    hashed = getattr(staticfiles_storage, 'hashed_files', {})
+    response.headers['Cache-Control'] = CACHE_IMUTAVEL if caminho in hashed.values() else CACHE_CURTO
+    return response
@@ -0,0 +1,259 @@
+"""
+Lançamentos de estoque em lote: recebimento de mercadorias e inventário.
+
+Em vez de um ``save()`` por produto, as quantidades de um documento inteiro
+entram com poucos ``UPDATE`` (``quantidade = quantidade + n`` para todos os
+produtos que somam ``n``) e as movimentações com um ``bulk_create``, tudo
+numa transação.
+"""
+import csv
+import io
+from collections import Counter, defaultdict
+from decimal import Decimal, InvalidOperation
+
+from django.db import transaction
+from django.db.models import F, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from .catalogo import registrar_alteracoes
+from .metricas import contar_movimentacoes
+from .models import Estoque, Inventario, ItemInventario, ItemRecebimento, MovimentacaoEstoque, Produto
+from .tarefas import tarefa
+from .valorizacao import movimentar, reavaliar_precos
+
+
+# Produtos por comando (cada um ocupa um parâmetro do IN).
+LOTE = 900
+
+
+def _em_lotes(valores, tamanho=LOTE):
+    valores = list(valores)
+    for inicio in range(0, len(valores), tamanho):
+        yield valores[inicio:inicio + tamanho]
+
+
+def somar_ao_estoque(quantidades):
+    """Soma ``{produto_id: quantidade}`` (positiva ou negativa) ao estoque.
+
+    Os produtos são agrupados pela quantidade somada: um ``UPDATE ... WHERE
+    produto_id IN (...)`` por valor distinto (e lote). Recebimentos e ajustes de
+    inventário repetem poucas quantidades, então são poucos comandos mesmo com
+    dezenas de milhares de produtos.
+    """
+    por_quantidade = defaultdict(list)
+    for produto_id, quantidade in quantidades.items():
+        if quantidade:
+            por_quantidade[quantidade].append(produto_id)
+    for quantidade, produto_ids in por_quantidade.items():
+        for lote in _em_lotes(produto_ids):
+            atualizados = Estoque.objects.filter(produto_id__in=lote).update(quantidade=F('quantidade') + quantidade)
+            if atualizados < len(lote):
+                # Produtos criados em lote (sem o sinal que cria o estoque) ainda não têm linha.
+                existentes = set(Estoque.objects.filter(produto_id__in=lote).values_list('produto_id', flat=True))
+                Estoque.objects.bulk_create([
+                    Estoque(produto_id=produto_id, quantidade=quantidade)
+                    for produto_id in lote if produto_id not in existentes
+                ])
+    movimentar(quantidades)
+
+
+def atualizar_precos_compra(precos):
+    """Grava ``{produto_id: preco_compra}``, um ``UPDATE`` por preço distinto (e lote), e reavalia o estoque."""
+    por_preco = defaultdict(list)
+    for produto_id, preco in precos.items():
+        por_preco[preco].append(produto_id)
+    for preco, produto_ids in por_preco.items():
+        for lote in _em_lotes(produto_ids):
+            produtos = Produto.objects.filter(pk__in=lote)
+            reavaliar_precos(produtos, preco)
+            produtos.update(preco_compra=preco)
+
+
+def produtos_inexistentes(loja_id, produto_ids):
+    """Ids de ``produto_ids`` que não são produtos da loja."""
+    encontrados = set()
+    for lote in _em_lotes(set(produto_ids)):
+        encontrados.update(Produto.objects.filter(loja_id=loja_id, pk__in=lote).values_list('pk', flat=True))
+    return sorted(set(produto_ids) - encontrados)
+
+
+def ler_csv(arquivo, obrigatorias, opcionais=()):
+    """Linhas ``(numero, {coluna: texto})`` de um CSV enviado, com cabeçalho.
+
+    Aceita vírgula, ponto e vírgula ou tabulação como separador; levanta
+    ``ValueError`` se faltar alguma coluna obrigatória.
+    """
+    try:
+        texto = arquivo.read().decode('utf-8-sig')
+    except UnicodeDecodeError as exc:
+        raise ValueError('O arquivo precisa estar em UTF-8.') from exc
+    try:
+        dialeto = csv.Sniffer().sniff(texto.split('\n', 1)[0], delimiters=',;\t')
+    except csv.Error:
+        dialeto = csv.excel
+    leitor = csv.reader(io.StringIO(texto), dialeto)
+    cabecalho = [coluna.strip().lower() for coluna in next(leitor, [])]
+    faltando = [coluna for coluna in obrigatorias if coluna not in cabecalho]
+    if faltando:
+        raise ValueError(f"Colunas obrigatórias ausentes no CSV: {', '.join(faltando)}.")
+    colunas = [(coluna, cabecalho.index(coluna)) for coluna in (*obrigatorias, *opcionais) if coluna in cabecalho]
+    for numero, campos in enumerate(leitor, start=2):
+        if not any(campo.strip() for campo in campos):
+            continue
+        yield numero, {
+            coluna: campos[indice].strip() if indice < len(campos) else ''
+            for coluna, indice in colunas
+        }
+
+
+def inteiro(texto, numero, coluna):
+    try:
+        return int(texto)
+    except ValueError:
+        raise ValueError(f'Linha {numero}: "{coluna}" deve ser um número inteiro.') from None
+
+
+def decimal(texto, numero, coluna):
+    try:
+        valor = Decimal(texto.replace(',', '.'))
+    except InvalidOperation:
+        raise ValueError(f'Linha {numero}: "{coluna}" deve ser um valor numérico.') from None
+    if not valor.is_finite() or valor < 0:
+        raise ValueError(f'Linha {numero}: "{coluna}" deve ser um valor positivo.')
+    return valor.quantize(Decimal('0.01'))
+
+
+def linhas_recebimento_csv(arquivo):
+    """``[(produto_id, quantidade, preco_compra ou None)]`` da nota de entrega em CSV."""
+    linhas = []
+    for numero, campos in ler_csv(arquivo, ('produto', 'quantidade'), ('preco_compra',)):
+        quantidade = inteiro(campos['quantidade'], numero, 'quantidade')
+        if quantidade < 1:
+            raise ValueError(f'Linha {numero}: a quantidade deve ser maior que zero.')
+        preco = campos.get('preco_compra')
+        linhas.append((
+            inteiro(campos['produto'], numero, 'produto'),
+            quantidade,
+            decimal(preco, numero, 'preco_compra') if preco else None,
+        ))
+    return linhas
+
+
+def lancar_recebimento(recebimento, linhas):
+    """Grava ``recebimento`` com as ``linhas`` ``(produto_id, quantidade, preco_compra)`` numa transação.
+
+    Soma as quantidades ao estoque, lança uma ``ENTRADA`` por linha e, nas
+    linhas com preço, atualiza o ``preco_compra`` do produto.
+    """
+    quantidades = Counter()
+    precos = {}
+    for produto_id, quantidade, preco_compra in linhas:
+        quantidades[produto_id] += quantidade
+        if preco_compra is not None:
+            precos[produto_id] = preco_compra
+
+    with transaction.atomic():
+        recebimento.save()
+        ItemRecebimento.objects.bulk_create([
+            ItemRecebimento(
+                recebimento=recebimento, produto_id=produto_id, quantidade=quantidade, preco_compra=preco_compra,
+            )
+            for produto_id, quantidade, preco_compra in linhas
+        ], batch_size=1000)
+        somar_ao_estoque(quantidades)
+        atualizar_precos_compra(precos)
+        descricao = f'Recebimento #{recebimento.id}'
+        if recebimento.numero_nota:
+            descricao += f' (nota {recebimento.numero_nota})'
+        movimentacoes = MovimentacaoEstoque.objects.bulk_create([
+            MovimentacaoEstoque(produto_id=produto_id, quantidade=quantidade, tipo='ENTRADA', descricao=descricao)
+            for produto_id, quantidade, _ in linhas
+        ], batch_size=1000)
+        contar_movimentacoes(movimentacoes)
+        registrar_alteracoes(quantidades.keys())
+    return recebimento
+
+
+def contagens_inventario_csv(arquivo):
+    """``{produto_id: quantidade_contada}`` do CSV da contagem; o mesmo produto em várias linhas é somado."""
+    contagens = Counter()
+    for numero, campos in ler_csv(arquivo, ('produto', 'quantidade')):
+        quantidade = inteiro(campos['quantidade'], numero, 'quantidade')
+        if quantidade < 0:
+            raise ValueError(f'Linha {numero}: a quantidade contada não pode ser negativa.')
+        contagens[inteiro(campos['produto'], numero, 'produto')] += quantidade
+    return contagens
+
+
+def criar_inventario(inventario, contagens):
+    """Grava ``inventario`` (ainda pendente) com as ``contagens`` ``{produto_id: quantidade}``.
+
+    Cada item guarda também o estoque do sistema neste momento, lido num único
+    ``UPDATE``; é contra ele que o lançamento calcula a diferença.
+    """
+    with transaction.atomic():
+        inventario.total_itens = len(contagens)
+        inventario.save()
+        ItemInventario.objects.bulk_create([
+            ItemInventario(inventario=inventario, produto_id=produto_id, quantidade_contada=quantidade)
+            for produto_id, quantidade in contagens.items()
+        ], batch_size=2000)
+        ItemInventario.objects.filter(inventario=inventario).update(quantidade_sistema=Coalesce(
+            Subquery(Estoque.objects.filter(produto_id=OuterRef('produto_id')).values('quantidade')[:1]), 0,
+        ))
+    return inventario
+
+
+def lancar_inventario(inventario_id):
+    """Ajusta o estoque às quantidades contadas; retorna quantos produtos mudaram.
+
+    A diferença de cada item é ``contada - quantidade_sistema`` (o estoque
+    guardado por :func:`criar_inventario`) e entra como soma, não como valor
+    absoluto: uma venda feita entre o envio da contagem e o lançamento continua
+    descontada. Itens gravados antes desse campo existir usam o estoque atual.
+    Produtos da loja fora da contagem não mudam. Retorna ``None`` se o
+    inventário já tinha sido lançado.
+    """
+    inventario = Inventario.objects.get(pk=inventario_id)
+    with transaction.atomic():
+        # Marca como lançado primeiro: dois lançamentos simultâneos não ajustam duas vezes.
+        if not Inventario.objects.filter(pk=inventario_id, status='PENDENTE').update(
+            status='LANCADO', lancado_em=timezone.now(),
+        ):
+            return None
+        diferencas = {
+            produto_id: contada - no_sistema
+            for produto_id, contada, no_sistema in (
+                ItemInventario.objects.filter(inventario_id=inventario_id)
+                .values_list(
+                    'produto_id', 'quantidade_contada',
+                    Coalesce('quantidade_sistema', 'produto__estoque__quantidade', 0),
+                )
+                .iterator(chunk_size=5000)
+            )
+            if contada != no_sistema
+        }
+        somar_ao_estoque(diferencas)
+        movimentacoes = MovimentacaoEstoque.objects.bulk_create([
+            MovimentacaoEstoque(
+                produto_id=produto_id,
+                quantidade=abs(diferenca),
+                tipo='ENTRADA' if diferenca > 0 else 'SAIDA',
+                descricao=f'Ajuste do Inventário #{inventario_id}',
+            )
+            for produto_id, diferenca in diferencas.items()
+        ], batch_size=2000)
+        contar_movimentacoes(movimentacoes)
+        registrar_alteracoes(diferencas.keys())
+        Inventario.objects.filter(pk=inventario_id).update(total_ajustes=len(diferencas))
+    return len(diferencas)
+
+
+@tarefa('lancar_inventario')
+def tarefa_lancar_inventario(execucao, inventario_id):
+    execucao.progresso(0, 'Lançando diferenças do inventário')
+    ajustes = lancar_inventario(inventario_id)
+    if ajustes is None:
+        return f'Inventário #{inventario_id} já tinha sido lançado.'
+    return f'Inventário #{inventario_id}: {ajustes} produtos ajustados.'
@@ -1,8 +1,57 @@
+from collections import Counter
+
 from django import forms
+from django.forms.models import ModelChoiceIterator
+from django.urls import reverse
 from .models import Loja, Categoria, Fornecedor, Produto 
 from django.contrib.auth.forms import UserCreationForm
 from .models import Loja, Categoria, Fornecedor, Produto, Cliente 
 from .models import Loja, Categoria, Fornecedor, Produto, Cliente, Venda, ItensVenda 
+from .models import Inventario, Recebimento
+from .estoque import contagens_inventario_csv, linhas_recebimento_csv, produtos_inexistentes
+from .referencias import referencia, todas
+
+class _OpcoesEmCache(ModelChoiceIterator):
+    def __iter__(self):
+        if self.field.empty_label is not None:
+            yield ("", self.field.empty_label)
+        for obj in todas(self.queryset.model):
+            yield self.choice(obj)
+
+    def __len__(self):
+        return len(todas(self.queryset.model)) + (1 if self.field.empty_label is not None else 0)
+
+
+class ReferenciaChoiceField(forms.ModelChoiceField):
+    """Select de Categoria/Fornecedor/Loja servido pelo cache local de referências (sem consultar o banco)."""
+
+    iterator = _OpcoesEmCache
+
+    def to_python(self, value):
+        if value in self.empty_values:
+            return None
+        if isinstance(value, self.queryset.model):
+            return value
+        try:
+            return referencia(self.queryset.model, value)
+        except self.queryset.model.DoesNotExist:
+            raise forms.ValidationError(
+                self.error_messages['invalid_choice'], code='invalid_choice', params={'value': value},
+            )
+
+
+class ReferenciasEmCacheMixin:
+    """ModelForm com campos :class:`ReferenciaChoiceField`.
+
+    O campo já confirmou que o registro existe; a validação do modelo não
+    precisa repetir a consulta da chave estrangeira.
+    """
+
+    def _get_validation_exclusions(self):
+        exclusoes = super()._get_validation_exclusions()
+        exclusoes.update(nome for nome, campo in self.fields.items() if isinstance(campo, ReferenciaChoiceField))
+        return exclusoes
+
 
 class LojaForm(forms.ModelForm):
     class Meta:
@@ -23,10 +72,13 @@ class FornecedorForm(forms.ModelForm):
         model = Fornecedor
         fields = ['nome', 'cnpj', 'telefone', 'email']
 
-class ProdutoForm(forms.ModelForm):
+class ProdutoForm(ReferenciasEmCacheMixin, forms.ModelForm):
     class Meta:
         model = Produto
         fields = ['nome', 'preco_compra', 'preco_venda', 'categoria', 'fornecedor', 'loja']
+        field_classes = {
+            'categoria': ReferenciaChoiceField, 'fornecedor': ReferenciaChoiceField, 'loja': ReferenciaChoiceField,
+        }
 
 class MovimentacaoEstoqueForm(forms.Form):
     quantidade = forms.IntegerField(label="Quantidade para Movimentar")
@@ -37,12 +89,220 @@ class ClienteForm(forms.ModelForm):
         model = Cliente
         fields = ['nome', 'cpf', 'telefone', 'rua', 'numero', 'bairro', 'estado']
 
-class VendaForm(forms.ModelForm):
+
+class AutocompleteWidget(forms.TextInput):
+    """Busca remota: guarda o id em um input oculto e não renderiza a lista de opções.
+
+    ``rotulo`` é o texto exibido para o valor atual (ex.: ao reexibir o form com erros).
+    """
+
+    template_name = 'loja_app/widgets/autocomplete.html'
+
+    def __init__(self, url_name, por_loja=False, placeholder='Digite para buscar...', attrs=None):
+        super().__init__(attrs)
+        self.url_name = url_name
+        self.por_loja = por_loja
+        self.placeholder = placeholder
+        self.rotulo = ''
+
+    def get_context(self, name, value, attrs):
+        context = super().get_context(name, value, attrs)
+        context['widget'].update({
+            'url': reverse(self.url_name),
+            'por_loja': self.por_loja,
+            'placeholder': self.placeholder,
+            'rotulo': self.rotulo,
+        })
+        return context
+
+
+class VendaForm(ReferenciasEmCacheMixin, forms.ModelForm):
     class Meta:
         model = Venda
         fields = ['cliente', 'loja']
+        field_classes = {'loja': ReferenciaChoiceField}
+        widgets = {
+            'cliente': AutocompleteWidget('buscar_clientes', placeholder='CPF, telefone ou nome...'),
+        }
+
+    def clean_cliente(self):
+        cliente = self.cleaned_data.get('cliente')
+        if cliente is not None:
+            self.fields['cliente'].widget.rotulo = cliente.nome
+        return cliente
+
+
+class ItemVendaForm(forms.Form):
+    produto = forms.IntegerField(min_value=1, widget=AutocompleteWidget('buscar_produtos', por_loja=True))
+    quantidade = forms.IntegerField(min_value=1)
+
+
+class BaseItemVendaFormSet(forms.BaseFormSet):
+    """Valida todos os itens com uma única consulta de produtos (com estoque) da loja.
+
+    Após ``is_valid()``, ``cleaned_data['produto']`` de cada item é a instância de ``Produto``.
+    """
+
+    def __init__(self, *args, loja=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.loja = loja
+
+    def clean(self):
+        if any(self.errors) or self.loja is None:
+            return
+
+        preenchidos = [form for form in self.forms if form.cleaned_data]
+        ids = {form.cleaned_data['produto'] for form in preenchidos}
+        produtos = Produto.objects.select_related('estoque').filter(loja=self.loja).in_bulk(ids)
+
+        quantidades = Counter()
+        for form in preenchidos:
+            produto = produtos.get(form.cleaned_data['produto'])
+            if produto is None:
+                form.add_error('produto', 'Produto não encontrado nesta loja.')
+                continue
+            form.cleaned_data['produto'] = produto
+            form.fields['produto'].widget.rotulo = produto.nome
+            quantidades[produto.id] += form.cleaned_data['quantidade']
+
+        for produto_id, quantidade in quantidades.items():
+            produto = produtos[produto_id]
+            if produto.estoque.quantidade < quantidade:
+                raise forms.ValidationError(
+                    f"Estoque insuficiente para o produto: {produto.nome}. "
+                    f"Disponível: {produto.estoque.quantidade}"
+                )
+
+
+ItemVendaFormSet = forms.formset_factory(
+    ItemVendaForm, formset=BaseItemVendaFormSet, extra=0, min_num=1, validate_min=True,
+)
+
+
+def _produtos_fora_da_loja(form, loja, produto_ids):
+    inexistentes = produtos_inexistentes(loja.id, produto_ids)
+    if inexistentes:
+        form.add_error('arquivo', (
+            "Produtos não encontrados nesta loja: "
+            f"{', '.join(map(str, inexistentes[:20]))}{'...' if len(inexistentes) > 20 else ''}"
+        ))
+
+
+class RecebimentoForm(ReferenciasEmCacheMixin, forms.ModelForm):
+    arquivo = forms.FileField(
+        label="Nota de entrega (CSV)", required=False,
+        help_text="Colunas: produto (código), quantidade e, opcionalmente, preco_compra.",
+    )
+
+    class Meta:
+        model = Recebimento
+        fields = ['fornecedor', 'loja', 'numero_nota']
+        field_classes = {'fornecedor': ReferenciaChoiceField, 'loja': ReferenciaChoiceField}
+
+    def clean_arquivo(self):
+        """Com arquivo, ``cleaned_data['arquivo']`` passa a ser a lista de linhas lidas do CSV."""
+        arquivo = self.cleaned_data.get('arquivo')
+        if arquivo is None:
+            return None
+        try:
+            linhas = linhas_recebimento_csv(arquivo)
+        except ValueError as exc:
+            raise forms.ValidationError(str(exc))
+        if not linhas:
+            raise forms.ValidationError("O arquivo não tem nenhuma linha.")
+        return linhas
+
+    def clean(self):
+        cleaned_data = super().clean()
+        loja, linhas = cleaned_data.get('loja'), cleaned_data.get('arquivo')
+        if loja is not None and linhas:
+            _produtos_fora_da_loja(self, loja, [produto_id for produto_id, _, _ in linhas])
+        return cleaned_data
+
+
+class ItemRecebimentoForm(forms.Form):
+    produto = forms.IntegerField(min_value=1, widget=AutocompleteWidget('buscar_produtos', por_loja=True))
+    quantidade = forms.IntegerField(min_value=1)
+    preco_compra = forms.DecimalField(
+        label="Novo preço de compra", max_digits=10, decimal_places=2, min_value=0, required=False,
+    )
+
+
+class BaseItensDaLojaFormSet(forms.BaseFormSet):
+    """Itens digitados (recebimento, inventário); valida os produtos da loja com uma única consulta."""
+
+    def __init__(self, *args, loja=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.loja = loja
+
+    def clean(self):
+        if any(self.errors) or self.loja is None:
+            return
+        preenchidos = [form for form in self.forms if form.cleaned_data]
+        produtos = Produto.objects.filter(loja=self.loja).in_bulk(
+            {form.cleaned_data['produto'] for form in preenchidos}
+        )
+        for form in preenchidos:
+            produto = produtos.get(form.cleaned_data['produto'])
+            if produto is None:
+                form.add_error('produto', 'Produto não encontrado nesta loja.')
+            else:
+                form.fields['produto'].widget.rotulo = produto.nome
+
+
+class BaseItemRecebimentoFormSet(BaseItensDaLojaFormSet):
+    def linhas(self):
+        return [
+            (form.cleaned_data['produto'], form.cleaned_data['quantidade'], form.cleaned_data.get('preco_compra'))
+            for form in self.forms if form.cleaned_data
+        ]
+
+
+ItemRecebimentoFormSet = forms.formset_factory(ItemRecebimentoForm, formset=BaseItemRecebimentoFormSet, extra=0)
+
+
+class InventarioForm(ReferenciasEmCacheMixin, forms.ModelForm):
+    arquivo = forms.FileField(
+        label="Contagem (CSV)", required=False, help_text="Colunas: produto (código) e quantidade contada.",
+    )
 
-class ItemVendaForm(forms.ModelForm):
     class Meta:
-        model = ItensVenda
-        fields = ['produto', 'quantidade']
\ No newline at end of file
+        model = Inventario
+        fields = ['loja']
+        field_classes = {'loja': ReferenciaChoiceField}
+
+    def clean_arquivo(self):
+        """Com arquivo, ``cleaned_data['arquivo']`` passa a ser ``{produto_id: quantidade}`` da contagem."""
+        arquivo = self.cleaned_data.get('arquivo')
+        if arquivo is None:
+            return None
+        try:
+            contagens = contagens_inventario_csv(arquivo)
+        except ValueError as exc:
+            raise forms.ValidationError(str(exc))
+        if not contagens:
+            raise forms.ValidationError("O arquivo não tem nenhuma linha.")
+        return contagens
+
+    def clean(self):
+        cleaned_data = super().clean()
+        if cleaned_data.get('loja') is not None and cleaned_data.get('arquivo'):
+            _produtos_fora_da_loja(self, cleaned_data['loja'], list(cleaned_data['arquivo']))
+        return cleaned_data
+
+
+class ItemInventarioForm(forms.Form):
+    produto = forms.IntegerField(min_value=1, widget=AutocompleteWidget('buscar_produtos', por_loja=True))
+    quantidade = forms.IntegerField(label="Quantidade contada", min_value=0)
+
+
+class BaseItemInventarioFormSet(BaseItensDaLojaFormSet):
+    def contagens(self):
+        contagens = Counter()
+        for form in self.forms:
+            if form.cleaned_data:
+                contagens[form.cleaned_data['produto']] += form.cleaned_data['quantidade']
+        return contagens
+
+
+ItemInventarioFormSet = forms.formset_factory(ItemInventarioForm, formset=BaseItemInventarioFormSet, extra=0)
@@ -0,0 +1,137 @@
+"""
+Limite de requisições por usuário (ou IP, sem login) em grupos de endpoints.
+
+Token bucket: cada cliente tem, em cada grupo de ``LIMITES_REQUISICOES``, um
+balde de ``rajada`` fichas que se recarrega a ``taxa`` fichas por segundo.
+Cada requisição gasta uma ficha; com o balde vazio a resposta é ``429`` com
+``Retry-After`` e a view (e o banco) nem é chamada. O balde mora no cache
+``limites``, compartilhado pelos workers (Redis ou arquivos, ver settings),
+como ``(fichas, instante)``: a recarga é calculada na leitura, sem nada rodando
+em segundo plano. Em arquivos (sem ``GESTORPRO_CACHE_URL``) só os workers da
+mesma máquina dividem os baldes: com várias máquinas o limite vale por
+máquina.
+
+Leitura e gravação não são atômicas, então requisições simultâneas do mesmo
+cliente podem gastar a mesma ficha: o limite é aproximado, passando no máximo
+pelo número de requisições em paralelo. Se o cache falhar, a requisição passa.
+"""
+import functools
+import logging
+import math
+import time
+
+from django.conf import settings
+from django.core.cache import caches
+from django.core.cache.backends.filebased import FileBasedCache
+from django.core.exceptions import ImproperlyConfigured
+from django.http import JsonResponse
+
+from . import metricas
+
+
+logger = logging.getLogger(__name__)
+
+
+class CacheDeBaldes(FileBasedCache):
+    """``FileBasedCache`` que limpa o diretório de tempos em tempos, não a cada gravação.
+
+    O ``FileBasedCache`` lista o diretório inteiro em todo ``set`` para decidir
+    se precisa descartar entradas, o que cresce com o número de clientes. Aqui
+    a limpeza roda no máximo a cada ``INTERVALO_LIMPEZA`` segundos por processo:
+    apaga os baldes vencidos (todos têm timeout) e, se ainda passar de
+    ``MAX_ENTRIES``, descarta uma parte como o original.
+    """
+
+    def __init__(self, dir, params):
+        super().__init__(dir, params)
+        self.intervalo_limpeza = params.get('OPTIONS', {}).get('INTERVALO_LIMPEZA', 60)
+        self._proxima_limpeza = 0.0
+
+    def _cull(self):
+        agora = time.monotonic()
+        if agora < self._proxima_limpeza:
+            return
+        self._proxima_limpeza = agora + self.intervalo_limpeza
+        for nome in self._list_cache_files():
+            try:
+                with open(nome, 'rb') as arquivo:
+                    self._is_expired(arquivo)
+            except FileNotFoundError:
+                pass
+        super()._cull()
+
+
+@functools.lru_cache(maxsize=None)
+def _ler_limite(texto):
+    """``(taxa, rajada)`` de ``"taxa/rajada"`` (ex.: ``"5/30"``); ``None`` se vazio."""
+    if not texto:
+        return None
+    taxa, _, rajada = texto.partition('/')
+    try:
+        taxa = float(taxa)
+        rajada = int(rajada) if rajada else max(1, math.ceil(taxa))
+    except ValueError:
+        taxa = rajada = 0
+    if taxa <= 0 or rajada < 1:
+        raise ImproperlyConfigured(f'Limite de requisições inválido "{texto}"; use "taxa por segundo/rajada".')
+    return taxa, rajada
+
+
+def limite_do_grupo(grupo):
+    return _ler_limite(settings.LIMITES_REQUISICOES.get(grupo, ''))
+
+
+def identidade(request):
+    """Quem gasta as fichas: o usuário logado ou o IP do cliente."""
+    usuario = getattr(request, 'user', None)
+    if usuario is not None and usuario.is_authenticated:
+        return f'usuario:{usuario.pk}'
+    endereco = ''
+    if settings.LIMITES_CABECALHO_IP:
+        # O último endereço é o que o proxy de confiança acrescentou; os anteriores vêm do cliente.
+        endereco = request.META.get(settings.LIMITES_CABECALHO_IP, '').split(',')[-1].strip()
+    return f'ip:{endereco or request.META.get("REMOTE_ADDR", "")}'
+
+
+def consumir(grupo, cliente):
+    """Gasta uma ficha de ``cliente`` em ``grupo``; retorna ``0`` ou os segundos até haver ficha."""
+    limite = limite_do_grupo(grupo)
+    if limite is None:
+        return 0
+    taxa, rajada = limite
+    agora = time.time()
+    chave = f'limites:{grupo}:{cliente}'
+    cache = caches['limites']
+    try:
+        fichas, instante = cache.get(chave) or (rajada, agora)
+        fichas = min(rajada, fichas + max(0.0, agora - instante) * taxa)
+        if fichas < 1:
+            # Sem gravar: o estado guardado já dá o mesmo saldo daqui a pouco.
+            return (1 - fichas) / taxa
+        # Depois de encher de novo o balde pode sumir do cache: ausente é balde cheio.
+        cache.set(chave, (fichas - 1, agora), timeout=math.ceil(rajada / taxa) + 1)
+    except Exception:
+        logger.warning('Cache de limites indisponível; requisição liberada.', exc_info=True)
+    return 0
+
+
+def limitar(grupo):
+    """Aplica o limite de ``grupo`` à view; use por fora dos decorators que exigem login."""
+
+    def decorador(view_func):
+        @functools.wraps(view_func)
+        def view(request, *args, **kwargs):
+            espera = consumir(grupo, identidade(request))
+            if espera:
+                metricas.incrementar(metricas.REQUISICOES_LIMITADAS, grupo=grupo)
+                segundos = math.ceil(espera)
+                resposta = JsonResponse(
+                    {'detalhe': f'Muitas requisições; tente de novo em {segundos} s.'}, status=429,
+                )
+                resposta['Retry-After'] = str(segundos)
+                return resposta
+            return view_func(request, *args, **kwargs)
+
+        return view
+
+    return decorador
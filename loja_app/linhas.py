@@ -0,0 +1,115 @@
+"""
+Linhas enxutas para as listagens grandes de histórico.
+
+Em vez de instâncias completas de modelo (com ``_state``, todos os campos e
+objetos relacionados), as listagens usam objetos com ``__slots__`` montados a
+partir de ``values_list()`` lido em lotes. Nomes de produtos e clientes vêm de
+uma consulta por lote, sem JOIN na consulta principal.
+"""
+from collections import defaultdict
+from itertools import islice
+
+from .models import (
+    Cliente, ItemVendaArquivado, ItensVenda, Loja, MovimentacaoArquivada, MovimentacaoEstoque, Produto, Venda,
+    VendaArquivada,
+)
+
+
+class Linha:
+    """Base das linhas montadas a partir de ``values_list(*CAMPOS)``.
+
+    Cada campo vira o atributo com o último trecho do nome
+    (``venda__data_venda`` -> ``data_venda``); ``NOMES`` mapeia
+    atributo -> (campo com o id, modelo com ``nome``).
+    """
+
+    __slots__ = ()
+    CAMPOS = ()
+    NOMES = {}
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        cls.ATRIBUTOS = tuple(campo.rsplit('__', 1)[-1] for campo in cls.CAMPOS)
+
+    def __init__(self, valores, nomes):
+        for atributo, valor in zip(self.ATRIBUTOS, valores):
+            setattr(self, atributo, valor)
+        for atributo, (campo, modelo) in self.NOMES.items():
+            setattr(self, atributo, nomes[modelo].get(getattr(self, campo)))
+
+
+class LinhaVenda(Linha):
+    __slots__ = ('id', 'data_venda', 'valor_total', 'status', 'cliente_id', 'cliente_nome')
+    CAMPOS = ('id', 'data_venda', 'valor_total', 'status', 'cliente_id')
+    NOMES = {'cliente_nome': ('cliente_id', Cliente)}
+    STATUS = dict(Venda.STATUS_CHOICES)
+    arquivada = False
+
+    def get_status_display(self):
+        return self.STATUS.get(self.status, self.status)
+
+
+class LinhaVendaArquivada(LinhaVenda):
+    __slots__ = ()
+    arquivada = True
+
+
+class LinhaCompra(LinhaVenda):
+    """Venda vista pelo cliente: em vez do nome do cliente, o da loja."""
+
+    __slots__ = ('loja_id', 'loja_nome')
+    CAMPOS = ('id', 'data_venda', 'valor_total', 'status', 'loja_id')
+    NOMES = {'loja_nome': ('loja_id', Loja)}
+
+
+class LinhaCompraArquivada(LinhaCompra):
+    __slots__ = ()
+    arquivada = True
+
+
+class LinhaItemVenda(Linha):
+    __slots__ = ('venda_id', 'data_venda', 'quantidade', 'preco_unitario', 'produto_id', 'produto_nome')
+    CAMPOS = ('venda_id', 'venda__data_venda', 'quantidade', 'preco_unitario', 'produto_id')
+    NOMES = {'produto_nome': ('produto_id', Produto)}
+
+
+class LinhaMovimentacao(Linha):
+    __slots__ = ('data', 'quantidade', 'tipo', 'descricao', 'produto_id', 'produto_nome')
+    CAMPOS = ('data', 'quantidade', 'tipo', 'descricao', 'produto_id')
+    NOMES = {'produto_nome': ('produto_id', Produto)}
+    TIPOS = dict(MovimentacaoEstoque.TIPO_MOVIMENTACAO)
+
+    def get_tipo_display(self):
+        return self.TIPOS.get(self.tipo, self.tipo)
+
+
+def gerar_linhas(classe, consulta, lote=2000):
+    """Gera ``classe`` para cada linha de ``consulta``, lendo e resolvendo nomes em lotes de ``lote``."""
+    valores = consulta.values_list(*classe.CAMPOS).iterator(chunk_size=lote)
+    nomes = defaultdict(dict)
+    while True:
+        bloco = list(islice(valores, lote))
+        if not bloco:
+            return
+        for campo, modelo in classe.NOMES.values():
+            indice = classe.CAMPOS.index(campo)
+            faltando = {linha[indice] for linha in bloco} - nomes[modelo].keys() - {None}
+            if faltando:
+                nomes[modelo].update(modelo.objects.filter(pk__in=faltando).values_list('id', 'nome'))
+        for linha in bloco:
+            yield classe(linha, nomes)
+
+
+LINHAS_POR_MODELO = {
+    Venda: LinhaVenda,
+    VendaArquivada: LinhaVendaArquivada,
+    ItensVenda: LinhaItemVenda,
+    ItemVendaArquivado: LinhaItemVenda,
+    MovimentacaoEstoque: LinhaMovimentacao,
+    MovimentacaoArquivada: LinhaMovimentacao,
+}
+
+
+def linhas_de(consulta, lote=2000):
+    """:func:`gerar_linhas` com a classe de linha correspondente ao modelo da consulta."""
+    return gerar_linhas(LINHAS_POR_MODELO[consulta.model], consulta, lote)
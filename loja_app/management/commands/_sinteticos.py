@@ -0,0 +1,54 @@
+"""Dados sintéticos para os comandos de benchmark (sempre dentro de uma transação desfeita)."""
+import random
+import time
+from datetime import timedelta
+
+from django.utils import timezone
+
+from loja_app.models import ItensVenda, Loja, MovimentacaoEstoque, Produto, Venda
+
+
+def gerar_vendas(quantidade, lojas=5, produtos=500, semente=42):
+    """Cria ``quantidade`` itens de venda (e uma movimentação de saída por item) espalhados em um ano."""
+    aleatorio = random.Random(semente)
+    sufixo = int(time.time())
+    lojas = Loja.objects.bulk_create([
+        Loja(nome=f'Benchmark {n}', endereco='-', cnpj_loja=f'bench-{sufixo}-{semente}-{n}') for n in range(lojas)
+    ])
+    produtos = Produto.objects.bulk_create([
+        Produto(
+            nome=f'Produto {n}', preco_compra=5, preco_venda=aleatorio.randint(100, 9999) / 100,
+            loja=lojas[n % len(lojas)],
+        )
+        for n in range(produtos)
+    ])
+
+    agora = timezone.now()
+    Venda.objects.bulk_create([
+        Venda(
+            loja=lojas[n % len(lojas)],
+            data_venda=agora - timedelta(minutes=aleatorio.randint(0, 60 * 24 * 365)),
+            valor_total=aleatorio.randint(100, 50000) / 100,
+        )
+        for n in range(max(quantidade // 3, 1))
+    ], batch_size=1000)
+    # bulk_create só devolve ids em alguns bancos; relê as vendas recém-criadas.
+    vendas = list(Venda.objects.filter(loja__in=lojas).values_list('id', 'loja_id'))
+    por_loja = {}
+    for produto in produtos:
+        por_loja.setdefault(produto.loja_id, []).append(produto)
+
+    itens, movimentacoes = [], []
+    for n in range(quantidade):
+        venda_id, loja_id = vendas[n % len(vendas)]
+        produto = aleatorio.choice(por_loja[loja_id])
+        quantidade_item = aleatorio.randint(1, 5)
+        itens.append(ItensVenda(
+            venda_id=venda_id, produto_id=produto.id, quantidade=quantidade_item,
+            preco_unitario=produto.preco_venda, custo_unitario=produto.preco_compra,
+        ))
+        movimentacoes.append(MovimentacaoEstoque(
+            produto_id=produto.id, quantidade=quantidade_item, tipo='SAIDA', descricao=f'Venda #{venda_id}',
+        ))
+    ItensVenda.objects.bulk_create(itens, batch_size=2000)
+    MovimentacaoEstoque.objects.bulk_create(movimentacoes, batch_size=2000)
@@ -0,0 +1,107 @@
+import json
+import os
+import re
+import subprocess
+import sys
+from collections import defaultdict
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+
+# Executado num processo novo para medir a partida a frio de verdade.
+PARTIDA = '''
+import json, sys, time
+from io import BytesIO
+from wsgiref.util import setup_testing_defaults
+
+inicio = time.perf_counter()
+import gestorpro.{modulo} as modulo
+resultado = {{'importar': time.perf_counter() - inicio, 'etapas': {{}}}}
+
+if {aquecer}:
+    from loja_app.aquecimento import aquecer
+    resultado['etapas'] = {{nome: segundos for nome, (_, segundos) in aquecer().items()}}
+
+if '{modulo}' == 'wsgi':
+    for rotulo in ('primeira', 'segunda'):
+        environ = {{'PATH_INFO': {url!r}, 'REQUEST_METHOD': 'GET', 'wsgi.input': BytesIO()}}
+        setup_testing_defaults(environ)
+        inicio = time.perf_counter()
+        response = modulo.application(environ, lambda status, headers: None)
+        b''.join(response)
+        response.close()
+        resultado[rotulo] = time.perf_counter() - inicio
+
+print(json.dumps(resultado))
+'''
+
+IMPORTTIME = re.compile(r'^import time:\s+(\d+) \|\s+(\d+) \|( *)(\S+)$')
+
+
+class Command(BaseCommand):
+    help = (
+        'Mede a partida a frio de gestorpro.wsgi/asgi com e sem o aquecimento '
+        '(loja_app.aquecimento) e mostra onde vai o tempo de importação.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--url', default='/login/', help='Página usada para medir a primeira requisição (WSGI).')
+        parser.add_argument('--modulos', type=int, default=15, help='Quantos módulos mais lentos listar.')
+
+    def handle(self, *args, **options):
+        self.stdout.write(
+            f"{'entrada':<8}{'aquecer':<9}{'import ms':>10}{'aquecer ms':>12}{'1ª req ms':>11}{'2ª req ms':>11}"
+        )
+        for modulo in ('wsgi', 'asgi'):
+            for aquecer in (False, True):
+                resultado = json.loads(self._executar(
+                    ['-c', PARTIDA.format(modulo=modulo, aquecer=aquecer, url=options['url'])]
+                ).stdout)
+                self.stdout.write(
+                    f"{modulo:<8}{'sim' if aquecer else 'não':<9}{resultado['importar'] * 1000:>10.0f}"
+                    f"{sum(resultado['etapas'].values()) * 1000:>12.0f}"
+                    f"{self._ms(resultado.get('primeira')):>11}{self._ms(resultado.get('segunda')):>11}"
+                )
+                if resultado['etapas']:
+                    detalhes = ', '.join(f'{nome} {segundos * 1000:.0f} ms' for nome, segundos in resultado['etapas'].items())
+                    self.stdout.write(f'{"":<17}{detalhes}')
+
+        for modulo in ('wsgi', 'asgi'):
+            self._importacoes(modulo, options['modulos'])
+
+    def _importacoes(self, modulo, quantos):
+        """Tempo próprio de importação de ``gestorpro.<modulo>`` por pacote e os módulos mais lentos."""
+        saida = self._executar(['-X', 'importtime', '-c', f'import gestorpro.{modulo}']).stderr
+        modulos = []
+        for linha in saida.splitlines():
+            encontrado = IMPORTTIME.match(linha)
+            if encontrado:
+                proprio, acumulado, _, nome = encontrado.groups()
+                modulos.append((nome, int(proprio), int(acumulado)))
+
+        por_pacote = defaultdict(int)
+        for nome, proprio, _ in modulos:
+            por_pacote[nome.split('.')[0]] += proprio
+        total = sum(por_pacote.values())
+
+        self.stdout.write(f'\nImportação de gestorpro.{modulo}: {total / 1000:.0f} ms em {len(modulos)} módulos')
+        self.stdout.write(f"{'pacote':<32}{'ms':>8}{'%':>6}")
+        for pacote, proprio in sorted(por_pacote.items(), key=lambda par: par[1], reverse=True)[:10]:
+            self.stdout.write(f'{pacote:<32}{proprio / 1000:>8.1f}{proprio / total * 100:>6.0f}')
+
+        self.stdout.write(f"\n{'módulo':<48}{'próprio ms':>11}{'acumulado ms':>14}")
+        for nome, proprio, acumulado in sorted(modulos, key=lambda modulo: modulo[1], reverse=True)[:quantos]:
+            self.stdout.write(f'{nome[:47]:<48}{proprio / 1000:>11.1f}{acumulado / 1000:>14.1f}')
+
+    def _executar(self, argumentos):
+        ambiente = {**os.environ, 'DJANGO_SETTINGS_MODULE': os.environ.get('DJANGO_SETTINGS_MODULE', 'gestorpro.settings')}
+        # O aquecimento automático distorceria a medida sem aquecimento.
+        ambiente.pop('GESTORPRO_AQUECER', None)
+        return subprocess.run(
+            [sys.executable, *argumentos], cwd=settings.BASE_DIR, env=ambiente,
+            capture_output=True, text=True, check=True,
+        )
+
+    def _ms(self, segundos):
+        return '-' if segundos is None else f'{segundos * 1000:.1f}'
@@ -0,0 +1,45 @@
+import time
+from datetime import datetime, time as hora, timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from loja_app.arquivo import arquivar_movimentacoes, arquivar_vendas
+
+
+class Command(BaseCommand):
+    help = (
+        'Move vendas e movimentações de estoque anteriores ao corte para as tabelas de arquivo, '
+        'em lotes. Agregados e estoque não mudam.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--antes-de', help='Data de corte (AAAA-MM-DD); arquiva o que for anterior.')
+        parser.add_argument('--dias', type=int, default=730, help='Sem --antes-de, mantém os últimos N dias.')
+        parser.add_argument('--lote', type=int, default=500, help='Linhas movidas por transação.')
+        parser.add_argument(
+            '--pausa', type=float, default=0,
+            help='Espera (s) entre lotes, para não segurar o banco com as lojas abertas.',
+        )
+
+    def handle(self, *args, **options):
+        if options['antes_de']:
+            try:
+                dia = datetime.strptime(options['antes_de'], '%Y-%m-%d').date()
+            except ValueError:
+                raise CommandError('Use o formato AAAA-MM-DD em --antes-de.')
+        else:
+            dia = timezone.localdate() - timedelta(days=options['dias'])
+        corte = timezone.make_aware(datetime.combine(dia, hora.min))
+        self.stdout.write(f'Arquivando registros anteriores a {dia:%d/%m/%Y}.')
+
+        for rotulo, lotes in (
+            ('vendas', arquivar_vendas(corte, options['lote'])),
+            ('movimentações', arquivar_movimentacoes(corte, options['lote'])),
+        ):
+            total = 0
+            for movidas in lotes:
+                total += movidas
+                if options['pausa']:
+                    time.sleep(options['pausa'])
+            self.stdout.write(f'{total} {rotulo} arquivada(s).')
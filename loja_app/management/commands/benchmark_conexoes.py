@@ -0,0 +1,95 @@
+import time
+from io import BytesIO
+from urllib.parse import urlsplit
+from wsgiref.util import setup_testing_defaults
+
+from django.conf import settings
+from django.core.handlers.wsgi import WSGIHandler
+from django.core.management.base import BaseCommand
+from django.db import connections, DEFAULT_DB_ALIAS
+from django.db.backends.signals import connection_created
+
+
+class Command(BaseCommand):
+    help = (
+        'Mede o custo de abrir conexões por requisição comparando '
+        'CONN_MAX_AGE=0 com conexões persistentes.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requisicoes', type=int, default=500)
+        parser.add_argument(
+            '--url', default='/api/get-produtos-por-loja/?loja_id=1',
+            help='Caminho requisitado (deve consultar o banco e não exigir login).',
+        )
+        parser.add_argument('--conn-max-age', type=int, default=600)
+
+    def handle(self, *args, **options):
+        conexao = connections[DEFAULT_DB_ALIAS]
+        original = conexao.settings_dict['CONN_MAX_AGE']
+        self.stdout.write(
+            f"Banco: {conexao.vendor} ({conexao.settings_dict['NAME']}), "
+            f"{options['requisicoes']} requisições em {options['url']}"
+        )
+
+        resultados = {}
+        # Centenas de requisições seguidas do mesmo IP: sem limite de requisições durante a medição.
+        limites = settings.LIMITES_REQUISICOES
+        settings.LIMITES_REQUISICOES = {}
+        try:
+            for rotulo, max_age in (('sem persistência', 0), ('persistente', options['conn_max_age'])):
+                conexao.close()
+                conexao.settings_dict['CONN_MAX_AGE'] = max_age
+                resultados[rotulo] = self._medir(options['url'], options['requisicoes'])
+        finally:
+            conexao.close()
+            conexao.settings_dict['CONN_MAX_AGE'] = original
+            settings.LIMITES_REQUISICOES = limites
+
+        self.stdout.write(f"{'modo':<18}{'conexões':>10}{'ms/req':>10}{'ms conexão/req':>16}")
+        for rotulo, (total, abertas, conectando) in resultados.items():
+            n = options['requisicoes']
+            self.stdout.write(
+                f'{rotulo:<18}{abertas:>10}{total / n * 1000:>10.3f}{conectando / n * 1000:>16.3f}'
+            )
+
+        antes, depois = resultados['sem persistência'][0], resultados['persistente'][0]
+        economia = (antes - depois) / options['requisicoes'] * 1000
+        self.stdout.write(self.style.SUCCESS(f'Economia por requisição: {economia:.3f} ms'))
+
+    def _medir(self, url, requisicoes):
+        handler = WSGIHandler()
+        partes = urlsplit(url)
+        estado = {'abertas': 0, 'conectando': 0.0}
+
+        conexao = connections[DEFAULT_DB_ALIAS]
+        connect_original = conexao.connect
+
+        def connect_cronometrado():
+            inicio = time.perf_counter()
+            connect_original()
+            estado['conectando'] += time.perf_counter() - inicio
+
+        def contar(sender, connection, **kwargs):
+            estado['abertas'] += 1
+
+        conexao.connect = connect_cronometrado
+        connection_created.connect(contar)
+        try:
+            inicio = time.perf_counter()
+            for _ in range(requisicoes):
+                environ = {
+                    'PATH_INFO': partes.path,
+                    'QUERY_STRING': partes.query,
+                    'REQUEST_METHOD': 'GET',
+                    'wsgi.input': BytesIO(),
+                }
+                setup_testing_defaults(environ)
+                response = handler(environ, lambda status, headers: None)
+                # close() dispara request_finished, que fecha ou preserva a conexão.
+                response.close()
+            total = time.perf_counter() - inicio
+        finally:
+            connection_created.disconnect(contar)
+            del conexao.connect
+        return total, estado['abertas'], estado['conectando']
@@ -0,0 +1,116 @@
+import time
+import tracemalloc
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import DecimalField, ExpressionWrapper, F, Sum
+from django.db.models.functions import ExtractHour
+from django.utils import timezone
+
+from loja_app.cubo import CuboVendas
+from loja_app.models import ItensVenda
+
+from ._sinteticos import gerar_vendas
+
+
+VALOR = DecimalField(max_digits=14, decimal_places=2)
+
+
+class Command(BaseCommand):
+    help = (
+        'Compara o cubo de vendas em memória com os GROUP BY equivalentes no banco '
+        '(memória ocupada e latência das consultas).'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--itens', type=int, default=0,
+            help='Gera N itens sintéticos numa transação desfeita ao final (0 = usa os dados atuais).',
+        )
+        parser.add_argument('--repeticoes', type=int, default=5)
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            if options['itens']:
+                gerar_vendas(options['itens'])
+                self.stdout.write(f"{options['itens']} itens sintéticos gerados (serão descartados ao final).")
+            self._comparar(options['repeticoes'])
+            transaction.set_rollback(True)
+
+    def _comparar(self, repeticoes):
+        inicio = time.perf_counter()
+        cubo = CuboVendas()
+        cubo.atualizar()
+        carga = time.perf_counter() - inicio
+
+        # A mesma carga guardando as linhas como tuplas, só para comparar a memória.
+        tracemalloc.start()
+        tuplas = list(
+            ItensVenda.objects.filter(venda__status='CONCLUIDA')
+            .values_list('produto_id', 'venda__loja_id', 'venda__data_venda', 'quantidade', 'preco_unitario')
+        )
+        em_tuplas = tracemalloc.get_traced_memory()[0]
+        tracemalloc.stop()
+        del tuplas
+
+        inicio = time.perf_counter()
+        cubo.atualizar()
+        incremental = time.perf_counter() - inicio
+
+        linhas = len(cubo)
+        self.stdout.write(
+            f'{linhas} itens; carga {carga * 1000:.0f} ms, '
+            f'atualização sem novidades {incremental * 1000:.1f} ms'
+        )
+        self.stdout.write(
+            f'Memória: cubo {cubo.bytes_em_memoria() / 1024 / 1024:.2f} MiB '
+            f'({cubo.bytes_em_memoria() / max(linhas, 1):.0f} bytes/item), '
+            f'lista de tuplas {em_tuplas / 1024 / 1024:.2f} MiB ({em_tuplas / max(linhas, 1):.0f} bytes/item)'
+        )
+
+        itens = ItensVenda.objects.filter(venda__status='CONCLUIDA')
+        receita = Sum(ExpressionWrapper(F('quantidade') * F('preco_unitario'), output_field=VALOR))
+        desde = timezone.localdate() - timedelta(days=30)
+        consultas = [
+            (
+                'receita por hora',
+                lambda: cubo.agrupar('hora'),
+                lambda: itens.annotate(hora=ExtractHour('venda__data_venda'))
+                .values_list('hora').annotate(total_quantidade=Sum('quantidade'), total_receita=receita)
+                .order_by(),
+            ),
+            (
+                'receita por produto',
+                lambda: cubo.agrupar('produto'),
+                lambda: itens.values_list('produto_id')
+                .annotate(total_quantidade=Sum('quantidade'), total_receita=receita).order_by(),
+            ),
+            (
+                'loja, últimos 30 dias',
+                lambda: cubo.agrupar('loja', desde=desde),
+                lambda: itens.filter(venda__data_venda__date__gte=desde)
+                .values_list('venda__loja_id')
+                .annotate(total_quantidade=Sum('quantidade'), total_receita=receita).order_by(),
+            ),
+        ]
+
+        self.stdout.write(f"{'consulta':<24}{'cubo ms':>10}{'SQL ms':>10}{'confere':>9}")
+        for rotulo, no_cubo, no_banco in consultas:
+            tempo_cubo, resultado_cubo = self._cronometrar(no_cubo, repeticoes)
+            tempo_sql, resultado_sql = self._cronometrar(lambda: list(no_banco()), repeticoes)
+            confere = resultado_cubo == {
+                chave: (quantidade, int(round(total * 100))) for chave, quantidade, total in resultado_sql
+            }
+            self.stdout.write(
+                f"{rotulo:<24}{tempo_cubo * 1000:>10.2f}{tempo_sql * 1000:>10.2f}{'sim' if confere else 'NÃO':>9}"
+            )
+
+    def _cronometrar(self, funcao, repeticoes):
+        melhor, resultado = None, None
+        for _ in range(repeticoes):
+            inicio = time.perf_counter()
+            resultado = funcao()
+            decorrido = time.perf_counter() - inicio
+            melhor = decorrido if melhor is None else min(melhor, decorrido)
+        return melhor, resultado
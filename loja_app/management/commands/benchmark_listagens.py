@@ -0,0 +1,142 @@
+import time
+import tracemalloc
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.template import Context, Template
+from django.test import RequestFactory
+
+from loja_app import views
+from loja_app.linhas import linhas_de
+from loja_app.models import ItensVenda, MovimentacaoEstoque, Venda
+
+from ._sinteticos import gerar_vendas
+
+
+# Só o corpo das tabelas: o resto das páginas é igual nas duas versões.
+TEMPLATES = {
+    'vendas': (
+        '{% for venda in linhas %}<tr><td>#{{ venda.id }}</td><td>{{ venda.data_venda|date:"d/m/Y H:i" }}</td>'
+        '<td>{{ venda.cliente.nome|default:"-" }}</td><td>R$ {{ venda.valor_total }}</td>'
+        '<td>{{ venda.get_status_display }}</td></tr>{% endfor %}',
+        '{% for venda in linhas %}<tr><td>#{{ venda.id }}</td><td>{{ venda.data_venda|date:"d/m/Y H:i" }}</td>'
+        '<td>{{ venda.cliente_nome|default:"-" }}</td><td>R$ {{ venda.valor_total }}</td>'
+        '<td>{{ venda.get_status_display }}</td></tr>{% endfor %}',
+    ),
+    'itens de venda': (
+        '{% for item in linhas %}<tr><td>{{ item.venda.data_venda|date:"d/m/Y H:i" }}</td><td>#{{ item.venda.id }}</td>'
+        '<td>{{ item.produto.nome }}</td><td>{{ item.quantidade }}</td><td>R$ {{ item.preco_unitario }}</td></tr>'
+        '{% endfor %}',
+        '{% for item in linhas %}<tr><td>{{ item.data_venda|date:"d/m/Y H:i" }}</td><td>#{{ item.venda_id }}</td>'
+        '<td>{{ item.produto_nome }}</td><td>{{ item.quantidade }}</td><td>R$ {{ item.preco_unitario }}</td></tr>'
+        '{% endfor %}',
+    ),
+    'movimentações': (
+        '{% for mov in linhas %}<tr><td>{{ mov.data|date:"d/m/Y H:i" }}</td><td>{{ mov.produto.nome }}</td>'
+        '<td>{{ mov.quantidade }}</td><td>{{ mov.get_tipo_display }}</td><td>{{ mov.descricao|default:"-" }}</td></tr>'
+        '{% endfor %}',
+        '{% for mov in linhas %}<tr><td>{{ mov.data|date:"d/m/Y H:i" }}</td><td>{{ mov.produto_nome }}</td>'
+        '<td>{{ mov.quantidade }}</td><td>{{ mov.get_tipo_display }}</td><td>{{ mov.descricao|default:"-" }}</td></tr>'
+        '{% endfor %}',
+    ),
+}
+
+
+VIEWS = {
+    'vendas': views.lista_vendas,
+    'itens de venda': views.lista_itens_venda,
+    'movimentações': views.lista_movimentacoes_estoque,
+}
+
+
+class Command(BaseCommand):
+    help = (
+        'Mede memória (tracemalloc) e tempo de montagem + renderização das listagens de histórico: '
+        'instâncias de modelo e linhas com __slots__ numa lista, e a view de verdade enviando a tabela em partes.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--linhas', type=int, default=100000,
+            help='Itens/movimentações sintéticos gerados numa transação desfeita ao final (0 = dados atuais).',
+        )
+
+    def handle(self, *args, **options):
+        consultas = {
+            'vendas': (
+                lambda: Venda.objects.prefetch_related('cliente').order_by('-data_venda'),
+                lambda: linhas_de(Venda.objects.order_by('-data_venda')),
+            ),
+            'itens de venda': (
+                lambda: ItensVenda.objects.select_related('venda').prefetch_related('produto')
+                .order_by('-venda__data_venda'),
+                lambda: linhas_de(ItensVenda.objects.order_by('-venda__data_venda')),
+            ),
+            'movimentações': (
+                lambda: MovimentacaoEstoque.objects.prefetch_related('produto').order_by('-data'),
+                lambda: linhas_de(MovimentacaoEstoque.objects.order_by('-data')),
+            ),
+        }
+
+        with transaction.atomic():
+            if options['linhas']:
+                gerar_vendas(options['linhas'])
+                self.stdout.write(f"{options['linhas']} linhas sintéticas geradas (serão descartadas ao final).")
+
+            self.stdout.write(
+                f"{'listagem':<16}{'modo':<12}{'linhas':>8}{'lista MiB':>11}{'pico MiB':>10}"
+                f"{'montar ms':>11}{'render ms':>11}"
+            )
+            for rotulo, (modelos, linhas) in consultas.items():
+                for modo, consulta, template in (
+                    ('instâncias', modelos, TEMPLATES[rotulo][0]),
+                    ('__slots__', linhas, TEMPLATES[rotulo][1]),
+                ):
+                    total, em_lista, pico, montar, renderizar = self._medir(consulta, Template(template))
+                    self.stdout.write(
+                        f'{rotulo:<16}{modo:<12}{total:>8}{em_lista / 1024 / 1024:>11.1f}{pico / 1024 / 1024:>10.1f}'
+                        f'{montar * 1000:>11.0f}{renderizar * 1000:>11.0f}'
+                    )
+                # Página inteira (inclusive base.html), com as linhas lidas e renderizadas durante o envio.
+                pico, enviar = self._medir_view(VIEWS[rotulo])
+                self.stdout.write(
+                    f"{rotulo:<16}{'em partes':<12}{total:>8}{'-':>11}{pico / 1024 / 1024:>10.1f}"
+                    f"{'-':>11}{enviar * 1000:>11.0f}"
+                )
+            transaction.set_rollback(True)
+
+    def _medir(self, consulta, template):
+        # Tempo sem tracemalloc (que deixa tudo mais lento); memória numa segunda passada.
+        inicio = time.perf_counter()
+        linhas = list(consulta())
+        montar = time.perf_counter() - inicio
+        inicio = time.perf_counter()
+        template.render(Context({'linhas': linhas}))
+        renderizar = time.perf_counter() - inicio
+        total = len(linhas)
+        del linhas
+
+        tracemalloc.start()
+        linhas = list(consulta())
+        em_lista = tracemalloc.get_traced_memory()[0]
+        template.render(Context({'linhas': linhas}))
+        pico = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+        return total, em_lista, pico, montar, renderizar
+
+    def _medir_view(self, view):
+        request = RequestFactory().get('/')
+        request.user = get_user_model()(username='benchmark', is_staff=True, is_active=True)
+
+        inicio = time.perf_counter()
+        for _ in view(request).streaming_content:
+            pass
+        enviar = time.perf_counter() - inicio
+
+        tracemalloc.start()
+        for _ in view(request).streaming_content:
+            pass
+        pico = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+        return pico, enviar
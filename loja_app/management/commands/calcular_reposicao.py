@@ -0,0 +1,50 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from loja_app.reposicao import calcular_reposicao
+
+from ._sinteticos import gerar_vendas
+
+
+class Command(BaseCommand):
+    help = 'Recalcula a previsão de demanda e as sugestões de compra de cada produto.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--loja', type=int, help='Só os produtos desta loja.')
+        parser.add_argument('--dias-janela', type=int, default=90, help='Dias usados na tendência.')
+        parser.add_argument('--dias-media', type=int, default=28, help='Dias da média móvel.')
+        parser.add_argument('--prazo-entrega', type=int, default=7)
+        parser.add_argument('--dias-cobertura', type=int, default=14, help='Dias de estoque após a entrega.')
+        parser.add_argument(
+            '--itens', type=int, default=0,
+            help='Gera N itens sintéticos numa transação desfeita ao final, para medir o tempo do cálculo.',
+        )
+        parser.add_argument('--produtos', type=int, default=500, help='Produtos sintéticos (com --itens).')
+
+    def handle(self, *args, **options):
+        parametros = {
+            'dias_janela': options['dias_janela'],
+            'dias_media': options['dias_media'],
+            'prazo_entrega': options['prazo_entrega'],
+            'dias_cobertura': options['dias_cobertura'],
+            'loja_id': options['loja'],
+        }
+        if not options['itens']:
+            self._calcular(parametros)
+            return
+        with transaction.atomic():
+            gerar_vendas(options['itens'], produtos=options['produtos'])
+            self.stdout.write(
+                f"{options['itens']} itens sintéticos de {options['produtos']} produtos gerados "
+                '(serão descartados ao final).'
+            )
+            self._calcular(parametros)
+            transaction.set_rollback(True)
+
+    def _calcular(self, parametros):
+        inicio = time.perf_counter()
+        total = calcular_reposicao(**parametros)
+        decorrido = time.perf_counter() - inicio
+        self.stdout.write(self.style.SUCCESS(f'{total} produtos com previsão atualizada em {decorrido:.2f} s.'))
@@ -0,0 +1,63 @@
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections, connections
+
+from loja_app.models import Tarefa
+from loja_app.tarefas import executar, reservar_proxima, tipos_registrados
+
+
+def _executar_em_thread(tarefa):
+    try:
+        return executar(tarefa)
+    finally:
+        # Cada thread tem a própria conexão; fecha ao terminar a tarefa.
+        connections.close_all()
+
+
+class Command(BaseCommand):
+    help = 'Consome a fila de tarefas em segundo plano com um pool de threads.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=2, help='Tarefas executadas em paralelo.')
+        parser.add_argument('--intervalo', type=float, default=1.0, help='Espera (s) quando a fila está vazia.')
+        parser.add_argument('--uma-vez', action='store_true', help='Esvazia a fila e termina.')
+        parser.add_argument(
+            '--recuperar', action='store_true',
+            help='Devolve à fila tarefas que ficaram "Executando" após uma parada do worker.',
+        )
+
+    def handle(self, *args, **options):
+        if options['recuperar']:
+            recuperadas = Tarefa.objects.filter(status='EXECUTANDO').update(status='PENDENTE', iniciada_em=None)
+            self.stdout.write(f'{recuperadas} tarefa(s) devolvida(s) à fila.')
+
+        self.stdout.write(
+            f"Worker iniciado com {options['workers']} thread(s). Tipos: {', '.join(tipos_registrados())}"
+        )
+        em_execucao = set()
+        with ThreadPoolExecutor(max_workers=options['workers'], thread_name_prefix='tarefa') as pool:
+            try:
+                while True:
+                    while len(em_execucao) < options['workers']:
+                        tarefa = reservar_proxima()
+                        if tarefa is None:
+                            break
+                        self.stdout.write(f'Iniciando tarefa #{tarefa.pk} ({tarefa.tipo}).')
+                        em_execucao.add(pool.submit(_executar_em_thread, tarefa))
+
+                    if not em_execucao:
+                        if options['uma_vez']:
+                            break
+                        close_old_connections()
+                        time.sleep(options['intervalo'])
+                        continue
+
+                    concluidas, em_execucao = wait(em_execucao, timeout=options['intervalo'], return_when=FIRST_COMPLETED)
+                    em_execucao = set(em_execucao)
+                    for futuro in concluidas:
+                        tarefa = futuro.result()
+                        self.stdout.write(f'Tarefa #{tarefa.pk} finalizada: {tarefa.get_status_display()}.')
+            except KeyboardInterrupt:
+                self.stdout.write('Encerrando após as tarefas em andamento...')
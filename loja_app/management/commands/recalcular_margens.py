@@ -0,0 +1,32 @@
+from datetime import datetime, timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from loja_app.margens import recalcular_margens
+
+
+def _mes(valor):
+    try:
+        return datetime.strptime(valor, '%Y-%m').date()
+    except ValueError as exc:
+        raise CommandError(f'Mês inválido "{valor}"; use AAAA-MM.') from exc
+
+
+class Command(BaseCommand):
+    help = 'Reconstrói a tabela de margens mensais a partir dos itens vendidos.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--desde', type=_mes, help='Primeiro mês (AAAA-MM).')
+        parser.add_argument('--ate', type=_mes, help='Último mês (AAAA-MM).')
+
+    def handle(self, *args, **options):
+        fim = options['ate']
+        if fim:
+            # Inclui o mês inteiro informado em --ate.
+            proximo = fim.replace(year=fim.year + fim.month // 12, month=fim.month % 12 + 1)
+            fim = proximo - timedelta(days=1)
+
+        with transaction.atomic():
+            total = recalcular_margens(inicio=options['desde'], fim=fim)
+        self.stdout.write(self.style.SUCCESS(f'{total} linhas de margem recalculadas.'))
@@ -0,0 +1,13 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from loja_app.resumo_clientes import recalcular_resumos_clientes
+
+
+class Command(BaseCommand):
+    help = 'Reconstrói os resumos de compras por cliente a partir das vendas (ativas e arquivadas).'
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            total = recalcular_resumos_clientes()
+        self.stdout.write(self.style.SUCCESS(f'{total} resumos de clientes recalculados.'))
@@ -0,0 +1,87 @@
+import gzip
+import re
+from pathlib import Path
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.contrib.staticfiles.storage import staticfiles_storage
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.test import Client, override_settings
+from django.urls import reverse
+
+from loja_app.estaticos import SUFIXOS
+
+
+PAGINAS = [
+    'home', 'dashboard', 'lista_produtos', 'lista_vendas', 'lista_itens_venda',
+    'lista_movimentacoes_estoque', 'relatorio_margens', 'exportar_margens_csv', 'analise_vendas',
+]
+
+ESTATICO = re.compile(r'(?:href|src)="/' + re.escape(settings.STATIC_URL.strip('/')) + r'/([^"?#]+)"')
+
+
+class Command(BaseCommand):
+    help = (
+        'Mostra, por página, os bytes sem compressão e os transferidos com gzip '
+        '(HTML/JSON/CSV e os estáticos pré-comprimidos que a página referencia).'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('paginas', nargs='*', help='Caminhos a medir (padrão: as listagens e relatórios principais).')
+
+    def handle(self, *args, **options):
+        raiz = Path(settings.STATIC_ROOT)
+        if not (raiz / 'staticfiles.json').exists():
+            self.stdout.write(self.style.WARNING(
+                'STATIC_ROOT sem manifest: rode "manage.py collectstatic" para medir os estáticos pré-comprimidos.'
+            ))
+
+        self.stdout.write(f"{'página':<40}{'original':>11}{'enviado':>11}{'economia':>11}")
+        totais = [0, 0]
+        # Usuário temporário: tudo roda numa transação desfeita ao final.
+        with transaction.atomic(), override_settings(ALLOWED_HOSTS=['testserver']):
+            usuario = get_user_model().objects.create_superuser('relatorio-compressao', password=None)
+            cliente = Client(HTTP_ACCEPT_ENCODING='gzip')
+            cliente.force_login(usuario)
+            for caminho in options['paginas'] or [reverse(nome) for nome in PAGINAS]:
+                original, enviado = self._medir_pagina(cliente, caminho, raiz)
+                totais[0] += original
+                totais[1] += enviado
+                self.stdout.write(
+                    f'{caminho[:39]:<40}{original:>11}{enviado:>11}{self._percentual(original, enviado):>11}'
+                )
+            transaction.set_rollback(True)
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Total: {totais[0]} -> {totais[1]} bytes ({self._percentual(*totais)} a menos)'
+        ))
+
+    def _medir_pagina(self, cliente, caminho, raiz):
+        response = cliente.get(caminho)
+        corpo = b''.join(response.streaming_content) if response.streaming else response.content
+        if response.get('Content-Encoding') == 'gzip':
+            enviado, conteudo = len(corpo), gzip.decompress(corpo)
+        else:
+            enviado, conteudo = len(corpo), corpo
+        original = len(conteudo)
+
+        # Estáticos referenciados pela página: original x melhor versão pré-comprimida.
+        for nome in set(ESTATICO.findall(conteudo.decode('utf-8', 'replace'))):
+            # Com DEBUG=True o nome vem sem hash; o arquivo servido em produção é o com hash.
+            arquivo = raiz / staticfiles_storage.stored_name(nome)
+            if not arquivo.exists():
+                arquivo = raiz / nome
+            if not arquivo.exists():
+                continue
+            tamanho = arquivo.stat().st_size
+            comprimidos = [
+                Path(f'{arquivo}{sufixo}').stat().st_size
+                for sufixo in SUFIXOS.values() if Path(f'{arquivo}{sufixo}').exists()
+            ]
+            original += tamanho
+            enviado += min(comprimidos + [tamanho])
+        return original, enviado
+
+    def _percentual(self, original, enviado):
+        return f'{(1 - enviado / original) * 100:.0f}%' if original else '-'
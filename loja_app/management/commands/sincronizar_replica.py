@@ -0,0 +1,47 @@
+import sqlite3
+import time
+from contextlib import closing
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DEFAULT_DB_ALIAS
+
+from loja_app.routers import alias_replica
+
+
+class Command(BaseCommand):
+    help = (
+        'Copia o banco SQLite principal para o arquivo da réplica. '
+        'Faz o papel da replicação em ambiente local.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--intervalo', type=float, default=0,
+            help='Repete a cópia a cada N segundos (0 = copia uma vez).',
+        )
+
+    def handle(self, *args, **options):
+        alias = alias_replica()
+        if not alias:
+            raise CommandError('Nenhuma réplica configurada (defina GESTORPRO_REPLICA_DATABASE_URL).')
+
+        origem = settings.DATABASES[DEFAULT_DB_ALIAS]
+        destino = settings.DATABASES[alias]
+        for banco in (origem, destino):
+            if banco['ENGINE'] != 'django.db.backends.sqlite3':
+                raise CommandError('A cópia local só é suportada entre bancos SQLite.')
+
+        while True:
+            inicio = time.perf_counter()
+            self._copiar(str(origem['NAME']), str(destino['NAME']))
+            duracao = (time.perf_counter() - inicio) * 1000
+            self.stdout.write(f'Réplica atualizada em {duracao:.1f} ms.')
+            if not options['intervalo']:
+                break
+            time.sleep(options['intervalo'])
+
+    def _copiar(self, origem, destino):
+        # A API de backup copia um snapshot consistente mesmo com escritas em andamento.
+        with closing(sqlite3.connect(origem)) as fonte, closing(sqlite3.connect(destino)) as alvo:
+            fonte.backup(alvo)
@@ -0,0 +1,274 @@
+import http.client
+import logging
+import random
+import secrets
+import threading
+import time
+from collections import Counter, defaultdict
+from http.cookies import SimpleCookie
+from urllib.parse import urlencode, urlsplit
+
+from django.contrib.auth import get_user_model
+from django.core.handlers.wsgi import WSGIHandler
+from django.core.management.base import BaseCommand, CommandError
+from django.core.servers.basehttp import ThreadedWSGIServer, WSGIRequestHandler
+from django.db import connections, transaction
+from django.db.models import Sum
+from django.urls import reverse
+
+from loja_app.concorrencia import TRAVAMENTO
+from loja_app.estoque import somar_ao_estoque
+from loja_app.models import Cliente, Estoque, ItensVenda, Loja, MovimentacaoEstoque, Produto, Venda
+
+
+class ServidorSilencioso(WSGIRequestHandler):
+    def log_message(self, *args):
+        pass
+
+
+class Caixa:
+    """Um operador de caixa: sessão HTTP própria, logado como usuário da equipe."""
+
+    def __init__(self, endereco):
+        partes = urlsplit(endereco)
+        self.host, self.porta = partes.hostname, partes.port or 80
+        self.cookies = {}
+
+    def requisitar(self, metodo, caminho, dados=None):
+        conexao = http.client.HTTPConnection(self.host, self.porta, timeout=60)
+        cabecalhos = {'Cookie': '; '.join(f'{nome}={valor}' for nome, valor in self.cookies.items())}
+        corpo = None
+        if dados is not None:
+            corpo = urlencode({**dados, 'csrfmiddlewaretoken': self.cookies.get('csrftoken', '')})
+            cabecalhos['Content-Type'] = 'application/x-www-form-urlencoded'
+        try:
+            conexao.request(metodo, caminho, body=corpo, headers=cabecalhos)
+            resposta = conexao.getresponse()
+            conteudo = resposta.read()
+        finally:
+            conexao.close()
+        for cookie in resposta.headers.get_all('Set-Cookie') or []:
+            for nome, morsel in SimpleCookie(cookie).items():
+                self.cookies[nome] = morsel.value
+        return resposta.status, resposta.getheader('Location', ''), conteudo
+
+    def entrar(self, usuario, senha):
+        self.requisitar('GET', reverse('login'))
+        status, _, _ = self.requisitar('POST', reverse('login'), {'username': usuario, 'password': senha})
+        if status != 302:
+            raise CommandError(f'Login do caixa falhou (HTTP {status}).')
+
+
+class Command(BaseCommand):
+    help = (
+        'Teste de carga do PDV: N caixas simultâneos buscam produtos, registram e cancelam '
+        'vendas contra um servidor HTTP local; mostra vazão, percentis de latência, erros de '
+        'travamento e confere o estoque ao final.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--caixas', type=int, default=8, help='Caixas (threads) simultâneos.')
+        parser.add_argument('--segundos', type=float, default=20)
+        parser.add_argument('--produtos', type=int, default=20, help='Produtos da loja de teste.')
+        parser.add_argument('--estoque', type=int, default=100000, help='Estoque inicial de cada produto.')
+        parser.add_argument('--cancelar', type=float, default=0.1, help='Fração das vendas canceladas em seguida.')
+        parser.add_argument(
+            '--url', default='',
+            help='Servidor já em execução (ex.: http://127.0.0.1:8000) usando o mesmo banco; '
+                 'sem isso sobe um servidor com threads neste processo.',
+        )
+        parser.add_argument('--manter', action='store_true', help='Não apaga a loja, as vendas e os usuários de teste.')
+        parser.add_argument('--semente', type=int, default=42)
+
+    def handle(self, *args, **options):
+        dados = self._preparar(options)
+        servidor = None
+        endereco = options['url'].rstrip('/')
+        if not endereco:
+            servidor = ThreadedWSGIServer(('127.0.0.1', 0), ServidorSilencioso)
+            servidor.set_app(WSGIHandler())
+            threading.Thread(target=servidor.serve_forever, daemon=True).start()
+            endereco = f'http://127.0.0.1:{servidor.server_port}'
+
+        try:
+            self.stdout.write(
+                f"{options['caixas']} caixas por {options['segundos']:.0f}s contra {endereco} "
+                f"({connections['default'].vendor}, loja de teste #{dados['loja'].id})"
+            )
+            # Os erros 500 entram no relatório; o traceback de cada um só atrapalharia a leitura.
+            logging.getLogger('django.request').disabled = True
+            latencias, resultados, duracao = self._executar(endereco, dados, options)
+            self._relatorio(latencias, resultados, duracao)
+            self._conferir_estoque(dados)
+        finally:
+            logging.getLogger('django.request').disabled = False
+            if servidor is not None:
+                servidor.shutdown()
+                servidor.server_close()
+            if not options['manter']:
+                self._limpar(dados)
+
+    @transaction.atomic
+    def _preparar(self, options):
+        sufixo = f'{int(time.time())}-{random.randint(0, 9999)}'
+        senha = secrets.token_urlsafe()
+        usuario = get_user_model().objects.create_user(f'carga-{sufixo}', password=senha, is_staff=True)
+        loja = Loja.objects.create(nome=f'Teste de carga {sufixo}', endereco='-', cnpj_loja=f'carga-{sufixo}')
+        produtos = [
+            Produto.objects.create(nome=f'Carga {n:03d}', preco_compra=5, preco_venda=10 + n, loja=loja)
+            for n in range(options['produtos'])
+        ]
+        somar_ao_estoque({produto.id: options['estoque'] for produto in produtos})
+        clientes = [
+            Cliente.objects.create(nome=f'Caixa {n} {sufixo}') for n in range(options['caixas'])
+        ]
+        return {
+            'usuario': usuario, 'senha': senha, 'loja': loja, 'produtos': produtos,
+            'clientes': clientes, 'estoque': options['estoque'],
+        }
+
+    def _executar(self, endereco, dados, options):
+        self.latencias = defaultdict(list)
+        self.resultados = Counter()
+        self.trava = threading.Lock()
+        self.fim = time.perf_counter() + options['segundos']
+
+        def operar(indice):
+            aleatorio = random.Random(options['semente'] + indice)
+            caixa = Caixa(endereco)
+            caixa.entrar(dados['usuario'].username, dados['senha'])
+            cliente = dados['clientes'][indice]
+            try:
+                self._atender(caixa, cliente, dados, aleatorio, options)
+            finally:
+                connections.close_all()
+
+        threads = [threading.Thread(target=operar, args=(n,)) for n in range(options['caixas'])]
+        inicio = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return self.latencias, self.resultados, time.perf_counter() - inicio
+
+    def _atender(self, caixa, cliente, dados, aleatorio, options):
+        while time.perf_counter() < self.fim:
+            for operacao, medir in self._operacoes(caixa, cliente, dados, aleatorio, options):
+                inicio = time.perf_counter()
+                try:
+                    resultado = medir()
+                except (OSError, http.client.HTTPException):
+                    resultado = 'conexão'
+                decorrido = time.perf_counter() - inicio
+                with self.trava:
+                    self.latencias[operacao].append(decorrido)
+                    self.resultados[operacao, resultado] += 1
+                if resultado != 'ok':
+                    break
+
+    def _operacoes(self, caixa, cliente, dados, aleatorio, options):
+        """Um atendimento: busca, venda e, às vezes, o cancelamento dela."""
+        loja = dados['loja']
+        itens = aleatorio.sample(dados['produtos'], k=min(aleatorio.randint(1, 3), len(dados['produtos'])))
+
+        def buscar():
+            status, _, _ = caixa.requisitar(
+                'GET', f"{reverse('buscar_produtos')}?{urlencode({'loja': loja.id, 'q': 'Carga'})}",
+            )
+            return 'ok' if status == 200 else f'HTTP {status}'
+
+        def registrar():
+            formulario = {
+                'loja': loja.id, 'cliente': cliente.id,
+                'form-TOTAL_FORMS': len(itens), 'form-INITIAL_FORMS': 0,
+                'form-MIN_NUM_FORMS': 1, 'form-MAX_NUM_FORMS': 1000,
+            }
+            for n, produto in enumerate(itens):
+                formulario[f'form-{n}-produto'] = produto.id
+                formulario[f'form-{n}-quantidade'] = aleatorio.randint(1, 3)
+            return self._classificar(*caixa.requisitar('POST', reverse('registrar_venda'), formulario),
+                                     sucesso=reverse('lista_vendas'))
+
+        def cancelar():
+            venda_id = (
+                Venda.objects.filter(cliente=cliente, loja=loja)
+                .order_by('-id').values_list('id', flat=True).first()
+            )
+            if venda_id is None:
+                return 'ok'
+            return self._classificar(*caixa.requisitar('POST', reverse('cancelar_venda', args=[venda_id]), {}),
+                                     sucesso=reverse('lista_vendas'))
+
+        yield 'busca', buscar
+        yield 'venda', registrar
+        if aleatorio.random() < options['cancelar']:
+            yield 'cancelamento', cancelar
+
+    def _classificar(self, status, destino, conteudo, sucesso):
+        if status == 302:
+            return 'ok' if destino.endswith(sucesso) else 'recusada'
+        if TRAVAMENTO.search(conteudo.decode('utf-8', 'replace')):
+            return 'travamento'
+        return f'HTTP {status}'
+
+    def _relatorio(self, latencias, resultados, duracao):
+        self.stdout.write(
+            f"\n{'operação':<14}{'total':>7}{'ok':>7}{'por s':>8}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}{'máx ms':>9}"
+        )
+        for operacao in ('busca', 'venda', 'cancelamento'):
+            tempos = sorted(latencias.get(operacao, []))
+            if not tempos:
+                continue
+            ok = resultados[operacao, 'ok']
+            p50, p95, p99 = (self._percentil(tempos, p) * 1000 for p in (50, 95, 99))
+            self.stdout.write(
+                f'{operacao:<14}{len(tempos):>7}{ok:>7}{ok / duracao:>8.1f}'
+                f'{p50:>9.1f}{p95:>9.1f}{p99:>9.1f}{tempos[-1] * 1000:>9.1f}'
+            )
+
+        falhas = {chave: total for chave, total in resultados.items() if chave[1] != 'ok'}
+        travamentos = sum(total for (_, resultado), total in falhas.items() if resultado == 'travamento')
+        self.stdout.write(f'\nErros de travamento: {travamentos}')
+        for (operacao, resultado), total in sorted(falhas.items()):
+            self.stdout.write(f'  {operacao}: {resultado} x{total}')
+
+    def _percentil(self, ordenados, percentil):
+        return ordenados[min(len(ordenados) - 1, int(len(ordenados) * percentil / 100))]
+
+    def _conferir_estoque(self, dados):
+        """Estoque final = inicial - itens das vendas que ficaram; as movimentações devem bater também."""
+        ids = [produto.id for produto in dados['produtos']]
+        vendidos = dict(
+            ItensVenda.objects.filter(produto_id__in=ids)
+            .values_list('produto_id').annotate(total=Sum('quantidade')).order_by()
+        )
+        movimentado = defaultdict(int)
+        for produto_id, tipo, total in (
+            MovimentacaoEstoque.objects.filter(produto_id__in=ids)
+            .values_list('produto_id', 'tipo').annotate(total=Sum('quantidade')).order_by()
+        ):
+            movimentado[produto_id] += total if tipo == 'ENTRADA' else -total
+        atual = dict(Estoque.objects.filter(produto_id__in=ids).values_list('produto_id', 'quantidade'))
+
+        divergentes = [
+            (produto_id, atual[produto_id], dados['estoque'] - vendidos.get(produto_id, 0))
+            for produto_id in ids
+            if atual[produto_id] != dados['estoque'] - vendidos.get(produto_id, 0)
+            or atual[produto_id] != dados['estoque'] + movimentado[produto_id]
+        ]
+        vendas = Venda.objects.filter(loja=dados['loja']).count()
+        self.stdout.write(f'\nVendas gravadas: {vendas}; unidades vendidas: {sum(vendidos.values())}')
+        if not divergentes:
+            self.stdout.write(self.style.SUCCESS('Estoque consistente com as vendas e movimentações.'))
+            return
+        self.stdout.write(self.style.ERROR(f'Estoque divergente em {len(divergentes)} produto(s):'))
+        for produto_id, quantidade, esperado in divergentes:
+            self.stdout.write(f'  produto #{produto_id}: estoque {quantidade}, esperado {esperado}')
+
+    def _limpar(self, dados):
+        ids = [produto.id for produto in dados['produtos']]
+        MovimentacaoEstoque.objects.filter(produto_id__in=ids).delete()
+        Venda.objects.filter(loja=dados['loja']).delete()
+        dados['loja'].delete()
+        Cliente.objects.filter(pk__in=[cliente.pk for cliente in dados['clientes']]).delete()
+        dados['usuario'].delete()
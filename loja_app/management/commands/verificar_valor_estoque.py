@@ -0,0 +1,37 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from loja_app.models import Categoria, Loja
+from loja_app.valorizacao import recalcular_valor_estoque, verificar_valor_estoque
+
+
+class Command(BaseCommand):
+    help = 'Recalcula o valor do estoque do zero e compara com o agregado mantido por deltas.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--corrigir', action='store_true', help='Reconstrói o agregado se houver divergência.',
+        )
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            divergencias = verificar_valor_estoque()
+            if not divergencias:
+                self.stdout.write(self.style.SUCCESS('Valor do estoque consistente com o estoque atual.'))
+                return
+
+            lojas = dict(Loja.objects.values_list('id', 'nome'))
+            categorias = dict(Categoria.objects.values_list('id', 'nome'))
+            self.stdout.write(self.style.ERROR(f'Valor do estoque divergente em {len(divergencias)} linha(s):'))
+            for loja_id, categoria_id, (quantidade, valor), (esperada, esperado) in divergencias:
+                self.stdout.write(
+                    f'  {lojas.get(loja_id, loja_id)} / {categorias.get(categoria_id, "sem categoria")}: '
+                    f'gravado {quantidade} un. R$ {valor:.2f}, calculado {esperada} un. R$ {esperado:.2f} '
+                    f'(diferença R$ {valor - esperado:.2f})'
+                )
+
+            if not options['corrigir']:
+                # Código de saída diferente de zero: o cron/monitoramento percebe a divergência.
+                raise CommandError('Use --corrigir para reconstruir o agregado.')
+            total = recalcular_valor_estoque()
+        self.stdout.write(self.style.SUCCESS(f'{total} linhas de valor do estoque recalculadas.'))
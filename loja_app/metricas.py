@@ -0,0 +1,252 @@
+"""
+Métricas de operação no formato de texto do Prometheus, sem serviço externo.
+
+Cada processo soma contadores e histogramas em memória e, no máximo a cada
+``METRICAS_INTERVALO_SEGUNDOS``, grava o total num arquivo próprio em
+``METRICAS_DIR``. A view ``/metrics`` (em qualquer worker) grava o próprio
+processo e soma os arquivos de todos. Os arquivos de processos encerrados
+continuam entrando na soma, pois são contadores acumulados. Cada arquivo leva
+``METRICAS_GERACAO``; a coleta apaga os de outra geração, então basta trocá-la
+a cada deploy (os processos novos recomeçam do zero de qualquer forma).
+"""
+import atexit
+import json
+import logging
+import os
+import threading
+import time
+import uuid
+from bisect import bisect_left
+from collections import defaultdict
+from pathlib import Path
+
+from django.conf import settings
+from django.db import transaction
+
+
+logger = logging.getLogger(__name__)
+
+BUCKETS_SEGUNDOS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# nome -> (tipo, ajuda, rótulos, buckets)
+DEFINICOES = {}
+
+
+def _definir(nome, tipo, ajuda, rotulos, buckets=None):
+    DEFINICOES[nome] = (tipo, ajuda, rotulos, buckets)
+    return nome
+
+
+REQUISICAO_SEGUNDOS = _definir(
+    'gestorpro_requisicao_segundos', 'histogram', 'Duração das requisições por view.',
+    ('view', 'metodo'), BUCKETS_SEGUNDOS,
+)
+REQUISICOES = _definir(
+    'gestorpro_requisicoes_total', 'counter', 'Requisições respondidas por view e status.', ('view', 'status'),
+)
+CONSULTAS = _definir(
+    'gestorpro_banco_consultas_total', 'counter', 'Comandos SQL executados por view e banco.', ('view', 'banco'),
+)
+CONSULTAS_SEGUNDOS = _definir(
+    'gestorpro_banco_consultas_segundos_total', 'counter', 'Tempo gasto em comandos SQL por view e banco.',
+    ('view', 'banco'),
+)
+VENDAS_REGISTRADAS = _definir(
+    'gestorpro_vendas_registradas_total', 'counter', 'Vendas gravadas por loja.', ('loja',),
+)
+VENDAS_CANCELADAS = _definir(
+    'gestorpro_vendas_canceladas_total', 'counter', 'Vendas canceladas por loja.', ('loja',),
+)
+MOVIMENTACOES = _definir(
+    'gestorpro_movimentacoes_estoque_total', 'counter', 'Movimentações de estoque lançadas por tipo.', ('tipo',),
+)
+MOVIMENTACOES_UNIDADES = _definir(
+    'gestorpro_movimentacoes_estoque_unidades_total', 'counter', 'Unidades movimentadas por tipo.', ('tipo',),
+)
+RETENTATIVAS = _definir(
+    'gestorpro_retentativas_travamento_total', 'counter',
+    'Transações repetidas por erro de trava no banco, por operação.', ('operacao',),
+)
+TRAVAMENTOS_ESGOTADOS = _definir(
+    'gestorpro_travamentos_esgotados_total', 'counter',
+    'Operações que falharam por trava depois de esgotar as tentativas.', ('operacao',),
+)
+REQUISICOES_LIMITADAS = _definir(
+    'gestorpro_requisicoes_limitadas_total', 'counter',
+    'Requisições recusadas com 429 pelo limite de requisições, por grupo de endpoints.', ('grupo',),
+)
+
+
+class Registro:
+    """Valores do processo atual: contadores e histogramas por ``(nome, rótulos)``."""
+
+    def __init__(self):
+        self._trava = threading.Lock()
+        self._reiniciar()
+
+    def _reiniciar(self):
+        self._pid = os.getpid()
+        self._arquivo = None
+        self._ultima_gravacao = 0.0
+        self._contadores = defaultdict(float)
+        # Histograma: [contagem em cada bucket (não acumulada) + o do +Inf, soma].
+        self._histogramas = {}
+
+    def _no_processo_atual(self):
+        # Depois de um fork o filho recomeça do zero (e em outro arquivo): o que o
+        # pai somou antes do fork continua só no arquivo do pai.
+        if self._pid != os.getpid():
+            self._reiniciar()
+
+    def incrementar(self, nome, valor=1, **rotulos):
+        chave = (nome, tuple(str(rotulos[rotulo]) for rotulo in DEFINICOES[nome][2]))
+        with self._trava:
+            self._no_processo_atual()
+            self._contadores[chave] += valor
+
+    def observar(self, nome, valor, **rotulos):
+        buckets = DEFINICOES[nome][3]
+        chave = (nome, tuple(str(rotulos[rotulo]) for rotulo in DEFINICOES[nome][2]))
+        with self._trava:
+            self._no_processo_atual()
+            histograma = self._histogramas.get(chave)
+            if histograma is None:
+                histograma = self._histogramas[chave] = [[0] * (len(buckets) + 1), 0.0]
+            histograma[0][bisect_left(buckets, valor)] += 1
+            histograma[1] += valor
+
+    def instantaneo(self):
+        with self._trava:
+            self._no_processo_atual()
+            return {
+                'contadores': [[nome, list(rotulos), valor] for (nome, rotulos), valor in self._contadores.items()],
+                'histogramas': [
+                    [nome, list(rotulos), list(contagens), soma]
+                    for (nome, rotulos), (contagens, soma) in self._histogramas.items()
+                ],
+            }
+
+    def gravar(self, forcar=False):
+        """Grava o arquivo do processo (a cada ``METRICAS_INTERVALO_SEGUNDOS``, ou já com ``forcar``)."""
+        agora = time.monotonic()
+        if not forcar and agora - self._ultima_gravacao < settings.METRICAS_INTERVALO_SEGUNDOS:
+            return
+        dados = self.instantaneo()
+        if not dados['contadores'] and not dados['histogramas']:
+            return
+        dados['geracao'] = settings.METRICAS_GERACAO
+        self._ultima_gravacao = agora
+        if self._arquivo is None:
+            self._arquivo = f'{self._pid}-{uuid.uuid4().hex[:8]}.json'
+        try:
+            diretorio = diretorio_metricas()
+            temporario = diretorio / f'.{self._arquivo}.tmp'
+            temporario.write_text(json.dumps(dados), encoding='utf-8')
+            # Troca atômica: quem estiver somando nunca lê um arquivo pela metade.
+            os.replace(temporario, diretorio / self._arquivo)
+        except OSError:
+            logger.exception('Não foi possível gravar as métricas do processo.')
+
+
+registro = Registro()
+atexit.register(registro.gravar, forcar=True)
+
+
+def diretorio_metricas():
+    diretorio = Path(settings.METRICAS_DIR)
+    diretorio.mkdir(parents=True, exist_ok=True)
+    return diretorio
+
+
+def incrementar(nome, valor=1, **rotulos):
+    registro.incrementar(nome, valor, **rotulos)
+
+
+def observar(nome, valor, **rotulos):
+    registro.observar(nome, valor, **rotulos)
+
+
+def incrementar_no_commit(nome, valor=1, using=None, **rotulos):
+    """Conta só se a transação de ``using`` for confirmada (uma venda repetida por trava conta uma vez)."""
+    transaction.on_commit(lambda: registro.incrementar(nome, valor, **rotulos), using=using)
+
+
+def contar_movimentacoes(movimentacoes, using=None):
+    """Conta, no commit de ``using``, as :class:`MovimentacaoEstoque` lançadas (quantidade e unidades por tipo)."""
+    por_tipo = defaultdict(lambda: [0, 0])
+    for movimentacao in movimentacoes:
+        por_tipo[movimentacao.tipo][0] += 1
+        por_tipo[movimentacao.tipo][1] += abs(movimentacao.quantidade)
+
+    def contar():
+        for tipo, (quantidade, unidades) in por_tipo.items():
+            registro.incrementar(MOVIMENTACOES, quantidade, tipo=tipo)
+            registro.incrementar(MOVIMENTACOES_UNIDADES, unidades, tipo=tipo)
+
+    if por_tipo:
+        transaction.on_commit(contar, using=using)
+
+
+def somar_processos():
+    """Contadores e histogramas somados de todos os arquivos do diretório de métricas."""
+    contadores = defaultdict(float)
+    histogramas = {}
+    for arquivo in diretorio_metricas().glob('*.json'):
+        try:
+            dados = json.loads(arquivo.read_text(encoding='utf-8'))
+        except (OSError, ValueError):
+            continue  # apagado ou trocado durante a leitura
+        if dados.get('geracao', '') != settings.METRICAS_GERACAO:
+            # De um deploy anterior: nenhum processo daquela geração continua somando.
+            arquivo.unlink(missing_ok=True)
+            continue
+        for nome, rotulos, valor in dados.get('contadores', []):
+            if nome in DEFINICOES:
+                contadores[(nome, tuple(rotulos))] += valor
+        for nome, rotulos, contagens, soma in dados.get('histogramas', []):
+            if nome not in DEFINICOES or len(contagens) != len(DEFINICOES[nome][3]) + 1:
+                continue  # buckets de outra versão do código
+            total = histogramas.setdefault((nome, tuple(rotulos)), [[0] * len(contagens), 0.0])
+            total[0] = [a + b for a, b in zip(total[0], contagens)]
+            total[1] += soma
+    return contadores, histogramas
+
+
+def _escapar(valor):
+    return valor.replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _rotulos(nomes, valores, extra=()):
+    pares = [*zip(nomes, valores), *extra]
+    if not pares:
+        return ''
+    return '{' + ','.join(f'{nome}="{_escapar(valor)}"' for nome, valor in pares) + '}'
+
+
+def _numero(valor):
+    return str(int(valor)) if float(valor).is_integer() else repr(float(valor))
+
+
+def exportar():
+    """Texto no formato de exposição do Prometheus (0.0.4) com a soma de todos os processos."""
+    registro.gravar(forcar=True)
+    contadores, histogramas = somar_processos()
+    linhas = []
+    for nome, (tipo, ajuda, nomes_rotulos, buckets) in DEFINICOES.items():
+        linhas.append(f'# HELP {nome} {ajuda}')
+        linhas.append(f'# TYPE {nome} {tipo}')
+        if tipo == 'counter':
+            for (chave_nome, rotulos), valor in sorted(contadores.items()):
+                if chave_nome == nome:
+                    linhas.append(f'{nome}{_rotulos(nomes_rotulos, rotulos)} {_numero(valor)}')
+            continue
+        for (chave_nome, rotulos), (contagens, soma) in sorted(histogramas.items()):
+            if chave_nome != nome:
+                continue
+            acumulado = 0
+            for limite, contagem in zip((*map(_numero, buckets), '+Inf'), contagens):
+                acumulado += contagem
+                linhas.append(f'{nome}_bucket{_rotulos(nomes_rotulos, rotulos, [("le", limite)])} {acumulado}')
+            linhas.append(f'{nome}_sum{_rotulos(nomes_rotulos, rotulos)} {_numero(soma)}')
+            linhas.append(f'{nome}_count{_rotulos(nomes_rotulos, rotulos)} {acumulado}')
+    return '\n'.join(linhas) + '\n'
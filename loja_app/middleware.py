@@ -0,0 +1,155 @@
+import functools
+import time
+from collections import defaultdict
+from contextlib import ExitStack, contextmanager
+
+from django.conf import settings
+from django.db import connections
+
+from . import metricas
+from .consultas_lentas import medir_consultas_lentas
+from .routers import _alias_leitura, alias_replica
+
+
+CHAVE_ULTIMA_ESCRITA = '_gestorpro_ultima_escrita'
+
+
+class RoteamentoLeituraMiddleware:
+    """Decide por requisição se as leituras podem ir para a réplica.
+
+    Views marcadas com ``leitura_em_replica`` leem da réplica, exceto durante
+    ``REPLICA_STICKY_SEGUNDOS`` após uma escrita da mesma sessão, para que o
+    usuário sempre veja o que acabou de gravar.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        try:
+            response = self.get_response(request)
+        finally:
+            token = getattr(request, '_token_alias_leitura', None)
+            if token is not None:
+                _alias_leitura.reset(token)
+
+        if request.method not in ('GET', 'HEAD', 'OPTIONS', 'TRACE') and hasattr(request, 'session'):
+            request.session[CHAVE_ULTIMA_ESCRITA] = time.time()
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        alias = alias_replica()
+        if not alias or not getattr(view_func, 'leitura_em_replica', False):
+            return None
+        if self._escreveu_recentemente(request):
+            return None
+        request._token_alias_leitura = _alias_leitura.set(alias)
+        return None
+
+    def _escreveu_recentemente(self, request):
+        session = getattr(request, 'session', None)
+        if session is None:
+            return False
+        ultima_escrita = session.get(CHAVE_ULTIMA_ESCRITA)
+        if ultima_escrita is None:
+            return False
+        return time.time() - ultima_escrita < settings.REPLICA_STICKY_SEGUNDOS
+
+
+def _nome_da_view(request):
+    resolver_match = getattr(request, 'resolver_match', None)
+    return resolver_match.view_name if resolver_match else 'nao_resolvida'
+
+
+def _durante_o_envio(response, medir, ao_terminar=None):
+    """Mantém ``medir()`` ativo enquanto o servidor percorre o corpo de uma resposta em streaming.
+
+    O corpo (e as consultas que ele faz) só é gerado depois que a view e os
+    middlewares já retornaram.
+    """
+    conteudo = response.streaming_content
+
+    def enviar():
+        try:
+            with medir():
+                yield from conteudo
+        finally:
+            if ao_terminar is not None:
+                ao_terminar()
+
+    response.streaming_content = enviar()
+
+
+@contextmanager
+def _medir_consultas(totais):
+    with ExitStack() as pilha:
+        for conexao in connections.all():
+            pilha.enter_context(conexao.execute_wrapper(_MedidorConsultas(conexao.alias, totais)))
+        yield
+
+
+class _MedidorConsultas:
+    """``execute_wrapper`` que soma, por banco, quantos comandos rodaram e quanto tempo levaram."""
+
+    def __init__(self, alias, totais):
+        self.alias = alias
+        self.totais = totais
+
+    def __call__(self, execute, sql, params, many, context):
+        inicio = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            total = self.totais[self.alias]
+            total[0] += 1
+            total[1] += time.perf_counter() - inicio
+
+
+class MetricasMiddleware:
+    """Mede cada requisição (duração, status, consultas por banco) em nome da view resolvida.
+
+    Fica no topo de ``MIDDLEWARE`` para que a duração inclua os demais middlewares.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        consultas = defaultdict(lambda: [0, 0.0])
+        inicio = time.perf_counter()
+        with _medir_consultas(consultas):
+            response = self.get_response(request)
+        if response.streaming:
+            # Registra quando o corpo termina de ser enviado, com as consultas feitas durante o envio.
+            _durante_o_envio(
+                response, lambda: _medir_consultas(consultas),
+                ao_terminar=lambda: self._registrar(request, response, consultas, inicio),
+            )
+        else:
+            self._registrar(request, response, consultas, inicio)
+        return response
+
+    def _registrar(self, request, response, consultas, inicio):
+        duracao = time.perf_counter() - inicio
+        view = _nome_da_view(request)
+        metricas.observar(metricas.REQUISICAO_SEGUNDOS, duracao, view=view, metodo=request.method)
+        metricas.incrementar(metricas.REQUISICOES, view=view, status=response.status_code)
+        for alias, (quantidade, segundos) in consultas.items():
+            metricas.incrementar(metricas.CONSULTAS, quantidade, view=view, banco=alias)
+            metricas.incrementar(metricas.CONSULTAS_SEGUNDOS, segundos, view=view, banco=alias)
+        metricas.registro.gravar()
+
+
+class ConsultasLentasMiddleware:
+    """Registra as consultas acima de ``CONSULTAS_LENTAS_MS`` em nome da view (ver loja_app/consultas_lentas.py)."""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        origem = functools.partial(_nome_da_view, request)
+        with medir_consultas_lentas(origem):
+            response = self.get_response(request)
+        if response.streaming:
+            _durante_o_envio(response, lambda: medir_consultas_lentas(origem))
+        return response
@@ -0,0 +1,47 @@
+# Generated by Django 5.2.6 on 2026-10-19 14:46
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def preencher_custo_unitario(apps, schema_editor):
+    # Vendas antigas não guardaram o custo; o preço de compra atual é a melhor aproximação.
+    ItensVenda = apps.get_model('loja_app', 'ItensVenda')
+    Produto = apps.get_model('loja_app', 'Produto')
+    ItensVenda.objects.update(
+        custo_unitario=models.Subquery(
+            Produto.objects.filter(pk=models.OuterRef('produto_id')).values('preco_compra')[:1]
+        )
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('loja_app', '0010_cliente_user'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='itensvenda',
+            name='custo_unitario',
+            field=models.DecimalField(decimal_places=2, default=0, max_digits=10, verbose_name='Custo Unitário'),
+        ),
+        migrations.RunPython(preencher_custo_unitario, migrations.RunPython.noop),
+        migrations.CreateModel(
+            name='MargemMensal',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('mes', models.DateField(verbose_name='Mês')),
+                ('quantidade', models.IntegerField(default=0)),
+                ('receita', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('custo', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('categoria', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, to='loja_app.categoria')),
+                ('loja', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='loja_app.loja')),
+                ('produto', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='loja_app.produto')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('mes', 'loja', 'produto'), name='margem_mensal_unica')],
+            },
+        ),
+    ]
@@ -0,0 +1,37 @@
+# Generated by Django 5.2.6 on 2026-10-19 14:49
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('loja_app', '0011_itensvenda_custo_unitario_margemmensal'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Tarefa',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('tipo', models.CharField(max_length=100)),
+                ('parametros', models.JSONField(blank=True, default=dict)),
+                ('status', models.CharField(choices=[('PENDENTE', 'Pendente'), ('EXECUTANDO', 'Executando'), ('CONCLUIDA', 'Concluída'), ('FALHOU', 'Falhou')], default='PENDENTE', max_length=10)),
+                ('progresso', models.PositiveSmallIntegerField(default=0)),
+                ('mensagem', models.CharField(blank=True, default='', max_length=255)),
+                ('erro', models.TextField(blank=True, default='')),
+                ('arquivo_resultado', models.CharField(blank=True, default='', max_length=255)),
+                ('criada_em', models.DateTimeField(default=django.utils.timezone.now)),
+                ('iniciada_em', models.DateTimeField(blank=True, null=True)),
+                ('concluida_em', models.DateTimeField(blank=True, null=True)),
+                ('criado_por', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['status', 'criada_em'], name='loja_app_ta_status_7e0c73_idx')],
+            },
+        ),
+    ]
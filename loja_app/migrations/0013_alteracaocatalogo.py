@@ -0,0 +1,28 @@
+# Generated by Django 5.2.6 on 2026-10-19 14:50
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('loja_app', '0012_tarefa'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AlteracaoCatalogo',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('produto_id', models.BigIntegerField()),
+                ('operacao', models.CharField(choices=[('INSERT', 'Inclusão'), ('UPDATE', 'Alteração'), ('DELETE', 'Exclusão')], max_length=6)),
+                ('dados', models.JSONField(blank=True, default=dict)),
+                ('criada_em', models.DateTimeField(auto_now_add=True)),
+                ('loja', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='loja_app.loja')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['loja', 'id'], name='loja_app_al_loja_id_7002ea_idx')],
+            },
+        ),
+    ]
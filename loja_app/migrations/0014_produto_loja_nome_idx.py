@@ -0,0 +1,17 @@
+# Generated by Django 5.2.6 on 2026-10-19 14:52
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('loja_app', '0013_alteracaocatalogo'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='produto',
+            index=models.Index(fields=['loja', 'nome'], name='loja_app_pr_loja_id_d94129_idx'),
+        ),
+    ]
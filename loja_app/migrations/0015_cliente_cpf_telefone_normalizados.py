@@ -0,0 +1,37 @@
+# Generated by Django 5.2.6 on 2026-10-19 14:53
+
+from django.db import migrations, models
+
+
+def normalizar_documentos(apps, schema_editor):
+    Cliente = apps.get_model('loja_app', 'Cliente')
+
+    def digitos(valor):
+        return ''.join(caractere for caractere in (valor or '') if caractere.isdigit())
+
+    clientes = list(Cliente.objects.only('id', 'cpf', 'telefone'))
+    for cliente in clientes:
+        cliente.cpf_normalizado = digitos(cliente.cpf)
+        cliente.telefone_normalizado = digitos(cliente.telefone)
+    Cliente.objects.bulk_update(clientes, ['cpf_normalizado', 'telefone_normalizado'], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('loja_app', '0014_produto_loja_nome_idx'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='cliente',
+            name='cpf_normalizado',
+            field=models.CharField(blank=True, db_index=True, default='', editable=False, max_length=14),
+        ),
+        migrations.AddField(
+            model_name='cliente',
+            name='telefone_normalizado',
+            field=models.CharField(blank=True, db_index=True, default='', editable=False, max_length=15),
+        ),
+        migrations.RunPython(normalizar_documentos, migrations.RunPython.noop),
+    ]
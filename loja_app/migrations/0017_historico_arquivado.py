@@ -0,0 +1,48 @@
+# Generated by Django 5.2.6 on 2026-10-19 15:01
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('loja_app', '0015_cliente_cpf_telefone_normalizados'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MovimentacaoArquivada',
+            fields=[
+                ('id', models.BigIntegerField(primary_key=True, serialize=False)),
+                ('quantidade', models.IntegerField()),
+                ('tipo', models.CharField(choices=[('ENTRADA', 'Entrada'), ('SAIDA', 'Saída')], max_length=7)),
+                ('data', models.DateTimeField(db_index=True)),
+                ('descricao', models.CharField(blank=True, max_length=255, null=True)),
+                ('produto', models.ForeignKey(db_constraint=False, on_delete=django.db.models.deletion.DO_NOTHING, related_name='+', to='loja_app.produto')),
+            ],
+        ),
+        migrations.CreateModel(
+            name='VendaArquivada',
+            fields=[
+                ('id', models.BigIntegerField(primary_key=True, serialize=False)),
+                ('data_venda', models.DateTimeField(db_index=True)),
+                ('valor_total', models.DecimalField(decimal_places=2, max_digits=10)),
+                ('status', models.CharField(choices=[('CONCLUIDA', 'Concluída'), ('CANCELADA', 'Cancelada')], max_length=10)),
+                ('arquivada_em', models.DateTimeField(auto_now_add=True)),
+                ('cliente', models.ForeignKey(blank=True, db_constraint=False, null=True, on_delete=django.db.models.deletion.DO_NOTHING, related_name='+', to='loja_app.cliente')),
+                ('loja', models.ForeignKey(db_constraint=False, on_delete=django.db.models.deletion.DO_NOTHING, related_name='+', to='loja_app.loja')),
+            ],
+        ),
+        migrations.CreateModel(
+            name='ItemVendaArquivado',
+            fields=[
+                ('id', models.BigIntegerField(primary_key=True, serialize=False)),
+                ('quantidade', models.IntegerField()),
+                ('preco_unitario', models.DecimalField(decimal_places=2, max_digits=10)),
+                ('custo_unitario', models.DecimalField(decimal_places=2, max_digits=10)),
+                ('produto', models.ForeignKey(db_constraint=False, on_delete=django.db.models.deletion.DO_NOTHING, related_name='+', to='loja_app.produto')),
+                ('venda', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='itens', to='loja_app.vendaarquivada')),
+            ],
+        ),
+    ]
@@ -0,0 +1,112 @@
+# Generated by Django 5.2.6 on 2026-10-19 15:39
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def preencher_resumos(apps, schema_editor):
+    # Mesmo cálculo de recalcular_resumos_clientes, a partir das vendas deste banco.
+    Venda = apps.get_model('loja_app', 'Venda')
+    VendaArquivada = apps.get_model('loja_app', 'VendaArquivada')
+    ResumoCliente = apps.get_model('loja_app', 'ResumoCliente')
+    ResumoClienteLoja = apps.get_model('loja_app', 'ResumoClienteLoja')
+
+    por_loja = {}
+    for modelo in (Venda, VendaArquivada):
+        linhas = (
+            modelo.objects.filter(cliente__isnull=False, status='CONCLUIDA')
+            .values_list('cliente_id', 'loja_id')
+            .annotate(
+                quantidade=models.Count('id'), total=models.Sum('valor_total'),
+                primeira=models.Min('data_venda'), ultima=models.Max('data_venda'),
+            )
+            .order_by()
+        )
+        for cliente_id, loja_id, quantidade, total, primeira, ultima in linhas:
+            acumulado = por_loja.get((cliente_id, loja_id))
+            if acumulado is None:
+                por_loja[cliente_id, loja_id] = [quantidade, total, primeira, ultima]
+            else:
+                acumulado[0] += quantidade
+                acumulado[1] += total
+                acumulado[2] = min(acumulado[2], primeira)
+                acumulado[3] = max(acumulado[3], ultima)
+
+    resumos = {}
+    for (cliente_id, loja_id), (quantidade, total, primeira, ultima) in por_loja.items():
+        resumo = resumos.get(cliente_id)
+        if resumo is None:
+            resumos[cliente_id] = ResumoCliente(
+                cliente_id=cliente_id, quantidade_compras=quantidade, total_gasto=total,
+                primeira_compra=primeira, ultima_compra=ultima, loja_favorita_id=loja_id,
+            )
+            continue
+        favorita = por_loja[cliente_id, resumo.loja_favorita_id]
+        if (quantidade, total) > (favorita[0], favorita[1]):
+            resumo.loja_favorita_id = loja_id
+        resumo.quantidade_compras += quantidade
+        resumo.total_gasto += total
+        resumo.primeira_compra = min(resumo.primeira_compra, primeira)
+        resumo.ultima_compra = max(resumo.ultima_compra, ultima)
+
+    ResumoCliente.objects.bulk_create(resumos.values(), batch_size=1000)
+    ResumoClienteLoja.objects.bulk_create([
+        ResumoClienteLoja(cliente_id=cliente_id, loja_id=loja_id, quantidade_compras=quantidade, total_gasto=total)
+        for (cliente_id, loja_id), (quantidade, total, _, _) in por_loja.items()
+    ], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('loja_app', '0017_historico_arquivado'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ResumoCliente',
+            fields=[
+                ('cliente', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='resumo', serialize=False, to='loja_app.cliente')),
+                ('quantidade_compras', models.IntegerField(default=0)),
+                ('total_gasto', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('primeira_compra', models.DateTimeField(blank=True, null=True)),
+                ('ultima_compra', models.DateTimeField(blank=True, null=True)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='ResumoClienteLoja',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('quantidade_compras', models.IntegerField(default=0)),
+                ('total_gasto', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='venda',
+            index=models.Index(fields=['cliente', '-data_venda', '-id'], name='venda_cliente_data_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='vendaarquivada',
+            index=models.Index(fields=['cliente', '-data_venda', '-id'], name='venda_arq_cliente_data_idx'),
+        ),
+        migrations.AddField(
+            model_name='resumocliente',
+            name='loja_favorita',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='loja_app.loja'),
+        ),
+        migrations.AddField(
+            model_name='resumoclienteloja',
+            name='cliente',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='resumos_por_loja', to='loja_app.cliente'),
+        ),
+        migrations.AddField(
+            model_name='resumoclienteloja',
+            name='loja',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='loja_app.loja'),
+        ),
+        migrations.AddConstraint(
+            model_name='resumoclienteloja',
+            constraint=models.UniqueConstraint(fields=('cliente', 'loja'), name='resumo_cliente_loja_unico'),
+        ),
+        migrations.RunPython(preencher_resumos, migrations.RunPython.noop),
+    ]
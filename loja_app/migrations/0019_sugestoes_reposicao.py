@@ -0,0 +1,31 @@
+# Generated by Django 5.2.6 on 2026-10-19 15:43
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('loja_app', '0018_resumo_clientes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SugestaoReposicao',
+            fields=[
+                ('produto', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='sugestao', serialize=False, to='loja_app.produto')),
+                ('media_diaria', models.FloatField(verbose_name='Média diária')),
+                ('tendencia', models.FloatField(help_text='Variação da demanda diária por dia.')),
+                ('estoque', models.IntegerField()),
+                ('dias_cobertura', models.FloatField(blank=True, null=True, verbose_name='Dias de cobertura')),
+                ('quantidade_sugerida', models.IntegerField(verbose_name='Quantidade sugerida')),
+                ('calculado_em', models.DateTimeField()),
+                ('fornecedor', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='loja_app.fornecedor')),
+                ('loja', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='loja_app.loja')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['fornecedor', 'loja'], name='loja_app_su_fornece_6d1c73_idx')],
+            },
+        ),
+    ]
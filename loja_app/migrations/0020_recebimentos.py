@@ -0,0 +1,38 @@
+# Generated by Django 5.2.6 on 2026-10-19 15:48
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('loja_app', '0019_sugestoes_reposicao'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Recebimento',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('numero_nota', models.CharField(blank=True, default='', max_length=60, verbose_name='Número da Nota')),
+                ('data', models.DateTimeField(default=django.utils.timezone.now)),
+                ('criado_por', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, to=settings.AUTH_USER_MODEL)),
+                ('fornecedor', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, to='loja_app.fornecedor')),
+                ('loja', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='loja_app.loja')),
+            ],
+        ),
+        migrations.CreateModel(
+            name='ItemRecebimento',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('quantidade', models.IntegerField()),
+                ('preco_compra', models.DecimalField(blank=True, decimal_places=2, max_digits=10, null=True, verbose_name='Preço de Compra')),
+                ('produto', models.ForeignKey(on_delete=django.db.models.deletion.PROTECT, to='loja_app.produto')),
+                ('recebimento', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='itens', to='loja_app.recebimento')),
+            ],
+        ),
+    ]
@@ -0,0 +1,42 @@
+# Generated by Django 5.2.6 on 2026-10-19 15:51
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('loja_app', '0020_recebimentos'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Inventario',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('status', models.CharField(choices=[('PENDENTE', 'Pendente'), ('LANCADO', 'Lançado')], default='PENDENTE', max_length=10)),
+                ('total_itens', models.IntegerField(default=0)),
+                ('total_ajustes', models.IntegerField(default=0)),
+                ('criado_em', models.DateTimeField(default=django.utils.timezone.now)),
+                ('lancado_em', models.DateTimeField(blank=True, null=True)),
+                ('criado_por', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, to=settings.AUTH_USER_MODEL)),
+                ('loja', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='loja_app.loja')),
+            ],
+        ),
+        migrations.CreateModel(
+            name='ItemInventario',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('quantidade_contada', models.IntegerField(verbose_name='Quantidade Contada')),
+                ('inventario', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='itens', to='loja_app.inventario')),
+                ('produto', models.ForeignKey(on_delete=django.db.models.deletion.PROTECT, to='loja_app.produto')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('inventario', 'produto'), name='item_inventario_unico')],
+            },
+        ),
+    ]
@@ -0,0 +1,21 @@
+# Generated by Django 5.2.6 on 2026-10-19 16:08
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('loja_app', '0021_inventarios'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='movimentacaoestoque',
+            index=models.Index(fields=['data'], name='movimentacao_data_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='venda',
+            index=models.Index(fields=['data_venda'], name='venda_data_idx'),
+        ),
+    ]
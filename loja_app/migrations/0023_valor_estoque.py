@@ -0,0 +1,50 @@
+# Generated by Django 5.2.6 on 2026-10-19 16:16
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def preencher_valor_estoque(apps, schema_editor):
+    # Ponto de partida: o estoque atual a preço de compra; daqui em diante o agregado é mantido por deltas.
+    Estoque = apps.get_model('loja_app', 'Estoque')
+    ValorEstoque = apps.get_model('loja_app', 'ValorEstoque')
+    totais = (
+        Estoque.objects.values_list('produto__loja_id', 'produto__categoria_id')
+        .annotate(
+            total_quantidade=models.Sum('quantidade'),
+            total_valor=models.Sum(
+                models.ExpressionWrapper(
+                    models.F('quantidade') * models.F('produto__preco_compra'),
+                    output_field=models.DecimalField(max_digits=16, decimal_places=2),
+                )
+            ),
+        )
+        .order_by()
+    )
+    ValorEstoque.objects.bulk_create([
+        ValorEstoque(loja_id=loja_id, categoria_id=categoria_id, quantidade=quantidade, valor=valor)
+        for loja_id, categoria_id, quantidade, valor in totais
+    ], batch_size=500)
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('loja_app', '0022_indices_de_data'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ValorEstoque',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('quantidade', models.BigIntegerField(default=0)),
+                ('valor', models.DecimalField(decimal_places=2, default=0, max_digits=16)),
+                ('categoria', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='+', to='loja_app.categoria')),
+                ('loja', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='loja_app.loja')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(condition=models.Q(('categoria__isnull', False)), fields=('loja', 'categoria'), name='valor_estoque_unico'), models.UniqueConstraint(condition=models.Q(('categoria__isnull', True)), fields=('loja',), name='valor_estoque_sem_categoria_unico')],
+            },
+        ),
+        migrations.RunPython(preencher_valor_estoque, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.6 on 2026-10-19 16:31
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('loja_app', '0023_valor_estoque'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='iteminventario',
+            name='quantidade_sistema',
+            field=models.IntegerField(blank=True, null=True, verbose_name='Quantidade no Sistema'),
+        ),
+    ]
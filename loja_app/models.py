@@ -5,6 +5,10 @@ from django.dispatch import receiver
 from django.utils import timezone
 from django.conf import settings
 
+def somente_digitos(valor):
+    return ''.join(caractere for caractere in (valor or '') if caractere.isdigit())
+
+
 class Loja(models.Model):
     nome = models.CharField(max_length=100, verbose_name="Nome da Loja")
     endereco = models.CharField(max_length=200, verbose_name="Endereço")
@@ -48,6 +52,21 @@ class Cliente(models.Model):
     numero = models.CharField(max_length=10, verbose_name="Número", blank=True, null=True)
     bairro = models.CharField(max_length=100, verbose_name="Bairro", blank=True, null=True)
     estado = models.CharField(max_length=50, verbose_name="Estado", blank=True, null=True)
+    # Só dígitos, indexados para a busca por CPF/telefone no caixa.
+    cpf_normalizado = models.CharField(max_length=14, blank=True, default='', db_index=True, editable=False)
+    telefone_normalizado = models.CharField(max_length=15, blank=True, default='', db_index=True, editable=False)
+
+    CAMPOS_NORMALIZADOS = {'cpf': 'cpf_normalizado', 'telefone': 'telefone_normalizado'}
+
+    def save(self, *args, **kwargs):
+        self.cpf_normalizado = somente_digitos(self.cpf)
+        self.telefone_normalizado = somente_digitos(self.telefone)
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None:
+            kwargs['update_fields'] = set(update_fields) | {
+                normalizado for campo, normalizado in self.CAMPOS_NORMALIZADOS.items() if campo in update_fields
+            }
+        super().save(*args, **kwargs)
 
     def __str__(self):
         return self.nome
@@ -61,6 +80,11 @@ class Produto(models.Model):
     fornecedor = models.ForeignKey(Fornecedor, on_delete=models.SET_NULL, null=True, blank=True)
     loja = models.ForeignKey(Loja, on_delete=models.CASCADE)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['loja', 'nome']),
+        ]
+
     def __str__(self):
         return self.nome
 
@@ -88,6 +112,12 @@ class MovimentacaoEstoque(models.Model):
     data = models.DateTimeField(auto_now_add=True)
     descricao = models.CharField(max_length=255, blank=True, null=True)
 
+    class Meta:
+        indexes = [
+            # Filtro por período (histórico, arquivamento, hierarquia de datas do admin).
+            models.Index(fields=['data'], name='movimentacao_data_idx'),
+        ]
+
     def __str__(self):
         return f"{self.tipo} de {self.quantidade} em {self.produto.nome}"
 
@@ -102,6 +132,14 @@ class Venda(models.Model):
     valor_total = models.DecimalField(max_digits=10, decimal_places=2, default=0)
     status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='CONCLUIDA') # <-- CAMPO ADICIONADO
 
+    class Meta:
+        indexes = [
+            # Histórico de compras do cliente paginado por (data, id).
+            models.Index(fields=['cliente', '-data_venda', '-id'], name='venda_cliente_data_idx'),
+            # Filtro por período sem cliente (arquivamento, hierarquia de datas do admin).
+            models.Index(fields=['data_venda'], name='venda_data_idx'),
+        ]
+
     def __str__(self):
         return f"Venda #{self.id} - Status: {self.get_status_display()}"
 
@@ -110,6 +148,280 @@ class ItensVenda(models.Model):
     produto = models.ForeignKey(Produto, on_delete=models.PROTECT)
     quantidade = models.IntegerField()
     preco_unitario = models.DecimalField(max_digits=10, decimal_places=2)
+    # Custo do produto no momento da venda; preco_compra pode mudar depois.
+    custo_unitario = models.DecimalField(max_digits=10, decimal_places=2, default=0, verbose_name="Custo Unitário")
+
+    def __str__(self):
+        return f"{self.quantidade}x {self.produto.nome}"
+
+
+class MargemMensal(models.Model):
+    """Agregado materializado de receita e custo por mês/loja/produto."""
+
+    mes = models.DateField(verbose_name="Mês")
+    loja = models.ForeignKey(Loja, on_delete=models.CASCADE)
+    categoria = models.ForeignKey(Categoria, on_delete=models.SET_NULL, null=True, blank=True)
+    produto = models.ForeignKey(Produto, on_delete=models.CASCADE)
+    quantidade = models.IntegerField(default=0)
+    receita = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    custo = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['mes', 'loja', 'produto'], name='margem_mensal_unica'),
+        ]
+
+    @property
+    def margem(self):
+        return self.receita - self.custo
+
+    def __str__(self):
+        return f"Margem de {self.produto.nome} em {self.mes:%m/%Y}"
+
+
+class ResumoCliente(models.Model):
+    """Totais de compras do cliente, atualizados a cada venda registrada ou cancelada."""
+
+    cliente = models.OneToOneField(Cliente, on_delete=models.CASCADE, primary_key=True, related_name='resumo')
+    quantidade_compras = models.IntegerField(default=0)
+    total_gasto = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    primeira_compra = models.DateTimeField(null=True, blank=True)
+    ultima_compra = models.DateTimeField(null=True, blank=True)
+    loja_favorita = models.ForeignKey(Loja, on_delete=models.SET_NULL, null=True, blank=True, related_name='+')
+
+    @property
+    def ticket_medio(self):
+        return self.total_gasto / self.quantidade_compras if self.quantidade_compras else 0
 
     def __str__(self):
-        return f"{self.quantidade}x {self.produto.nome}"
\ No newline at end of file
+        return f"Resumo de compras de {self.cliente.nome}"
+
+
+class ResumoClienteLoja(models.Model):
+    """Compras do cliente por loja; define a loja favorita do :class:`ResumoCliente`."""
+
+    cliente = models.ForeignKey(Cliente, on_delete=models.CASCADE, related_name='resumos_por_loja')
+    loja = models.ForeignKey(Loja, on_delete=models.CASCADE, related_name='+')
+    quantidade_compras = models.IntegerField(default=0)
+    total_gasto = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['cliente', 'loja'], name='resumo_cliente_loja_unico'),
+        ]
+
+
+class ValorEstoque(models.Model):
+    """Estoque a preço de custo por loja e categoria, atualizado a cada movimentação e troca de preço."""
+
+    loja = models.ForeignKey(Loja, on_delete=models.CASCADE, related_name='+')
+    categoria = models.ForeignKey(Categoria, on_delete=models.CASCADE, null=True, blank=True, related_name='+')
+    quantidade = models.BigIntegerField(default=0)
+    valor = models.DecimalField(max_digits=16, decimal_places=2, default=0)
+
+    class Meta:
+        constraints = [
+            # NULL não repete em UNIQUE: a linha "sem categoria" precisa da sua própria restrição.
+            models.UniqueConstraint(
+                fields=['loja', 'categoria'], condition=models.Q(categoria__isnull=False), name='valor_estoque_unico',
+            ),
+            models.UniqueConstraint(
+                fields=['loja'], condition=models.Q(categoria__isnull=True), name='valor_estoque_sem_categoria_unico',
+            ),
+        ]
+
+    def __str__(self):
+        return f"Valor do estoque de {self.loja.nome}"
+
+
+class SugestaoReposicao(models.Model):
+    """Previsão de demanda e quantidade sugerida de compra, gravada pelo cálculo de reposição."""
+
+    produto = models.OneToOneField(Produto, on_delete=models.CASCADE, primary_key=True, related_name='sugestao')
+    loja = models.ForeignKey(Loja, on_delete=models.CASCADE, related_name='+')
+    fornecedor = models.ForeignKey(Fornecedor, on_delete=models.SET_NULL, null=True, blank=True, related_name='+')
+    media_diaria = models.FloatField(verbose_name="Média diária")
+    tendencia = models.FloatField(help_text="Variação da demanda diária por dia.")
+    estoque = models.IntegerField()
+    dias_cobertura = models.FloatField(null=True, blank=True, verbose_name="Dias de cobertura")
+    quantidade_sugerida = models.IntegerField(verbose_name="Quantidade sugerida")
+    calculado_em = models.DateTimeField()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['fornecedor', 'loja']),
+        ]
+
+    def __str__(self):
+        return f"Sugestão de compra de {self.produto.nome}"
+
+
+class Recebimento(models.Model):
+    """Entrega de mercadorias de um fornecedor numa loja, lançada no estoque de uma vez."""
+
+    fornecedor = models.ForeignKey(Fornecedor, on_delete=models.SET_NULL, null=True, blank=True)
+    loja = models.ForeignKey(Loja, on_delete=models.CASCADE)
+    numero_nota = models.CharField(max_length=60, blank=True, default='', verbose_name="Número da Nota")
+    data = models.DateTimeField(default=timezone.now)
+    criado_por = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.SET_NULL, null=True, blank=True)
+
+    def __str__(self):
+        return f"Recebimento #{self.id}"
+
+
+class ItemRecebimento(models.Model):
+    recebimento = models.ForeignKey(Recebimento, related_name='itens', on_delete=models.CASCADE)
+    produto = models.ForeignKey(Produto, on_delete=models.PROTECT)
+    quantidade = models.IntegerField()
+    # Novo preço de compra informado na nota; vazio mantém o preço do produto.
+    preco_compra = models.DecimalField(
+        max_digits=10, decimal_places=2, null=True, blank=True, verbose_name="Preço de Compra",
+    )
+
+    def __str__(self):
+        return f"{self.quantidade}x {self.produto.nome}"
+
+
+class Inventario(models.Model):
+    """Contagem física do estoque de uma loja; as diferenças entram como ajustes de uma vez."""
+
+    STATUS_CHOICES = [
+        ('PENDENTE', 'Pendente'),
+        ('LANCADO', 'Lançado'),
+    ]
+    loja = models.ForeignKey(Loja, on_delete=models.CASCADE)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='PENDENTE')
+    total_itens = models.IntegerField(default=0)
+    total_ajustes = models.IntegerField(default=0)
+    criado_por = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.SET_NULL, null=True, blank=True)
+    criado_em = models.DateTimeField(default=timezone.now)
+    lancado_em = models.DateTimeField(null=True, blank=True)
+
+    def __str__(self):
+        return f"Inventário #{self.id} - {self.get_status_display()}"
+
+
+class ItemInventario(models.Model):
+    inventario = models.ForeignKey(Inventario, related_name='itens', on_delete=models.CASCADE)
+    produto = models.ForeignKey(Produto, on_delete=models.PROTECT)
+    quantidade_contada = models.IntegerField(verbose_name="Quantidade Contada")
+    # Estoque do sistema quando a contagem foi enviada; o lançamento soma ``contada - quantidade_sistema``.
+    quantidade_sistema = models.IntegerField(null=True, blank=True, verbose_name="Quantidade no Sistema")
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['inventario', 'produto'], name='item_inventario_unico'),
+        ]
+
+    def __str__(self):
+        return f"{self.quantidade_contada}x {self.produto.nome}"
+
+
+class Tarefa(models.Model):
+    """Trabalho pesado executado fora da requisição pelo comando ``executar_tarefas``."""
+
+    STATUS_CHOICES = [
+        ('PENDENTE', 'Pendente'),
+        ('EXECUTANDO', 'Executando'),
+        ('CONCLUIDA', 'Concluída'),
+        ('FALHOU', 'Falhou'),
+    ]
+    tipo = models.CharField(max_length=100)
+    parametros = models.JSONField(default=dict, blank=True)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='PENDENTE')
+    progresso = models.PositiveSmallIntegerField(default=0)
+    mensagem = models.CharField(max_length=255, blank=True, default='')
+    erro = models.TextField(blank=True, default='')
+    arquivo_resultado = models.CharField(max_length=255, blank=True, default='')
+    criado_por = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.SET_NULL, null=True, blank=True)
+    criada_em = models.DateTimeField(default=timezone.now)
+    iniciada_em = models.DateTimeField(null=True, blank=True)
+    concluida_em = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['status', 'criada_em']),
+        ]
+
+    def __str__(self):
+        return f"Tarefa #{self.id} ({self.tipo}) - {self.get_status_display()}"
+
+
+class AlteracaoCatalogo(models.Model):
+    """Registro (outbox) das mudanças de catálogo para sincronização incremental dos caixas.
+
+    O ``id`` é o cursor da sincronização. ``produto_id`` não é chave estrangeira
+    para que a exclusão do produto continue registrada.
+    """
+
+    OPERACOES = [
+        ('INSERT', 'Inclusão'),
+        ('UPDATE', 'Alteração'),
+        ('DELETE', 'Exclusão'),
+    ]
+    loja = models.ForeignKey(Loja, on_delete=models.CASCADE)
+    produto_id = models.BigIntegerField()
+    operacao = models.CharField(max_length=6, choices=OPERACOES)
+    dados = models.JSONField(default=dict, blank=True)
+    criada_em = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['loja', 'id']),
+        ]
+
+    def __str__(self):
+        return f"{self.get_operacao_display()} do produto {self.produto_id} na loja {self.loja_id}"
+
+
+class VendaArquivada(models.Model):
+    """Venda antiga movida pelo comando ``arquivar_historico``; mantém o ``id`` original.
+
+    As chaves estrangeiras não têm constraint nem cascata: o arquivo não impede exclusões de cadastros.
+    """
+
+    arquivada = True
+
+    id = models.BigIntegerField(primary_key=True)
+    cliente = models.ForeignKey(
+        Cliente, on_delete=models.DO_NOTHING, null=True, blank=True, db_constraint=False, related_name='+',
+    )
+    loja = models.ForeignKey(Loja, on_delete=models.DO_NOTHING, db_constraint=False, related_name='+')
+    data_venda = models.DateTimeField(db_index=True)
+    valor_total = models.DecimalField(max_digits=10, decimal_places=2)
+    status = models.CharField(max_length=10, choices=Venda.STATUS_CHOICES)
+    arquivada_em = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['cliente', '-data_venda', '-id'], name='venda_arq_cliente_data_idx'),
+        ]
+
+    def __str__(self):
+        return f"Venda arquivada #{self.id}"
+
+
+class ItemVendaArquivado(models.Model):
+    id = models.BigIntegerField(primary_key=True)
+    venda = models.ForeignKey(VendaArquivada, related_name='itens', on_delete=models.CASCADE)
+    produto = models.ForeignKey(Produto, on_delete=models.DO_NOTHING, db_constraint=False, related_name='+')
+    quantidade = models.IntegerField()
+    preco_unitario = models.DecimalField(max_digits=10, decimal_places=2)
+    custo_unitario = models.DecimalField(max_digits=10, decimal_places=2)
+
+    def __str__(self):
+        return f"{self.quantidade}x {self.produto.nome}"
+
+
+class MovimentacaoArquivada(models.Model):
+    arquivada = True
+
+    id = models.BigIntegerField(primary_key=True)
+    produto = models.ForeignKey(Produto, on_delete=models.DO_NOTHING, db_constraint=False, related_name='+')
+    quantidade = models.IntegerField()
+    tipo = models.CharField(max_length=7, choices=MovimentacaoEstoque.TIPO_MOVIMENTACAO)
+    data = models.DateTimeField(db_index=True)
+    descricao = models.CharField(max_length=255, blank=True, null=True)
+
+    def __str__(self):
+        return f"{self.tipo} de {self.quantidade} em {self.produto.nome}"
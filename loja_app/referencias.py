@@ -0,0 +1,154 @@
+"""
+Cache local (por processo) das tabelas de referência: Categoria, Fornecedor e Loja.
+
+São tabelas pequenas que quase nunca mudam, mas eram lidas de novo em cada
+form renderizado (os selects de ``ProdutoForm``, ``VendaForm``...), em cada
+chave estrangeira resolvida por ``_update_instance_from_data`` e no join de
+``obter_produto``. Cada processo guarda as instâncias numa LRU limitada por
+``REFERENCIAS_CACHE_MAXIMO``; cada entrada leva a versão do modelo que valia
+quando foi carregada. A versão mora no cache ``referencias`` (Redis, ou
+arquivos que todos os workers da máquina enxergam) e é trocada pelos signals
+de save/delete, então uma alteração feita em um worker invalida as cópias de
+todos os outros na próxima leitura. Entradas também vencem após
+``REFERENCIAS_CACHE_SEGUNDOS``, o que limita o atraso quando a versão não é
+compartilhada (várias máquinas sem Redis). Um id que não está na lista
+carregada é procurado no banco antes de ser dado como inexistente.
+
+As instâncias devolvidas são compartilhadas entre requisições: não altere.
+"""
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.cache import caches
+from django.core.exceptions import ValidationError
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from .models import Categoria, Fornecedor, Loja
+
+
+# Chave da lista completa do modelo dentro da LRU (as demais são pks).
+TODAS = '*'
+
+
+def _chave_versao(modelo):
+    return f'referencias:versao:{modelo._meta.label_lower}'
+
+
+def _cache():
+    return caches['referencias']
+
+
+def versao(modelo):
+    """Versão atual de ``modelo`` no cache compartilhado (criada se tiver sumido dele)."""
+    cache = _cache()
+    chave = _chave_versao(modelo)
+    atual = cache.get(chave)
+    if atual is None:
+        # Um valor novo (e não 1): cópias feitas antes do cache ser esvaziado não voltam a valer.
+        cache.add(chave, time.time_ns(), timeout=None)
+        atual = cache.get(chave)
+    return atual
+
+
+def invalidar(modelo):
+    cache = _cache()
+    try:
+        cache.incr(_chave_versao(modelo))
+    except ValueError:
+        cache.set(_chave_versao(modelo), time.time_ns(), timeout=None)
+
+
+class CacheReferencias:
+    """LRU de instâncias por ``(modelo, pk)`` e das listas completas, validadas pela versão do modelo."""
+
+    def __init__(self, maximo, segundos):
+        self.maximo = maximo
+        self.segundos = segundos
+        self._entradas = OrderedDict()
+        self._trava = threading.Lock()
+
+    def _valida(self, entrada, versao_atual):
+        return entrada is not None and entrada[0] == versao_atual and entrada[2] > time.monotonic()
+
+    def _obter(self, modelo, chave, carregar):
+        versao_atual = versao(modelo)
+        chave = (modelo._meta.label_lower, chave)
+        with self._trava:
+            entrada = self._entradas.get(chave)
+            if self._valida(entrada, versao_atual):
+                self._entradas.move_to_end(chave)
+                return entrada[1]
+        valor = carregar()
+        with self._trava:
+            self._entradas[chave] = (versao_atual, valor, time.monotonic() + self.segundos)
+            self._entradas.move_to_end(chave)
+            while len(self._entradas) > self.maximo:
+                self._entradas.popitem(last=False)
+        return valor
+
+    def todas(self, modelo):
+        return self._obter(modelo, TODAS, lambda: tuple(modelo._default_manager.order_by('pk')))
+
+    def _da_lista(self, modelo, pk):
+        # A lista completa já carregada (e ainda válida) responde sem ir ao banco; um id
+        # fora dela pode ter sido criado depois, então só o banco diz que não existe.
+        with self._trava:
+            entrada = self._entradas.get((modelo._meta.label_lower, TODAS))
+        if self._valida(entrada, versao(modelo)):
+            for obj in entrada[1]:
+                if obj.pk == pk:
+                    return obj
+        return modelo._default_manager.get(pk=pk)
+
+    def obter(self, modelo, pk):
+        try:
+            pk = modelo._meta.pk.to_python(pk)
+        except ValidationError:
+            raise modelo.DoesNotExist(f'{modelo.__name__} com id "{pk}" não existe.') from None
+        return self._obter(modelo, pk, lambda: self._da_lista(modelo, pk))
+
+    def limpar(self):
+        with self._trava:
+            self._entradas.clear()
+
+    def __len__(self):
+        return len(self._entradas)
+
+
+referencias = CacheReferencias(settings.REFERENCIAS_CACHE_MAXIMO, settings.REFERENCIAS_CACHE_SEGUNDOS)
+
+
+def referencia(modelo, pk):
+    """Instância de ``modelo`` com ``pk`` (do cache local); levanta ``modelo.DoesNotExist``."""
+    return referencias.obter(modelo, pk)
+
+
+def referencia_ou_none(modelo, pk):
+    if pk is None:
+        return None
+    try:
+        return referencias.obter(modelo, pk)
+    except modelo.DoesNotExist:
+        return None
+
+
+def todas(modelo):
+    """Todas as instâncias de ``modelo``, na ordem do pk (do cache local)."""
+    return referencias.todas(modelo)
+
+
+@receiver(post_save, sender=Categoria)
+@receiver(post_save, sender=Fornecedor)
+@receiver(post_save, sender=Loja)
+@receiver(post_delete, sender=Categoria)
+@receiver(post_delete, sender=Fornecedor)
+@receiver(post_delete, sender=Loja)
+def invalidar_referencias(sender, **kwargs):
+    # Agora para o próprio processo e de novo no commit: outro worker que recarregar
+    # entre os dois momentos ainda veria o valor antigo com a versão nova.
+    invalidar(sender)
+    transaction.on_commit(lambda: invalidar(sender))
@@ -0,0 +1,148 @@
+"""
+Previsão de demanda e sugestão de compra por produto, agrupada por fornecedor.
+
+A demanda diária vem de ``ItensVenda`` (vendas canceladas são apagadas, então
+não contam). Em vez de trazer uma linha por produto e dia, o banco devolve,
+numa única passada agrupada por produto, as somas de que a regressão precisa
+sobre os dias da janela — incluindo os dias sem venda, que entram como zero:
+
+* ``S0 = Σ q(t)`` e ``S1 = Σ t·q(t)``, com ``t`` o dia dentro da janela;
+* a soma dos últimos ``dias_media`` dias, para a média móvel.
+
+A tendência é a inclinação da reta de mínimos quadrados pelos dias da janela,
+``(S1 - t̄·S0) / Σ(t - t̄)²``. O resultado vai para :class:`SugestaoReposicao`,
+que a página de sugestões só lê.
+"""
+import math
+from collections import defaultdict
+from datetime import datetime, timedelta, timezone as dt_timezone
+
+from django.db import transaction
+from django.db.models import F, Func, IntegerField, Q, Sum, Value
+from django.utils import timezone
+
+from .arquivo import alcanca_arquivo
+from .models import ItemVendaArquivado, ItensVenda, Produto, SugestaoReposicao, VendaArquivada
+from .tarefas import tarefa
+
+
+EPOCA = datetime(1970, 1, 1, tzinfo=dt_timezone.utc)
+
+
+class DiaUTC(Func):
+    """Dias (UTC) desde 1970-01-01 de uma data/hora, calculado no banco."""
+
+    output_field = IntegerField()
+    template = 'CAST(FLOOR(EXTRACT(EPOCH FROM %(expressions)s) / 86400) AS INTEGER)'
+
+    def as_sqlite(self, compiler, connection, **extra_context):
+        # 2440587.5 é o dia juliano de 1970-01-01 00:00 UTC.
+        return self.as_sql(
+            compiler, connection, template='CAST(julianday(%(expressions)s) - 2440587.5 AS INTEGER)',
+            **extra_context,
+        )
+
+    def as_mysql(self, compiler, connection, **extra_context):
+        return self.as_sql(
+            compiler, connection, template='FLOOR(UNIX_TIMESTAMP(%(expressions)s) / 86400)', **extra_context,
+        )
+
+
+def _inicio_do_dia(dia):
+    return EPOCA + timedelta(days=dia)
+
+
+def _somas_por_produto(itens, primeiro_dia, dias_janela, dias_media):
+    """``{produto_id: (S0, S1, soma_recente)}`` dos itens vendidos na janela."""
+    inicio = _inicio_do_dia(primeiro_dia)
+    inicio_media = _inicio_do_dia(primeiro_dia + dias_janela - dias_media)
+    dia = DiaUTC('venda__data_venda') - Value(primeiro_dia)
+    return {
+        produto_id: (s0, s1, recente or 0)
+        for produto_id, s0, s1, recente in (
+            itens.filter(venda__status='CONCLUIDA', venda__data_venda__gte=inicio)
+            .values_list('produto_id')
+            .annotate(
+                s0=Sum('quantidade'),
+                s1=Sum(F('quantidade') * dia, output_field=IntegerField()),
+                recente=Sum('quantidade', filter=Q(venda__data_venda__gte=inicio_media)),
+            )
+            .order_by()
+        )
+    }
+
+
+def prever(s0, s1, recente, estoque, dias_janela, dias_media, horizonte):
+    """Média diária, tendência (unidades/dia por dia), dias de cobertura e quantidade sugerida.
+
+    A previsão parte da média móvel dos últimos ``dias_media`` dias (centrada
+    ``(dias_media - 1) / 2`` dias atrás) e segue a tendência por ``horizonte``
+    dias; a sugestão é o que falta no estoque para cobrir esse consumo.
+    """
+    n = dias_janela
+    t_medio = (n - 1) / 2
+    tendencia = (s1 - t_medio * s0) / (n * (n * n - 1) / 12) if n > 1 else 0.0
+    media = recente / dias_media
+    deslocamento = (dias_media - 1) / 2
+    demanda = horizonte * media + tendencia * (horizonte * deslocamento + horizonte * (horizonte + 1) / 2)
+    demanda = max(demanda, 0.0)
+    cobertura = estoque / media if media > 0 else None
+    sugerida = max(0, math.ceil(demanda - estoque - 1e-9))
+    return media, tendencia, cobertura, sugerida
+
+
+def calcular_reposicao(dias_janela=90, dias_media=28, prazo_entrega=7, dias_cobertura=14, loja_id=None):
+    """Recalcula :class:`SugestaoReposicao` de todos os produtos (ou de uma loja); retorna quantos."""
+    dias_media = min(dias_media, dias_janela)
+    hoje = timezone.now()
+    # Índice do primeiro dia da janela (que termina hoje), para que ``t`` vá de 0 a dias_janela - 1.
+    primeiro_dia = (hoje - EPOCA).days - (dias_janela - 1)
+
+    itens = ItensVenda.objects.all()
+    arquivados = ItemVendaArquivado.objects.all()
+    if loja_id:
+        itens = itens.filter(venda__loja_id=loja_id)
+        arquivados = arquivados.filter(venda__loja_id=loja_id)
+    resultados = [_somas_por_produto(itens, primeiro_dia, dias_janela, dias_media)]
+    if alcanca_arquivo(VendaArquivada.objects.all(), 'data_venda', _inicio_do_dia(primeiro_dia).date()):
+        resultados.append(_somas_por_produto(arquivados, primeiro_dia, dias_janela, dias_media))
+
+    somas = defaultdict(lambda: [0, 0, 0])
+    for por_produto in resultados:
+        for produto_id, valores in por_produto.items():
+            acumulado = somas[produto_id]
+            for indice, valor in enumerate(valores):
+                acumulado[indice] += valor
+
+    produtos = Produto.objects.all()
+    if loja_id:
+        produtos = produtos.filter(loja_id=loja_id)
+    sugestoes = []
+    for produto_id, loja, fornecedor_id, estoque in produtos.values_list(
+        'id', 'loja_id', 'fornecedor_id', 'estoque__quantidade',
+    ).iterator(chunk_size=5000):
+        estoque = estoque or 0
+        media, tendencia, cobertura, sugerida = prever(
+            *somas.get(produto_id, (0, 0, 0)), estoque,
+            dias_janela, dias_media, prazo_entrega + dias_cobertura,
+        )
+        sugestoes.append(SugestaoReposicao(
+            produto_id=produto_id, loja_id=loja, fornecedor_id=fornecedor_id,
+            media_diaria=media, tendencia=tendencia, estoque=estoque,
+            dias_cobertura=cobertura, quantidade_sugerida=sugerida, calculado_em=hoje,
+        ))
+
+    with transaction.atomic():
+        antigas = SugestaoReposicao.objects.all()
+        if loja_id:
+            antigas = antigas.filter(loja_id=loja_id)
+        antigas.delete()
+        SugestaoReposicao.objects.bulk_create(sugestoes, batch_size=2000)
+    return len(sugestoes)
+
+
+@tarefa('calcular_reposicao')
+def tarefa_calcular_reposicao(execucao, loja_id=None, **parametros):
+    execucao.progresso(0, 'Calculando previsão de demanda')
+    total = calcular_reposicao(loja_id=loja_id, **parametros)
+    return f'{total} produtos com previsão atualizada.'
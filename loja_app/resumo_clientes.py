@@ -0,0 +1,142 @@
+"""
+Resumo de compras por cliente e histórico paginado por chave.
+
+:class:`ResumoCliente` guarda total gasto, número de compras, primeira e
+última compra e loja favorita; cada venda registrada ou cancelada aplica a
+diferença (:func:`aplicar_venda_no_resumo`), então a página do cliente lê uma
+linha só. O histórico é paginado por ``(data_venda, id)``: cada página é uma
+faixa do índice ``cliente, -data_venda, -id``, sem ``OFFSET``, por maior que
+seja o histórico.
+"""
+import heapq
+from collections import defaultdict
+from datetime import datetime, timedelta, timezone as dt_timezone
+from decimal import Decimal
+
+from django.db.models import Count, Max, Min, Q, Sum
+
+from .linhas import LinhaCompra, LinhaCompraArquivada, gerar_linhas
+from .models import ResumoCliente, ResumoClienteLoja, Venda, VendaArquivada
+
+
+def aplicar_venda_no_resumo(venda, sinal=1):
+    """Soma (``sinal=1``) ou subtrai (``sinal=-1``) ``venda`` do resumo do cliente dela."""
+    if venda.cliente_id is None:
+        return
+    por_loja, _ = ResumoClienteLoja.objects.select_for_update().get_or_create(
+        cliente_id=venda.cliente_id, loja_id=venda.loja_id,
+    )
+    por_loja.quantidade_compras += sinal
+    por_loja.total_gasto += sinal * venda.valor_total
+    por_loja.save(update_fields=['quantidade_compras', 'total_gasto'])
+
+    resumo, _ = ResumoCliente.objects.select_for_update().get_or_create(cliente_id=venda.cliente_id)
+    resumo.quantidade_compras += sinal
+    resumo.total_gasto += sinal * venda.valor_total
+    if resumo.quantidade_compras <= 0:
+        resumo.primeira_compra = resumo.ultima_compra = None
+    elif sinal > 0:
+        resumo.primeira_compra = min(filter(None, [resumo.primeira_compra, venda.data_venda]))
+        resumo.ultima_compra = max(filter(None, [resumo.ultima_compra, venda.data_venda]))
+    elif venda.data_venda in (resumo.primeira_compra, resumo.ultima_compra):
+        # A venda cancelada era a primeira ou a última: busca as datas nas vendas que restaram.
+        resumo.primeira_compra, resumo.ultima_compra = _datas_de_compra(venda.cliente_id, sem_venda=venda.pk)
+    resumo.loja_favorita_id = (
+        ResumoClienteLoja.objects.filter(cliente_id=venda.cliente_id, quantidade_compras__gt=0)
+        .order_by('-quantidade_compras', '-total_gasto').values_list('loja_id', flat=True).first()
+    )
+    resumo.save()
+
+
+def _datas_de_compra(cliente_id, sem_venda=None):
+    primeiras, ultimas = [], []
+    for modelo in (Venda, VendaArquivada):
+        agregado = (
+            modelo.objects.filter(cliente_id=cliente_id, status='CONCLUIDA')
+            .exclude(pk=sem_venda).aggregate(primeira=Min('data_venda'), ultima=Max('data_venda'))
+        )
+        if agregado['primeira'] is not None:
+            primeiras.append(agregado['primeira'])
+            ultimas.append(agregado['ultima'])
+    return (min(primeiras), max(ultimas)) if primeiras else (None, None)
+
+
+def recalcular_resumos_clientes():
+    """Reconstrói os resumos a partir de todas as vendas concluídas (inclusive arquivadas)."""
+    por_loja = defaultdict(lambda: [0, Decimal('0'), None, None])
+    for modelo in (Venda, VendaArquivada):
+        linhas = (
+            modelo.objects.filter(cliente__isnull=False, status='CONCLUIDA')
+            .values_list('cliente_id', 'loja_id')
+            .annotate(
+                quantidade=Count('id'), total=Sum('valor_total'),
+                primeira=Min('data_venda'), ultima=Max('data_venda'),
+            )
+            .order_by()
+        )
+        for cliente_id, loja_id, quantidade, total, primeira, ultima in linhas:
+            acumulado = por_loja[cliente_id, loja_id]
+            acumulado[0] += quantidade
+            acumulado[1] += total
+            acumulado[2] = min(filter(None, [acumulado[2], primeira]))
+            acumulado[3] = max(filter(None, [acumulado[3], ultima]))
+
+    resumos = {}
+    for (cliente_id, loja_id), (quantidade, total, primeira, ultima) in por_loja.items():
+        resumo = resumos.setdefault(cliente_id, ResumoCliente(cliente_id=cliente_id, primeira_compra=primeira))
+        resumo.quantidade_compras += quantidade
+        resumo.total_gasto += total
+        resumo.primeira_compra = min(resumo.primeira_compra, primeira)
+        resumo.ultima_compra = max(filter(None, [resumo.ultima_compra, ultima]))
+        favorita = por_loja.get((cliente_id, resumo.loja_favorita_id))
+        if favorita is None or (quantidade, total) > (favorita[0], favorita[1]):
+            resumo.loja_favorita_id = loja_id
+
+    ResumoClienteLoja.objects.all().delete()
+    ResumoCliente.objects.all().delete()
+    ResumoCliente.objects.bulk_create(resumos.values(), batch_size=1000)
+    ResumoClienteLoja.objects.bulk_create([
+        ResumoClienteLoja(cliente_id=cliente_id, loja_id=loja_id, quantidade_compras=quantidade, total_gasto=total)
+        for (cliente_id, loja_id), (quantidade, total, _, _) in por_loja.items()
+    ], batch_size=1000)
+    return len(resumos)
+
+
+EPOCA = datetime(1970, 1, 1, tzinfo=dt_timezone.utc)
+MICROSSEGUNDO = timedelta(microseconds=1)
+
+
+def cursor_de(venda):
+    """Cursor da próxima página: a (data, id) da última venda mostrada, em microssegundos exatos."""
+    return f'{(venda.data_venda - EPOCA) // MICROSSEGUNDO}-{venda.id}'
+
+
+def ler_cursor(texto):
+    try:
+        micros, venda_id = (int(parte) for parte in texto.split('-'))
+    except (AttributeError, ValueError):
+        return None
+    return EPOCA + micros * MICROSSEGUNDO, venda_id
+
+
+def historico_de_compras(cliente, cursor=None, limite=25):
+    """Uma página de compras de ``cliente`` (mais recentes primeiro) e o cursor da seguinte.
+
+    Vendas ativas e arquivadas devolvem cada uma no máximo ``limite + 1``
+    linhas anteriores a ``cursor``; a sobra indica que existe outra página.
+    """
+    filtro = Q(cliente=cliente)
+    if cursor is not None:
+        data, venda_id = cursor
+        filtro &= Q(data_venda__lt=data) | Q(data_venda=data, id__lt=venda_id)
+
+    vendas = list(heapq.merge(*(
+        gerar_linhas(classe, modelo.objects.filter(filtro).order_by('-data_venda', '-id')[:limite + 1])
+        for modelo, classe in ((Venda, LinhaCompra), (VendaArquivada, LinhaCompraArquivada))
+    ), key=_ordem, reverse=True))
+    pagina = vendas[:limite]
+    return pagina, (cursor_de(pagina[-1]) if len(vendas) > limite else None)
+
+
+def _ordem(venda):
+    return venda.data_venda, venda.id
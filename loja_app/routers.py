@@ -0,0 +1,49 @@
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS
+
+
+# Alias usado para leituras na requisição atual; ``None`` mantém o padrão.
+_alias_leitura = ContextVar('gestorpro_alias_leitura', default=None)
+
+# Apps cujas leituras nunca podem atrasar em relação às escritas.
+APPS_SEMPRE_NO_PRINCIPAL = {'sessions'}
+
+
+def leitura_em_replica(view_func):
+    """Marca uma view somente leitura para consultar a réplica quando houver uma."""
+    view_func.leitura_em_replica = True
+    return view_func
+
+
+def alias_replica():
+    return getattr(settings, 'REPLICA_DB_ALIAS', None)
+
+
+class LeituraEscritaRouter:
+    """Envia leituras das views marcadas para a réplica e todo o resto para ``default``.
+
+    A decisão por requisição é tomada pelo ``RoteamentoLeituraMiddleware``.
+    """
+
+    def db_for_read(self, model, **hints):
+        if model._meta.app_label in APPS_SEMPRE_NO_PRINCIPAL:
+            return DEFAULT_DB_ALIAS
+        return _alias_leitura.get() or DEFAULT_DB_ALIAS
+
+    def db_for_write(self, model, **hints):
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        bancos = {DEFAULT_DB_ALIAS, alias_replica()}
+        if obj1._state.db in bancos and obj2._state.db in bancos:
+            return True
+        return None
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # A réplica recebe o esquema pela cópia/replicação, nunca por migrate.
+        if db == alias_replica():
+            return False
+        return None
+
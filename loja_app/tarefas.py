@@ -0,0 +1,116 @@
+"""
+Fila de tarefas em segundo plano guardada no próprio banco.
+
+Uma tarefa é uma função registrada com ``@tarefa('nome')`` que recebe uma
+:class:`ExecucaoTarefa` e os parâmetros com que foi enfileirada. O comando
+``manage.py executar_tarefas`` consome a fila com um pool de threads, sem
+depender de broker externo.
+"""
+import logging
+import traceback
+from pathlib import Path
+
+from django.conf import settings
+from django.utils import timezone
+
+from .consultas_lentas import medir_consultas_lentas
+from .models import Tarefa
+
+
+logger = logging.getLogger(__name__)
+
+_REGISTRO = {}
+
+
+def tarefa(nome):
+    """Registra ``func`` como executora das tarefas do tipo ``nome``."""
+
+    def decorator(func):
+        _REGISTRO[nome] = func
+        return func
+
+    return decorator
+
+
+def tipos_registrados():
+    return sorted(_REGISTRO)
+
+
+def enfileirar(tipo, usuario=None, **parametros):
+    if tipo not in _REGISTRO:
+        raise ValueError(f'Tipo de tarefa desconhecido: "{tipo}".')
+    return Tarefa.objects.create(tipo=tipo, parametros=parametros, criado_por=usuario)
+
+
+def diretorio_resultados():
+    diretorio = Path(settings.TAREFAS_RESULTADOS_DIR)
+    diretorio.mkdir(parents=True, exist_ok=True)
+    return diretorio
+
+
+class ExecucaoTarefa:
+    """Interface entregue à função da tarefa para relatar progresso e gravar resultados."""
+
+    def __init__(self, tarefa):
+        self.tarefa = tarefa
+
+    def progresso(self, percentual, mensagem=''):
+        percentual = max(0, min(100, int(percentual)))
+        Tarefa.objects.filter(pk=self.tarefa.pk).update(progresso=percentual, mensagem=mensagem[:255])
+        self.tarefa.progresso = percentual
+        self.tarefa.mensagem = mensagem[:255]
+
+    def abrir_resultado(self, nome, modo='w', **kwargs):
+        """Abre o arquivo de resultado da tarefa e o associa a ela."""
+        nome_arquivo = f'tarefa_{self.tarefa.pk}_{Path(nome).name}'
+        Tarefa.objects.filter(pk=self.tarefa.pk).update(arquivo_resultado=nome_arquivo)
+        self.tarefa.arquivo_resultado = nome_arquivo
+        if 'b' not in modo:
+            kwargs.setdefault('encoding', 'utf-8')
+            kwargs.setdefault('newline', '')
+        return open(diretorio_resultados() / nome_arquivo, modo, **kwargs)
+
+
+def reservar_proxima():
+    """Marca a tarefa pendente mais antiga como em execução e a retorna.
+
+    A troca de status é condicional, então vários workers podem disputar a
+    mesma fila sem executar uma tarefa duas vezes.
+    """
+    pendentes = Tarefa.objects.filter(status='PENDENTE').order_by('criada_em', 'id')
+    for tarefa_id in pendentes.values_list('id', flat=True)[:10]:
+        reservada = Tarefa.objects.filter(pk=tarefa_id, status='PENDENTE').update(
+            status='EXECUTANDO', iniciada_em=timezone.now(),
+        )
+        if reservada:
+            return Tarefa.objects.get(pk=tarefa_id)
+    return None
+
+
+def executar(tarefa):
+    """Executa uma tarefa já reservada e grava o status final."""
+    func = _REGISTRO.get(tarefa.tipo)
+    try:
+        if func is None:
+            raise LookupError(f'Tipo de tarefa desconhecido: "{tarefa.tipo}".')
+        with medir_consultas_lentas(f'tarefa:{tarefa.tipo}'):
+            mensagem = func(ExecucaoTarefa(tarefa), **tarefa.parametros) or ''
+    except Exception:
+        logger.exception('Falha na tarefa #%s (%s).', tarefa.pk, tarefa.tipo)
+        Tarefa.objects.filter(pk=tarefa.pk).update(
+            status='FALHOU', erro=traceback.format_exc(), concluida_em=timezone.now(),
+        )
+    else:
+        Tarefa.objects.filter(pk=tarefa.pk).update(
+            status='CONCLUIDA', progresso=100, mensagem=str(mensagem)[:255], concluida_em=timezone.now(),
+        )
+    tarefa.refresh_from_db()
+    return tarefa
+
+
+def executar_proxima():
+    """Reserva e executa uma tarefa na thread atual; retorna ``None`` se a fila estiver vazia."""
+    tarefa_reservada = reservar_proxima()
+    if tarefa_reservada is None:
+        return None
+    return executar(tarefa_reservada)
@@ -1,7 +1,58 @@
+import itertools
+import json
+import tempfile
+import time
+from datetime import datetime, timedelta
+from decimal import Decimal
+from io import StringIO
+from pathlib import Path
+from types import SimpleNamespace
+from unittest import mock
+
+from django.conf import settings
 from django.contrib.auth import get_user_model
-from django.test import TestCase
+from django.contrib.staticfiles.storage import staticfiles_storage
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.cache import cache, caches
+from django.core.exceptions import ImproperlyConfigured
+from django.core.management import CommandError, call_command
+from django.db import OperationalError, connection
+from django.http import Http404, HttpResponse
+from django.test import RequestFactory, SimpleTestCase, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.db.models import Max, Min, Q
 from django.urls import reverse
-from .models import Cliente, Loja, Produto, Venda, ItensVenda
+from django.utils import timezone
+from gestorpro.database import config_banco
+
+from .models import (
+    AlteracaoCatalogo, Categoria, Cliente, Estoque, Fornecedor, ItemInventario, ItemVendaArquivado, ItensVenda, Loja,
+    MargemMensal, Inventario, MovimentacaoArquivada, MovimentacaoEstoque, Produto, Recebimento, ResumoCliente,
+    SugestaoReposicao, Tarefa, ValorEstoque, Venda, VendaArquivada,
+)
+from .admin import ContagemEstimadaPaginator, PeriodosIndexadosQuerySet
+from .aquecimento import ETAPAS, aquecer
+from .arquivo import arquivar_vendas
+from .management.commands._sinteticos import gerar_vendas
+from .concorrencia import com_retentativas
+from .consultas_lentas import buffer, consultas_registradas, formato_parametros, limpar_registro, normalizar
+from .catalogo import alteracoes_desde
+from .cubo import CuboVendas
+from .estoque import lancar_inventario, somar_ao_estoque
+from .estaticos import CACHE_IMUTAVEL, _codificacoes_aceitas, servir_estatico
+from .limites import CacheDeBaldes, _ler_limite
+from .linhas import linhas_de
+from .forms import ItemVendaFormSet, ProdutoForm, VendaForm
+from . import metricas
+from .margens import recalcular_margens
+from .middleware import RoteamentoLeituraMiddleware
+from .referencias import CacheReferencias, _chave_versao, referencias
+from .reposicao import calcular_reposicao, prever
+from .resumo_clientes import recalcular_resumos_clientes
+from .routers import LeituraEscritaRouter, _alias_leitura, leitura_em_replica
+from .tarefas import enfileirar, executar_proxima, tarefa
+from .valorizacao import verificar_valor_estoque
+from .views import EstoqueInsuficiente, VendaJaCancelada, _ajustar_estoque, _estornar_venda, _gravar_venda
 
 
 class RelatorioVendasClienteViewTests(TestCase):
@@ -47,3 +98,1392 @@ class RelatorioVendasClienteViewTests(TestCase):
             'Produto A (x2), Produto B (x1)'
         )
 
+
+class MargemMensalTests(TestCase):
+    def setUp(self):
+        User = get_user_model()
+        User.objects.create_user(username='staff', password='senha123', is_staff=True)
+        self.client.login(username='staff', password='senha123')
+
+        self.loja = Loja.objects.create(nome='Loja Teste', endereco='Rua A', cnpj_loja='00.000.000/0001-00')
+        self.produto = Produto.objects.create(
+            nome='Produto A', preco_compra=10, preco_venda=25, loja=self.loja,
+        )
+        Estoque.objects.filter(produto=self.produto).update(quantidade=10)
+
+    def _registrar_venda(self, quantidade):
+        return self.client.post(reverse('registrar_venda'), {
+            'loja': self.loja.id,
+            'form-TOTAL_FORMS': '1',
+            'form-INITIAL_FORMS': '0',
+            'form-0-produto': self.produto.id,
+            'form-0-quantidade': quantidade,
+        })
+
+    def test_custo_capturado_na_venda_e_agregado_no_mes(self):
+        self._registrar_venda(3)
+        self.produto.preco_compra = 18
+        self.produto.save()
+        self._registrar_venda(1)
+
+        custos = sorted(ItensVenda.objects.values_list('custo_unitario', flat=True))
+        self.assertEqual(custos, [10, 18])
+
+        margem = MargemMensal.objects.get()
+        self.assertEqual(margem.quantidade, 4)
+        self.assertEqual(margem.receita, 100)
+        self.assertEqual(margem.custo, 48)
+        self.assertEqual(margem.margem, 52)
+
+    def test_cancelamento_subtrai_da_margem_e_recalculo_confere(self):
+        self._registrar_venda(2)
+        self._registrar_venda(1)
+        venda = Venda.objects.order_by('id').first()
+
+        response = self.client.post(reverse('cancelar_venda', args=[venda.id]))
+        self.assertRedirects(response, reverse('lista_vendas'))
+        self.assertEqual(Estoque.objects.get(produto=self.produto).quantidade, 9)
+
+        margem = MargemMensal.objects.get()
+        self.assertEqual((margem.quantidade, margem.receita, margem.custo), (1, 25, 10))
+
+        recalcular_margens()
+        margem = MargemMensal.objects.get()
+        self.assertEqual((margem.quantidade, margem.receita, margem.custo), (1, 25, 10))
+
+    def test_troca_de_categoria_igual_no_incremental_e_no_recalculo(self):
+        bebidas = Categoria.objects.create(nome='Bebidas')
+        self._registrar_venda(2)
+        self.produto.categoria = bebidas
+        self.produto.save()
+        self.assertEqual(MargemMensal.objects.get().categoria, bebidas)
+
+        self._registrar_venda(1)
+        campos = ('categoria_id', 'quantidade', 'receita', 'custo')
+        incremental = list(MargemMensal.objects.values_list(*campos))
+        recalcular_margens()
+        self.assertEqual(list(MargemMensal.objects.values_list(*campos)), incremental)
+
+    def test_recalculo_em_segundo_plano_desfeito_se_falhar(self):
+        self._registrar_venda(2)
+        enfileirar('recalcular_margens')
+        with mock.patch.object(MargemMensal.objects, 'bulk_create', side_effect=RuntimeError('falha simulada')):
+            with self.assertLogs('loja_app.tarefas', 'ERROR'):
+                executar_proxima()
+        margem = MargemMensal.objects.get()
+        self.assertEqual((margem.quantidade, margem.receita), (2, 50))
+
+    def test_venda_sem_estoque_nao_deixa_venda_parcial(self):
+        self._registrar_venda(50)
+        self.assertFalse(Venda.objects.exists())
+        self.assertFalse(MargemMensal.objects.exists())
+
+    def test_exportacao_csv(self):
+        self._registrar_venda(2)
+        response = self.client.get(reverse('exportar_margens_csv'), {'agrupar': 'loja'})
+        conteudo = b''.join(response.streaming_content).decode('utf-8').splitlines()
+
+        self.assertEqual(conteudo[0], 'mes,loja,categoria,produto,quantidade,receita,custo,margem')
+        self.assertIn('Loja Teste,,,2,50.00,20.00,30.00', conteudo[1])
+
+
+class ArquivoHistoricoTests(TestCase):
+    def setUp(self):
+        User = get_user_model()
+        User.objects.create_user(username='staff', password='senha123', is_staff=True)
+        self.client.login(username='staff', password='senha123')
+
+        self.loja = Loja.objects.create(nome='Loja Teste', endereco='Rua A', cnpj_loja='00.000.000/0001-00')
+        self.produto = Produto.objects.create(nome='Produto A', preco_compra=10, preco_venda=25, loja=self.loja)
+        self.cliente = Cliente.objects.create(nome='Maria')
+        self.antiga = timezone.now() - timedelta(days=800)
+
+        self.atual = timezone.now()
+        for data in (self.antiga, self.atual):
+            venda = Venda.objects.create(loja=self.loja, cliente=self.cliente, data_venda=data, valor_total=25)
+            ItensVenda.objects.create(venda=venda, produto=self.produto, quantidade=1, preco_unitario=25, custo_unitario=10)
+            movimentacao = MovimentacaoEstoque.objects.create(produto=self.produto, quantidade=1, tipo='SAIDA')
+            MovimentacaoEstoque.objects.filter(pk=movimentacao.pk).update(data=data)
+        Estoque.objects.filter(produto=self.produto).update(quantidade=8)
+        recalcular_margens()
+
+    def _arquivar(self):
+        call_command('arquivar_historico', dias=365, lote=1, stdout=StringIO())
+
+    def test_move_antigos_sem_mexer_em_estoque_e_agregados(self):
+        self._arquivar()
+
+        self.assertEqual(Venda.objects.count(), 1)
+        self.assertEqual(VendaArquivada.objects.get().data_venda, self.antiga)
+        self.assertEqual(ItemVendaArquivado.objects.count(), 1)
+        self.assertEqual((MovimentacaoEstoque.objects.count(), MovimentacaoArquivada.objects.count()), (1, 1))
+        self.assertEqual(Estoque.objects.get(produto=self.produto).quantidade, 8)
+        self.assertEqual(MargemMensal.objects.count(), 2)
+
+        recalcular_margens()
+        self.assertEqual(sorted(MargemMensal.objects.values_list('quantidade', flat=True)), [1, 1])
+
+    def test_historico_le_o_arquivo_em_todo_o_periodo_pedido(self):
+        self._arquivar()
+
+        atual, antiga = (timezone.localtime(data).strftime('%d/%m/%Y %H:%M') for data in (self.atual, self.antiga))
+        recente = (timezone.localdate() - timedelta(days=1)).isoformat()
+        ate_antiga = (self.antiga + timedelta(days=1)).date().isoformat()
+        for nome in ('lista_vendas', 'lista_itens_venda', 'lista_movimentacoes_estoque'):
+            def datas(**periodo):
+                conteudo = b''.join(self.client.get(reverse(nome), periodo).streaming_content).decode()
+                return sorted((data for data in (atual, antiga) if data in conteudo), key=conteudo.index)
+
+            with self.subTest(nome):
+                # Sem "desde" o período não tem início: o arquivo entra, depois das linhas atuais.
+                self.assertEqual(datas(), [atual, antiga])
+                # Só "ate", antes do corte: só o arquivo responde.
+                self.assertEqual(datas(ate=ate_antiga), [antiga])
+                self.assertEqual(datas(desde=recente), [atual])
+
+        relatorio = self.client.get(reverse('relatorio_vendas_cliente', args=[self.cliente.id])).json()
+        self.assertEqual(len(relatorio['vendas']), 2)
+        self.assertEqual(relatorio['vendas'][1]['itens_descricao'], 'Produto A (x1)')
+
+        # Só restam vendas arquivadas e elas ainda bloqueiam a exclusão do cliente.
+        Venda.objects.all().delete()
+        self.client.post(reverse('excluir_cliente', args=[self.cliente.id]))
+        self.assertTrue(Cliente.objects.filter(pk=self.cliente.pk).exists())
+
+
+class CuboVendasTests(TestCase):
+    def setUp(self):
+        self.loja = Loja.objects.create(nome='Loja Teste', endereco='Rua A', cnpj_loja='00.000.000/0001-00')
+        self.produto = Produto.objects.create(nome='Produto A', preco_compra=10, preco_venda='12.50', loja=self.loja)
+        self.cubo = CuboVendas()
+
+    def _vender(self, quantidade, data_venda=None):
+        venda = Venda.objects.create(loja=self.loja, data_venda=data_venda or timezone.now(), valor_total=0)
+        ItensVenda.objects.create(
+            venda=venda, produto=self.produto, quantidade=quantidade, preco_unitario='12.50', custo_unitario=10,
+        )
+        return venda
+
+    def test_agrupa_e_atualiza_incrementalmente(self):
+        ontem = timezone.now() - timedelta(days=1)
+        self._vender(2, ontem)
+        self.assertEqual(self.cubo.atualizar(), 1)
+        self.assertEqual(self.cubo.agrupar('produto'), {self.produto.id: (2, 2500)})
+
+        self._vender(1)
+        self.assertEqual(self.cubo.atualizar(), 1)
+        self.assertEqual(self.cubo.agrupar('loja'), {self.loja.id: (3, 3750)})
+        self.assertEqual(self.cubo.agrupar('dia', desde=timezone.localdate()), {timezone.localdate(): (1, 1250)})
+        self.assertEqual(self.cubo.agrupar('loja', loja=self.loja.id + 1), {})
+
+    def test_exclusao_de_itens_recarrega_o_cubo(self):
+        venda = self._vender(2)
+        self._vender(1)
+        self.cubo.atualizar()
+
+        venda.delete()
+        self.cubo.invalidar()
+        self.cubo.atualizar()
+        self.assertEqual(len(self.cubo), 1)
+        self.assertEqual(self.cubo.agrupar('produto'), {self.produto.id: (1, 1250)})
+
+    def test_contagem_de_exclusoes_so_roda_no_intervalo(self):
+        self._vender(2)
+        self.cubo.atualizar()
+        # Só a busca dos itens novos; a contagem abaixo da marca espera o intervalo.
+        with self.assertNumQueries(1):
+            self.cubo.atualizar()
+
+        cubo = CuboVendas(verificar_a_cada=0)
+        cubo.atualizar()
+        with self.assertNumQueries(2):
+            cubo.atualizar()
+
+    def test_inclui_itens_arquivados(self):
+        self._vender(2, timezone.now() - timedelta(days=400))
+        self._vender(1)
+        self.cubo.atualizar()
+        list(arquivar_vendas(timezone.now() - timedelta(days=365)))
+
+        self.cubo.invalidar()
+        self.cubo.atualizar()
+        self.assertEqual(len(self.cubo), 2)
+        self.assertEqual(self.cubo.agrupar('produto'), {self.produto.id: (3, 3750)})
+        self.assertEqual(CuboVendas().atualizar(), 2)
+
+
+class ListagensEnxutasTests(TestCase):
+    def setUp(self):
+        User = get_user_model()
+        User.objects.create_user(username='staff', password='senha123', is_staff=True)
+        self.client.login(username='staff', password='senha123')
+
+        loja = Loja.objects.create(nome='Loja Teste', endereco='Rua A', cnpj_loja='00.000.000/0001-00')
+        self.produto = Produto.objects.create(nome='Produto A', preco_compra=10, preco_venda=25, loja=loja)
+        cliente = Cliente.objects.create(nome='Maria')
+        for _ in range(3):
+            venda = Venda.objects.create(loja=loja, cliente=cliente, valor_total=25)
+            ItensVenda.objects.create(venda=venda, produto=self.produto, quantidade=1, preco_unitario=25, custo_unitario=10)
+            MovimentacaoEstoque.objects.create(produto=self.produto, quantidade=1, tipo='SAIDA')
+
+    def test_listagens_usam_linhas_com_slots_e_nomes_em_lote(self):
+        self.assertFalse(hasattr(next(linhas_de(ItensVenda.objects.all())), '__dict__'))
+        # Sessão/usuário + fim do arquivo + 1 consulta de itens + 1 de nomes de produto.
+        with self.assertNumQueries(5):
+            response = self.client.get(reverse('lista_itens_venda'))
+            conteudo = b''.join(response.streaming_content).decode()
+        self.assertEqual(conteudo.count('Produto A'), 3)
+
+        self.assertContains(self.client.get(reverse('lista_vendas')), 'Maria', count=3)
+        self.assertContains(self.client.get(reverse('lista_movimentacoes_estoque')), 'Saída', count=3)
+
+    def test_tabela_enviada_em_partes(self):
+        with mock.patch('loja_app.views.LINHAS_POR_PARTE', 2):
+            partes = list(self.client.get(reverse('lista_itens_venda')).streaming_content)
+        # Início da página, 2 linhas, 1 linha, fim da página.
+        self.assertEqual(len(partes), 4)
+        self.assertEqual([parte.count(b'Produto A') for parte in partes], [0, 2, 1, 0])
+        self.assertNotIn(b'Nenhum item vendido', b''.join(partes))
+
+        ItensVenda.objects.all().delete()
+        self.assertContains(self.client.get(reverse('lista_itens_venda')), 'Nenhum item vendido ainda.')
+
+
+@override_settings(SESSION_ENGINE='django.contrib.sessions.backends.cached_db', AUTENTICACAO_EM_CACHE=True)
+class AutenticacaoEmCacheTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        User = get_user_model()
+        User.objects.create_user(username='staff', password='senha123', is_staff=True)
+        self.usuario = User.objects.create_user(username='maria', password='senha123')
+        self.cliente = Cliente.objects.create(nome='Maria', user=self.usuario)
+
+    def test_sessao_aquecida_nao_consulta_o_banco_para_autenticar(self):
+        self.client.login(username='staff', password='senha123')
+        self.client.get(reverse('meu_historico_compras'))
+        with self.assertNumQueries(0):
+            self.client.get(reverse('meu_historico_compras'))
+
+    def test_perfil_de_cliente_vem_do_cache(self):
+        self.client.login(username='maria', password='senha123')
+        self.client.get(reverse('meu_historico_compras'))
+        # Só o resumo e uma página de vendas (ativas e arquivadas); sessão, usuário e Cliente vêm do cache.
+        with self.assertNumQueries(3):
+            response = self.client.get(reverse('meu_historico_compras'))
+        self.assertEqual(response.context['cliente_profile'], self.cliente)
+
+    def test_alteracoes_invalidam_o_cache(self):
+        self.client.login(username='maria', password='senha123')
+        self.client.get(reverse('meu_historico_compras'))
+
+        self.cliente.nome = 'Maria Silva'
+        self.cliente.save()
+        response = self.client.get(reverse('meu_historico_compras'))
+        self.assertEqual(response.context['cliente_profile'].nome, 'Maria Silva')
+
+        self.cliente.delete()
+        response = self.client.get(reverse('meu_historico_compras'))
+        self.assertIsNone(response.context['cliente_profile'])
+
+        self.usuario.is_active = False
+        self.usuario.save()
+        response = self.client.get(reverse('meu_historico_compras'))
+        self.assertEqual(response.status_code, 302)
+
+
+class ResumoClienteTests(TestCase):
+    def setUp(self):
+        User = get_user_model()
+        User.objects.create_user(username='staff', password='senha123', is_staff=True)
+        self.usuario = User.objects.create_user(username='maria', password='senha123')
+        self.cliente = Cliente.objects.create(nome='Maria', user=self.usuario)
+        self.loja_a = Loja.objects.create(nome='Loja A', endereco='Rua A', cnpj_loja='00.000.000/0001-00')
+        self.loja_b = Loja.objects.create(nome='Loja B', endereco='Rua B', cnpj_loja='00.000.000/0002-00')
+        self.produto_a = Produto.objects.create(nome='Produto A', preco_compra=1, preco_venda=10, loja=self.loja_a)
+        self.produto_b = Produto.objects.create(nome='Produto B', preco_compra=1, preco_venda=50, loja=self.loja_b)
+        Estoque.objects.update(quantidade=100)
+
+    def _vender(self, loja, produto, quantidade=1):
+        self.client.post(reverse('registrar_venda'), {
+            'loja': loja.id, 'cliente': self.cliente.id,
+            'form-TOTAL_FORMS': '1', 'form-INITIAL_FORMS': '0',
+            'form-0-produto': produto.id, 'form-0-quantidade': quantidade,
+        })
+        return Venda.objects.latest('id')
+
+    def test_resumo_acompanha_vendas_e_cancelamentos(self):
+        self.client.login(username='staff', password='senha123')
+        primeira = self._vender(self.loja_a, self.produto_a)
+        self._vender(self.loja_a, self.produto_a, 2)
+        ultima = self._vender(self.loja_b, self.produto_b)
+
+        resumo = ResumoCliente.objects.get(cliente=self.cliente)
+        self.assertEqual((resumo.quantidade_compras, resumo.total_gasto), (3, 80))
+        self.assertEqual((resumo.primeira_compra, resumo.ultima_compra), (primeira.data_venda, ultima.data_venda))
+        self.assertEqual(resumo.loja_favorita, self.loja_a)
+
+        self.client.post(reverse('cancelar_venda', args=[ultima.id]))
+        resumo.refresh_from_db()
+        self.assertEqual((resumo.quantidade_compras, resumo.total_gasto), (2, 30))
+        self.assertLess(resumo.ultima_compra, ultima.data_venda)
+
+        # A reconstrução completa chega aos mesmos valores.
+        recalcular_resumos_clientes()
+        recalculado = ResumoCliente.objects.get(cliente=self.cliente)
+        self.assertEqual(
+            (recalculado.quantidade_compras, recalculado.total_gasto, recalculado.ultima_compra,
+             recalculado.loja_favorita_id),
+            (2, 30, resumo.ultima_compra, self.loja_a.id),
+        )
+
+    def test_historico_paginado_por_cursor(self):
+        mesmo_instante = timezone.now()
+        Venda.objects.bulk_create([
+            Venda(loja=self.loja_a, cliente=self.cliente, valor_total=1, data_venda=mesmo_instante)
+            for _ in range(30)
+        ])
+        VendaArquivada.objects.create(
+            id=10**6, loja=self.loja_b, cliente=self.cliente, valor_total=1, status='CONCLUIDA',
+            data_venda=mesmo_instante - timedelta(days=400),
+        )
+        self.client.login(username='maria', password='senha123')
+
+        vistas, url = [], reverse('meu_historico_compras')
+        while url:
+            response = self.client.get(url)
+            vistas += [venda.id for venda in response.context['vendas']]
+            proxima = response.context['proxima_pagina']
+            url = f"{reverse('meu_historico_compras')}?antes={proxima}" if proxima else None
+
+        self.assertEqual(len(vistas), 31)
+        self.assertEqual(len(set(vistas)), 31)
+        self.assertEqual(vistas[-1], 10**6)
+        self.assertContains(response, 'Loja B')
+
+
+class ReposicaoTests(TestCase):
+    def test_tendencia_pelas_somas(self):
+        dias = range(90)
+        constante = prever(sum(2 for t in dias), sum(2 * t for t in dias), 56, 0, 90, 28, 21)
+        self.assertAlmostEqual(constante[0], 2)
+        self.assertAlmostEqual(constante[1], 0)
+        self.assertEqual(constante[3], 42)
+
+        rampa = prever(sum(dias), sum(t * t for t in dias), sum(dias[-28:]), 0, 90, 28, 21)
+        self.assertAlmostEqual(rampa[1], 1)
+
+    def test_sugestoes_agrupadas_por_fornecedor(self):
+        User = get_user_model()
+        User.objects.create_user(username='staff', password='senha123', is_staff=True)
+        loja = Loja.objects.create(nome='Loja A', endereco='Rua A', cnpj_loja='00.000.000/0001-00')
+        fornecedor = Fornecedor.objects.create(nome='Distribuidora Norte')
+        vendido = Produto.objects.create(
+            nome='Arroz', preco_compra=4, preco_venda=10, loja=loja, fornecedor=fornecedor,
+        )
+        parado = Produto.objects.create(nome='Feijão', preco_compra=4, preco_venda=10, loja=loja)
+        Estoque.objects.filter(produto=vendido).update(quantidade=5)
+        venda = Venda.objects.create(loja=loja, valor_total=280)
+        ItensVenda.objects.create(venda=venda, produto=vendido, quantidade=28, preco_unitario=10)
+
+        self.assertEqual(calcular_reposicao(), 2)
+        sugestao = SugestaoReposicao.objects.get(produto=vendido)
+        self.assertAlmostEqual(sugestao.media_diaria, 1)
+        self.assertGreater(sugestao.tendencia, 0)
+        self.assertEqual(sugestao.dias_cobertura, 5)
+        self.assertGreater(sugestao.quantidade_sugerida, 21 - 5)
+        self.assertEqual(SugestaoReposicao.objects.get(produto=parado).quantidade_sugerida, 0)
+
+        self.client.login(username='staff', password='senha123')
+        response = self.client.get(reverse('sugestoes_reposicao'), {'fornecedor': fornecedor.id})
+        self.assertEqual([s.produto_id for s in response.context['sugestoes']], [vendido.id])
+        self.assertContains(response, 'Distribuidora Norte')
+
+
+class RecebimentoTests(TestCase):
+    def setUp(self):
+        get_user_model().objects.create_user(username='staff', password='senha123', is_staff=True)
+        self.client.login(username='staff', password='senha123')
+        self.loja = Loja.objects.create(nome='Loja A', endereco='Rua A', cnpj_loja='00.000.000/0001-00')
+        self.outra_loja = Loja.objects.create(nome='Loja B', endereco='Rua B', cnpj_loja='00.000.000/0002-00')
+        self.fornecedor = Fornecedor.objects.create(nome='Distribuidora Norte')
+        self.produtos = [
+            Produto.objects.create(nome=f'Produto {n}', preco_compra=5, preco_venda=10, loja=self.loja)
+            for n in range(40)
+        ]
+
+    def _enviar(self, csv_texto):
+        return self.client.post(reverse('registrar_recebimento'), {
+            'fornecedor': self.fornecedor.id, 'loja': self.loja.id, 'numero_nota': '123',
+            'form-TOTAL_FORMS': '0', 'form-INITIAL_FORMS': '0',
+            'arquivo': SimpleUploadedFile('nota.csv', csv_texto.encode()),
+        })
+
+    def test_nota_csv_lancada_de_uma_vez(self):
+        linhas = [f'{produto.id};3;' for produto in self.produtos]
+        linhas[0] = f'{self.produtos[0].id};2;6,40'
+        # O número de consultas não cresce com as linhas da nota (só com as quantidades distintas).
+        with self.assertNumQueries(25):
+            response = self._enviar('produto;quantidade;preco_compra\n' + '\n'.join(linhas))
+        self.assertRedirects(response, reverse('lista_recebimentos'))
+
+        recebimento = Recebimento.objects.get()
+        self.assertEqual(recebimento.itens.count(), 40)
+        self.assertEqual(
+            dict(Estoque.objects.filter(produto__loja=self.loja).values_list('produto_id', 'quantidade')),
+            {produto.id: 2 if produto == self.produtos[0] else 3 for produto in self.produtos},
+        )
+        self.produtos[0].refresh_from_db()
+        self.produtos[1].refresh_from_db()
+        self.assertEqual((self.produtos[0].preco_compra, self.produtos[1].preco_compra), (Decimal('6.40'), 5))
+        self.assertEqual(
+            MovimentacaoEstoque.objects.filter(tipo='ENTRADA', descricao=f'Recebimento #{recebimento.id} (nota 123)')
+            .count(),
+            40,
+        )
+        self.assertEqual(AlteracaoCatalogo.objects.filter(operacao='UPDATE').count(), 40)
+
+    def test_produto_de_outra_loja_recusa_a_nota_inteira(self):
+        estranho = Produto.objects.create(nome='Estranho', preco_compra=5, preco_venda=10, loja=self.outra_loja)
+        response = self._enviar(f'produto,quantidade\n{self.produtos[0].id},1\n{estranho.id},1\n')
+        self.assertContains(response, f'Produtos não encontrados nesta loja: {estranho.id}')
+        self.assertFalse(Recebimento.objects.exists())
+        self.assertFalse(MovimentacaoEstoque.objects.exists())
+
+    def test_itens_digitados(self):
+        response = self.client.post(reverse('registrar_recebimento'), {
+            'fornecedor': self.fornecedor.id, 'loja': self.loja.id,
+            'form-TOTAL_FORMS': '1', 'form-INITIAL_FORMS': '0',
+            'form-0-produto': self.produtos[1].id, 'form-0-quantidade': 7, 'form-0-preco_compra': '',
+        })
+        self.assertRedirects(response, reverse('lista_recebimentos'))
+        self.assertEqual(Estoque.objects.get(produto=self.produtos[1]).quantidade, 7)
+
+
+class InventarioTests(TestCase):
+    def setUp(self):
+        get_user_model().objects.create_user(username='staff', password='senha123', is_staff=True)
+        self.client.login(username='staff', password='senha123')
+        self.loja = Loja.objects.create(nome='Loja A', endereco='Rua A', cnpj_loja='00.000.000/0001-00')
+        self.produtos = [
+            Produto.objects.create(nome=f'Produto {n}', preco_compra=5, preco_venda=10, loja=self.loja)
+            for n in range(4)
+        ]
+        Estoque.objects.update(quantidade=10)
+
+    def _enviar(self, linhas):
+        csv_texto = 'produto;quantidade\n' + '\n'.join(f'{produto.id};{quantidade}' for produto, quantidade in linhas)
+        return self.client.post(reverse('registrar_inventario'), {
+            'loja': self.loja.id, 'form-TOTAL_FORMS': '0', 'form-INITIAL_FORMS': '0',
+            'arquivo': SimpleUploadedFile('contagem.csv', csv_texto.encode()),
+        })
+
+    def _estoques(self):
+        return [Estoque.objects.get(produto=produto).quantidade for produto in self.produtos]
+
+    def test_diferencas_lancadas_como_ajustes(self):
+        a, b, c, _ = self.produtos
+        # O mesmo produto contado em duas prateleiras soma; o quarto produto fica fora da contagem.
+        response = self._enviar([(a, 8), (b, 5), (b, 7), (c, 10)])
+        self.assertRedirects(response, reverse('lista_inventarios'))
+
+        inventario = Inventario.objects.get()
+        self.assertEqual((inventario.status, inventario.total_itens, inventario.total_ajustes), ('LANCADO', 3, 2))
+        self.assertEqual(self._estoques(), [8, 12, 10, 10])
+        self.assertEqual(
+            sorted(MovimentacaoEstoque.objects.filter(descricao=f'Ajuste do Inventário #{inventario.id}')
+                   .values_list('produto_id', 'tipo', 'quantidade')),
+            [(a.id, 'SAIDA', 2), (b.id, 'ENTRADA', 2)],
+        )
+        # Lançar de novo não ajusta duas vezes.
+        self.assertIsNone(lancar_inventario(inventario.id))
+        self.assertEqual(self._estoques(), [8, 12, 10, 10])
+
+    @override_settings(INVENTARIO_LINHAS_NA_REQUISICAO=2)
+    def test_contagem_grande_vai_para_a_fila(self):
+        self._enviar([(produto, 3) for produto in self.produtos])
+        inventario = Inventario.objects.get()
+        self.assertEqual(inventario.status, 'PENDENTE')
+        self.assertEqual(self._estoques(), [10, 10, 10, 10])
+
+        executar_proxima()
+        inventario.refresh_from_db()
+        self.assertEqual((inventario.status, inventario.total_ajustes), ('LANCADO', 4))
+        self.assertEqual(self._estoques(), [3, 3, 3, 3])
+
+    @override_settings(INVENTARIO_LINHAS_NA_REQUISICAO=2)
+    def test_venda_entre_a_contagem_e_o_lancamento_continua_descontada(self):
+        a, b, c, _ = self.produtos
+        self._enviar([(a, 8), (b, 10), (c, 12)])
+        self.assertEqual(
+            sorted(ItemInventario.objects.values_list('quantidade_contada', 'quantidade_sistema')),
+            [(8, 10), (10, 10), (12, 10)],
+        )
+
+        self.client.post(reverse('registrar_venda'), {
+            'loja': self.loja.id, 'form-TOTAL_FORMS': '2', 'form-INITIAL_FORMS': '0',
+            'form-0-produto': a.id, 'form-0-quantidade': 3,
+            'form-1-produto': b.id, 'form-1-quantidade': 1,
+        })
+        self.assertEqual(self._estoques(), [7, 9, 10, 10])
+
+        executar_proxima()
+        inventario = Inventario.objects.get()
+        self.assertEqual((inventario.status, inventario.total_ajustes), ('LANCADO', 2))
+        # A contagem corrige o que faltava na prateleira; a venda posterior não volta.
+        self.assertEqual(self._estoques(), [5, 9, 12, 10])
+
+
+class ReferenciasEmCacheTests(TestCase):
+    def setUp(self):
+        referencias.limpar()
+        self.loja = Loja.objects.create(nome='Loja A', endereco='Rua A', cnpj_loja='00.000.000/0001-00')
+        self.categoria = Categoria.objects.create(nome='Bebidas')
+
+    def test_form_renderizado_sem_consultas_depois_de_aquecido(self):
+        str(ProdutoForm())
+        with self.assertNumQueries(0):
+            html = str(ProdutoForm())
+            form = ProdutoForm({
+                'nome': 'Suco', 'preco_compra': '1', 'preco_venda': '2',
+                'categoria': self.categoria.id, 'loja': self.loja.id,
+            })
+            self.assertTrue(form.is_valid(), form.errors)
+        self.assertIn('Bebidas', html)
+        self.assertEqual(form.cleaned_data['loja'], self.loja)
+
+        # Alteração em outro registro troca a versão e o próximo form já a mostra.
+        Categoria.objects.create(nome='Laticínios')
+        self.assertIn('Laticínios', str(ProdutoForm()))
+        self.assertFalse(ProdutoForm({'categoria': 999, 'loja': self.loja.id}).is_valid())
+
+    def test_versao_trocada_por_outro_processo_invalida_a_copia_local(self):
+        self.assertEqual(VendaForm().fields['loja'].choices.__len__(), 2)
+        Loja.objects.filter(pk=self.loja.pk).update(nome='Renomeada')  # sem signal: cópia local continua
+        self.assertIn('Loja A', str(VendaForm()))
+        caches['referencias'].incr(_chave_versao(Loja))  # o que o signal faria em outro worker
+        self.assertIn('Renomeada', str(VendaForm()))
+
+    def test_registro_criado_por_outro_processo_e_aceito_antes_da_invalidacao(self):
+        str(VendaForm())
+        # bulk_create não dispara o signal: a lista local continua sem a loja nova.
+        nova, = Loja.objects.bulk_create([Loja(nome='Loja Nova', endereco='Rua N', cnpj_loja='00.000.000/0003-00')])
+        self.assertNotIn('Loja Nova', str(VendaForm()))
+        form = VendaForm({'loja': nova.pk})
+        self.assertTrue(form.is_valid(), form.errors)
+        self.assertEqual(form.cleaned_data['loja'].nome, 'Loja Nova')
+
+    def test_copia_local_vence_sem_troca_de_versao(self):
+        lru = CacheReferencias(maximo=10, segundos=60)
+        lru.todas(Loja)
+        Loja.objects.filter(pk=self.loja.pk).update(nome='Renomeada')
+        self.assertEqual(lru.todas(Loja)[0].nome, 'Loja A')
+        with mock.patch('loja_app.referencias.time.monotonic', return_value=time.monotonic() + 61):
+            self.assertEqual(lru.todas(Loja)[0].nome, 'Renomeada')
+
+    def test_lru_limitada(self):
+        lru = CacheReferencias(maximo=2, segundos=60)
+        outra = Loja.objects.create(nome='Loja B', endereco='Rua B', cnpj_loja='00.000.000/0002-00')
+        lru.obter(Loja, self.loja.pk)
+        lru.obter(Loja, outra.pk)
+        lru.obter(Categoria, self.categoria.pk)
+        self.assertEqual(len(lru), 2)
+        with self.assertNumQueries(1):
+            lru.obter(Loja, self.loja.pk)  # a mais antiga saiu
+
+    def test_obter_produto_e_edicao_json_usam_o_cache(self):
+        get_user_model().objects.create_user(username='staff', password='senha123', is_staff=True)
+        self.client.login(username='staff', password='senha123')
+        produto = Produto.objects.create(
+            nome='Suco', preco_compra=1, preco_venda=2, loja=self.loja, categoria=self.categoria,
+        )
+        self.client.get(reverse('obter_produto', args=[produto.id]))
+        with self.assertNumQueries(3):  # sessão, usuário e produto com estoque
+            dados = self.client.get(reverse('obter_produto', args=[produto.id])).json()
+        self.assertEqual((dados['loja']['nome'], dados['categoria']['nome']), ('Loja A', 'Bebidas'))
+
+        response = self.client.patch(
+            reverse('editar_produto', args=[produto.id]),
+            data=json.dumps({'categoria': 999}), content_type='application/json',
+        )
+        self.assertEqual(response.status_code, 400)
+
+
+class CompressaoTests(TestCase):
+    def test_paginas_grandes_saem_comprimidas(self):
+        User = get_user_model()
+        User.objects.create_user(username='staff', password='senha123', is_staff=True)
+        self.client.login(username='staff', password='senha123')
+
+        response = self.client.get(reverse('lista_produtos'), HTTP_ACCEPT_ENCODING='gzip')
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+
+    def test_collectstatic_gera_versoes_comprimidas_com_cache_longo(self):
+        with tempfile.TemporaryDirectory() as diretorio, override_settings(STATIC_ROOT=diretorio):
+            call_command('collectstatic', interactive=False, verbosity=0)
+            nome = staticfiles_storage.stored_name('loja_app/css/base.css')
+            self.assertNotEqual(nome, 'loja_app/css/base.css')
+            self.assertTrue(Path(diretorio, nome + '.gz').exists())
+
+            request = RequestFactory().get('/static/' + nome, HTTP_ACCEPT_ENCODING='gzip, deflate')
+            response = servir_estatico(request, nome)
+            response.close()
+            self.assertEqual(response['Content-Encoding'], 'gzip')
+            self.assertEqual(response['Content-Type'], 'text/css')
+            self.assertEqual(response['Cache-Control'], CACHE_IMUTAVEL)
+
+    def test_accept_encoding_respeita_q_e_nomes_exatos(self):
+        casos = {
+            'gzip, br': ['br', 'gzip'],
+            'br;q=0, gzip': ['gzip'],
+            'br; q=0.0, gzip;q=0': [],
+            'xgzip, brotli': [],
+            'gzip;q=1, br;q=0.5': ['gzip', 'br'],
+            '*;q=0.1, gzip': ['gzip', 'br'],
+            'GZIP;Q=0.8': ['gzip'],
+            '': [],
+        }
+        for cabecalho, esperado in casos.items():
+            with self.subTest(cabecalho=cabecalho):
+                request = RequestFactory().get('/static/app.css', HTTP_ACCEPT_ENCODING=cabecalho)
+                self.assertEqual(_codificacoes_aceitas(request), esperado)
+
+    def test_caminho_fora_de_static_root_e_404(self):
+        with tempfile.TemporaryDirectory() as diretorio, override_settings(STATIC_ROOT=diretorio):
+            with self.assertRaises(Http404):
+                servir_estatico(RequestFactory().get('/static/x'), '../gestorpro/settings.py')
+
+
+@override_settings(REPLICA_DB_ALIAS='replica', REPLICA_STICKY_SEGUNDOS=5)
+class RoteamentoLeituraTests(SimpleTestCase):
+    def setUp(self):
+        self.factory = RequestFactory()
+        self.router = LeituraEscritaRouter()
+
+    def _executar(self, request, view):
+        aliases = []
+
+        def get_response(req):
+            middleware.process_view(req, view, (), {})
+            aliases.append(self.router.db_for_read(Produto))
+            return HttpResponse()
+
+        middleware = RoteamentoLeituraMiddleware(get_response)
+        middleware(request)
+        return aliases[0]
+
+    def test_view_de_leitura_usa_replica_e_escrita_fica_no_principal(self):
+        view = leitura_em_replica(lambda request: None)
+        request = self.factory.get('/produtos/')
+        request.session = {}
+
+        self.assertEqual(self._executar(request, view), 'replica')
+        self.assertIsNone(_alias_leitura.get())
+        self.assertEqual(self.router.db_for_write(Produto), 'default')
+
+    def test_view_sem_marcacao_le_do_principal(self):
+        request = self.factory.get('/vendas/registrar/')
+        request.session = {}
+        self.assertEqual(self._executar(request, lambda request: None), 'default')
+
+    def test_sessao_fica_no_principal_apos_escrita(self):
+        view = leitura_em_replica(lambda request: None)
+        sessao = {}
+
+        escrita = self.factory.post('/vendas/registrar/')
+        escrita.session = sessao
+        self._executar(escrita, lambda request: None)
+
+        leitura = self.factory.get('/vendas/')
+        leitura.session = sessao
+        self.assertEqual(self._executar(leitura, view), 'default')
+
+        with override_settings(REPLICA_STICKY_SEGUNDOS=0):
+            self.assertEqual(self._executar(leitura, view), 'replica')
+
+
+class AquecimentoTests(SimpleTestCase):
+    def test_aquecer_monta_urls_e_compila_templates(self):
+        etapas = {nome: ETAPAS[nome] for nome in ('urls', 'templates')}
+        resultado = aquecer(etapas)
+        self.assertEqual(set(resultado), {'urls', 'templates'})
+        self.assertGreater(resultado['urls'][0], 0)
+        self.assertGreaterEqual(resultado['templates'][0], 20)
+
+
+class MetricasTests(TestCase):
+    def setUp(self):
+        diretorio = tempfile.TemporaryDirectory()
+        self.addCleanup(diretorio.cleanup)
+        self.diretorio = Path(diretorio.name)
+        self.enterContext(override_settings(METRICAS_DIR=diretorio.name, METRICAS_TOKEN='segredo'))
+        metricas.registro._reiniciar()
+        self.addCleanup(metricas.registro._reiniciar)
+
+        get_user_model().objects.create_user(username='staff', password='senha123', is_staff=True)
+        self.client.login(username='staff', password='senha123')
+        self.loja = Loja.objects.create(nome='Loja Teste', endereco='Rua A', cnpj_loja='00.000.000/0001-00')
+        self.produto = Produto.objects.create(nome='Produto A', preco_compra=10, preco_venda=25, loja=self.loja)
+        Estoque.objects.filter(produto=self.produto).update(quantidade=10)
+
+    def _coletar(self, **headers):
+        response = self.client.get(reverse('metricas'), **headers)
+        self.assertEqual(response.status_code, 200)
+        return response.content.decode('utf-8').splitlines()
+
+    def test_vendas_movimentacoes_e_requisicoes(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(reverse('registrar_venda'), {
+                'loja': self.loja.id, 'form-TOTAL_FORMS': '1', 'form-INITIAL_FORMS': '0',
+                'form-0-produto': self.produto.id, 'form-0-quantidade': 3,
+            })
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(reverse('cancelar_venda', args=[Venda.objects.get().id]))
+
+        linhas = self._coletar()
+        self.assertIn(f'gestorpro_vendas_registradas_total{{loja="{self.loja.id}"}} 1', linhas)
+        self.assertIn(f'gestorpro_vendas_canceladas_total{{loja="{self.loja.id}"}} 1', linhas)
+        self.assertIn('gestorpro_movimentacoes_estoque_total{tipo="SAIDA"} 1', linhas)
+        self.assertIn('gestorpro_movimentacoes_estoque_unidades_total{tipo="ENTRADA"} 3', linhas)
+        self.assertIn('gestorpro_requisicoes_total{view="registrar_venda",status="302"} 1', linhas)
+        self.assertIn('gestorpro_requisicao_segundos_count{view="registrar_venda",metodo="POST"} 1', linhas)
+        self.assertIn('gestorpro_requisicao_segundos_bucket{view="registrar_venda",metodo="POST",le="+Inf"} 1', linhas)
+        self.assertTrue(any(
+            linha.startswith('gestorpro_banco_consultas_total{view="registrar_venda",banco="default"}')
+            for linha in linhas
+        ))
+
+    def test_resposta_em_streaming_registrada_ao_fim_do_envio(self):
+        response = self.client.get(reverse('lista_itens_venda'))
+        self.assertFalse(any('view="lista_itens_venda"' in linha for linha in self._coletar()))
+
+        b''.join(response.streaming_content)
+        linhas = self._coletar()
+        self.assertIn('gestorpro_requisicoes_total{view="lista_itens_venda",status="200"} 1', linhas)
+        # Sessão/usuário e fim do arquivo na view; os itens só durante o envio.
+        self.assertIn('gestorpro_banco_consultas_total{view="lista_itens_venda",banco="default"} 4', linhas)
+
+    def test_soma_arquivos_de_outros_processos(self):
+        (self.diretorio / '999-outro.json').write_text(json.dumps({
+            'contadores': [['gestorpro_retentativas_travamento_total', ['registrar_venda'], 2]],
+            'histogramas': [['gestorpro_requisicao_segundos', ['home', 'GET'], [1] + [0] * 11, 0.004]],
+        }))
+        metricas.incrementar(metricas.RETENTATIVAS, operacao='registrar_venda')
+        metricas.observar(metricas.REQUISICAO_SEGUNDOS, 0.3, view='home', metodo='GET')
+
+        linhas = self._coletar(HTTP_AUTHORIZATION='Bearer segredo')
+        self.assertIn('gestorpro_retentativas_travamento_total{operacao="registrar_venda"} 3', linhas)
+        self.assertIn('gestorpro_requisicao_segundos_bucket{view="home",metodo="GET",le="0.005"} 1', linhas)
+        self.assertIn('gestorpro_requisicao_segundos_bucket{view="home",metodo="GET",le="0.5"} 2', linhas)
+        self.assertIn('gestorpro_requisicao_segundos_count{view="home",metodo="GET"} 2', linhas)
+        self.assertEqual(len(list(self.diretorio.glob('*.json'))), 2)
+
+    def test_arquivos_de_outra_geracao_sao_apagados(self):
+        antigo = self.diretorio / '999-antigo.json'
+        antigo.write_text(json.dumps({
+            'geracao': 'v1', 'contadores': [['gestorpro_retentativas_travamento_total', ['registrar_venda'], 5]],
+            'histogramas': [],
+        }))
+        metricas.incrementar(metricas.RETENTATIVAS, operacao='registrar_venda')
+
+        with override_settings(METRICAS_GERACAO='v2'):
+            linhas = self._coletar(HTTP_AUTHORIZATION='Bearer segredo')
+        self.assertIn('gestorpro_retentativas_travamento_total{operacao="registrar_venda"} 1', linhas)
+        self.assertFalse(antigo.exists())
+
+    def test_acesso_restrito(self):
+        self.client.logout()
+        self.assertEqual(self.client.get(reverse('metricas')).status_code, 403)
+        self.assertEqual(
+            self.client.get(reverse('metricas'), HTTP_AUTHORIZATION='Bearer errado').status_code, 403,
+        )
+        self.assertEqual(
+            self.client.get(reverse('metricas'), HTTP_AUTHORIZATION='Bearer segredo').status_code, 200,
+        )
+
+
+class ConsultasLentasTests(TestCase):
+    def setUp(self):
+        limpar_registro()
+        self.addCleanup(limpar_registro)
+        get_user_model().objects.create_user(username='staff', password='senha123', is_staff=True)
+        self.client.login(username='staff', password='senha123')
+        loja = Loja.objects.create(nome='Loja Teste', endereco='Rua A', cnpj_loja='00.000.000/0001-00')
+        self.produto = Produto.objects.create(nome='Produto A', preco_compra=10, preco_venda=25, loja=loja)
+
+    def _relogio_lento(self):
+        # Cada leitura do relógio do medidor avança 20 ms: todo comando parece lento.
+        passos = itertools.count()
+        return mock.patch('loja_app.consultas_lentas.time', SimpleNamespace(perf_counter=lambda: next(passos) * 0.02))
+
+    def test_normalizacao_agrupa_consultas_com_a_mesma_forma(self):
+        self.assertEqual(
+            normalizar('SELECT * FROM t WHERE id IN (%s, %s, %s) AND nome = \'a\'  LIMIT 21'),
+            normalizar('SELECT * FROM t WHERE id IN (%s) AND nome = \'b\' LIMIT 5'),
+        )
+        self.assertEqual(normalizar('INSERT INTO t VALUES (%s, %s), (%s, %s)'), 'INSERT INTO t VALUES (...)')
+        self.assertEqual(formato_parametros([1, 2, 3, 'x', None], many=False), 'int×3, str, None')
+
+    @override_settings(CONSULTAS_LENTAS_MS=10)
+    def test_registra_view_e_linha_do_codigo(self):
+        with self._relogio_lento():
+            self.client.get(reverse('obter_produto', args=[self.produto.id]))
+
+        registro = next(r for r in consultas_registradas() if 'FROM "loja_app_produto"' in r['sql'])
+        self.assertEqual(registro['origem'], 'obter_produto')
+        self.assertEqual(registro['duracao_ms'], 20)
+        self.assertRegex(registro['local'], r'^loja_app/views\.py:\d+ em obter_produto$')
+        self.assertIn('get_object_or_404', registro['codigo'])
+        self.assertEqual(registro['parametros'], 'int')
+
+        response = self.client.get(reverse('lista_consultas_lentas'))
+        self.assertContains(response, 'obter_produto (1)')
+        self.assertIn(registro['impressao'], [grupo['impressao'] for grupo in response.context['grupos']])
+
+        self.client.post(reverse('lista_consultas_lentas'))
+        self.assertEqual(consultas_registradas(), [])
+
+    def test_persistencia_em_arquivo_limitada_ao_maximo(self):
+        with tempfile.TemporaryDirectory() as diretorio:
+            arquivo = Path(diretorio) / 'lentas.jsonl'
+            with override_settings(
+                CONSULTAS_LENTAS_MS=10, CONSULTAS_LENTAS_ARQUIVO=str(arquivo), CONSULTAS_LENTAS_MAXIMO=5,
+            ), self._relogio_lento():
+                for _ in range(3):
+                    self.client.get(reverse('obter_produto', args=[self.produto.id]))
+                self.assertGreater(len(arquivo.read_text(encoding='utf-8').splitlines()), 5)
+                buffer._registros.clear()  # como outro processo, que só tem o arquivo
+                registros = consultas_registradas()
+                self.assertEqual(len(registros), 5)
+                self.assertEqual(registros[-1]['origem'], 'obter_produto')
+
+
+class RetentativasTests(SimpleTestCase):
+    def test_repete_so_erros_de_trava(self):
+        chamadas = []
+
+        def gravar():
+            chamadas.append(1)
+            if len(chamadas) < 3:
+                raise OperationalError('database is locked')
+            return 'gravado'
+
+        self.assertEqual(com_retentativas(gravar, tentativas=3, espera=0), 'gravado')
+        self.assertEqual(len(chamadas), 3)
+
+        chamadas.clear()
+        with self.assertRaises(OperationalError):
+            com_retentativas(gravar, tentativas=2, espera=0)
+
+        def outro_erro():
+            raise OperationalError('no such table: x')
+
+        with self.assertRaisesMessage(OperationalError, 'no such table'):
+            com_retentativas(outro_erro, tentativas=3, espera=0)
+
+
+class AdminTabelasGrandesTests(TestCase):
+    ADMINS = ('itensvenda', 'movimentacaoestoque', 'venda')
+
+    def setUp(self):
+        get_user_model().objects.create_superuser(username='admin', password='senha123')
+        self.client.login(username='admin', password='senha123')
+
+    def _consultas_das_listagens(self, **params):
+        consultas = {}
+        for modelo in self.ADMINS:
+            url = reverse(f'admin:loja_app_{modelo}_changelist')
+            self.client.get(url, params)  # sessão e usuário já em cache nas seguintes
+            with CaptureQueriesContext(connection) as capturadas:
+                self.assertEqual(self.client.get(url, params).status_code, 200)
+            consultas[modelo] = [consulta['sql'] for consulta in capturadas.captured_queries]
+        return consultas
+
+    def test_listagens_nao_crescem_com_a_tabela(self):
+        gerar_vendas(300, lojas=2, produtos=50)
+        pequenas = self._consultas_das_listagens()
+        gerar_vendas(ContagemEstimadaPaginator.LIMITE_CONTAGEM + 3000, lojas=2, produtos=50, semente=7)
+        grandes = self._consultas_das_listagens()
+
+        for modelo in self.ADMINS:
+            # Um select por página (com os relacionados no join), nada por linha.
+            self.assertLessEqual(len(grandes[modelo]), len(pequenas[modelo]) + 1, modelo)
+            # Contagem só limitada (tabelas abaixo do limite); acima dele, a estimativa.
+            contagens = [sql for sql in grandes[modelo] if 'COUNT(' in sql.upper() and 'LIMIT' not in sql.upper()]
+            self.assertEqual(contagens, [], modelo)
+
+    def test_filtro_conta_no_maximo_o_limite(self):
+        gerar_vendas(ContagemEstimadaPaginator.LIMITE_CONTAGEM + 500, lojas=1, produtos=20)
+        produto_id = MovimentacaoEstoque.objects.values_list('produto_id', flat=True).first()
+        response = self.client.get(reverse('admin:loja_app_movimentacaoestoque_changelist'), {'q': produto_id})
+        encontradas = MovimentacaoEstoque.objects.filter(Q(pk=produto_id) | Q(produto_id=produto_id)).count()
+        esperado = min(encontradas, ContagemEstimadaPaginator.LIMITE_CONTAGEM)
+        self.assertEqual(response.context['cl'].result_count, esperado)
+
+        response = self.client.get(reverse('admin:loja_app_itensvenda_changelist'), {'q': 'abc'})
+        self.assertEqual(response.context['cl'].result_count, 0)
+
+    def test_hierarquia_de_datas_igual_a_do_django(self):
+        loja = Loja.objects.create(nome='Loja A', endereco='Rua A', cnpj_loja='00.000.000/0001-00')
+        for data in ('2024-03-05 23:30', '2024-03-06 01:00', '2024-07-01 12:00', '2025-01-02 00:10'):
+            Venda.objects.create(loja=loja, data_venda=timezone.make_aware(datetime.fromisoformat(data)))
+
+        indexado = PeriodosIndexadosQuerySet(Venda)
+        for tipo in ('year', 'month', 'day'):
+            self.assertEqual(indexado.datetimes('data_venda', tipo), list(Venda.objects.datetimes('data_venda', tipo)))
+        self.assertEqual(
+            indexado.filter(data_venda__year=2024).dates('data_venda', 'month', order='DESC'),
+            list(Venda.objects.filter(data_venda__year=2024).dates('data_venda', 'month', order='DESC')),
+        )
+        self.assertEqual(
+            indexado.aggregate(first=Min('data_venda'), last=Max('data_venda')),
+            Venda.objects.aggregate(first=Min('data_venda'), last=Max('data_venda')),
+        )
+
+        url = reverse('admin:loja_app_venda_changelist')
+        self.assertContains(self.client.get(url), '?data_venda__year=2025')
+        self.assertContains(self.client.get(url, {'data_venda__year': 2024}), 'data_venda__month=7')
+
+    def test_vendas_e_movimentacoes_somente_leitura(self):
+        gerar_vendas(50, lojas=1, produtos=200)
+        item = ItensVenda.objects.select_related('produto').first()
+        quantidade = item.quantidade
+
+        url = reverse('admin:loja_app_itensvenda_change', args=[item.id])
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotContains(response, '<option value="%s"' % item.produto_id)
+        self.assertNotContains(response, 'name="_save"')
+        self.assertEqual(self.client.post(url, {'quantidade': quantidade + 5}).status_code, 403)
+        for modelo in self.ADMINS:
+            self.assertEqual(self.client.get(reverse(f'admin:loja_app_{modelo}_add')).status_code, 403, modelo)
+        venda_url = reverse('admin:loja_app_venda_delete', args=[item.venda_id])
+        self.assertEqual(self.client.post(venda_url, {'post': 'yes'}).status_code, 403)
+
+        item.refresh_from_db()
+        self.assertEqual(item.quantidade, quantidade)
+        self.assertTrue(Venda.objects.filter(pk=item.venda_id).exists())
+
+
+class ConfigBancoTests(SimpleTestCase):
+    def test_sqlite_relativo_ao_projeto_com_conexao_persistente(self):
+        config = config_banco('sqlite:///dados/db.sqlite3?timeout=20', '/srv/gestorpro', conn_max_age=600)
+        self.assertEqual(config['ENGINE'], 'django.db.backends.sqlite3')
+        self.assertEqual(config['NAME'], Path('/srv/gestorpro/dados/db.sqlite3'))
+        self.assertEqual(config['CONN_MAX_AGE'], 600)
+        self.assertTrue(config['CONN_HEALTH_CHECKS'])
+        self.assertEqual(config['OPTIONS'], {'timeout': 20})
+
+    def test_postgres_com_pool_desliga_conexao_persistente(self):
+        config = config_banco(
+            'postgres://gestor:s%40nha@db:5433/gestorpro?pool=true&pool_max_size=8',
+            '/srv/gestorpro', conn_max_age=600,
+        )
+        self.assertEqual(config['ENGINE'], 'django.db.backends.postgresql')
+        self.assertEqual(
+            (config['NAME'], config['USER'], config['PASSWORD'], config['HOST'], config['PORT']),
+            ('gestorpro', 'gestor', 's@nha', 'db', '5433'),
+        )
+        self.assertEqual(config['OPTIONS'], {'pool': {'max_size': 8}})
+        self.assertEqual(config['CONN_MAX_AGE'], 0)
+
+
+@tarefa('teste_falha')
+def _tarefa_que_falha(execucao):
+    execucao.progresso(50, 'Metade')
+    raise RuntimeError('falha simulada')
+
+
+class TarefasTests(TestCase):
+    def setUp(self):
+        diretorio = tempfile.TemporaryDirectory()
+        self.addCleanup(diretorio.cleanup)
+        self.enterContext(override_settings(TAREFAS_RESULTADOS_DIR=diretorio.name))
+
+        User = get_user_model()
+        User.objects.create_user(username='staff', password='senha123', is_staff=True)
+        self.client.login(username='staff', password='senha123')
+
+        loja = Loja.objects.create(nome='Loja Teste', endereco='Rua A', cnpj_loja='00.000.000/0001-00')
+        produto = Produto.objects.create(nome='Produto A', preco_compra=10, preco_venda=25, loja=loja)
+        venda = Venda.objects.create(loja=loja, valor_total=50)
+        ItensVenda.objects.create(venda=venda, produto=produto, quantidade=2, preco_unitario=25, custo_unitario=10)
+        recalcular_margens()
+
+    def test_exportacao_em_segundo_plano_com_acompanhamento(self):
+        response = self.client.post(reverse('exportar_margens_tarefa') + '?agrupar=loja')
+        self.assertEqual(response.status_code, 202)
+        status_url = response.json()['status_url']
+        self.assertEqual(self.client.get(status_url).json()['status'], 'PENDENTE')
+
+        executar_proxima()
+
+        dados = self.client.get(status_url).json()
+        self.assertEqual((dados['status'], dados['progresso']), ('CONCLUIDA', 100))
+        download = self.client.get(dados['resultado_url'])
+        conteudo = b''.join(download.streaming_content).decode('utf-8')
+        self.assertIn('Loja Teste,,,2,50.00,20.00,30.00', conteudo)
+        self.assertIsNone(executar_proxima())
+
+    def test_falha_fica_registrada(self):
+        tarefa_falha = enfileirar('teste_falha')
+        with self.assertLogs('loja_app.tarefas', 'ERROR'):
+            executar_proxima()
+
+        tarefa_falha.refresh_from_db()
+        self.assertEqual(tarefa_falha.status, 'FALHOU')
+        self.assertEqual(tarefa_falha.progresso, 50)
+        self.assertIn('falha simulada', tarefa_falha.erro)
+        self.assertEqual(Tarefa.objects.filter(status='PENDENTE').count(), 0)
+
+
+class AlteracoesCatalogoTests(TestCase):
+    def setUp(self):
+        self.loja = Loja.objects.create(nome='Loja Teste', endereco='Rua A', cnpj_loja='00.000.000/0001-00')
+        self.outra_loja = Loja.objects.create(nome='Loja B', endereco='Rua B', cnpj_loja='00.000.000/0002-00')
+        self.produto = Produto.objects.create(nome='Produto A', preco_compra=10, preco_venda=25, loja=self.loja)
+        self.url = reverse('alteracoes_catalogo', args=[self.loja.id])
+
+    def test_primeira_sincronizacao_devolve_catalogo_e_cursor(self):
+        dados = self.client.get(self.url).json()
+
+        self.assertTrue(dados['completo'])
+        self.assertEqual(dados['cursor'], AlteracaoCatalogo.objects.get().id)
+        self.assertEqual(dados['alteracoes'], [{
+            'produto_id': self.produto.id,
+            'operacao': 'INSERT',
+            'dados': {'nome': 'Produto A', 'preco_venda': '25.00', 'quantidade': 0},
+        }])
+
+    def test_feed_traz_apenas_o_que_mudou_depois_do_cursor(self):
+        cursor = self.client.get(self.url).json()['cursor']
+
+        self.produto.preco_venda = 30
+        self.produto.save()
+        estoque = self.produto.estoque
+        estoque.quantidade = 7
+        estoque.save()
+        novo = Produto.objects.create(nome='Produto B', preco_compra=1, preco_venda=2, loja=self.loja)
+        Produto.objects.create(nome='Outra loja', preco_compra=1, preco_venda=2, loja=self.outra_loja)
+        novo_id = novo.id
+        novo.delete()
+
+        dados = self.client.get(self.url, {'since': cursor}).json()
+        self.assertFalse(dados['mais'])
+        self.assertEqual(
+            [(a['produto_id'], a['operacao']) for a in dados['alteracoes']],
+            [(self.produto.id, 'UPDATE'), (novo_id, 'DELETE')],
+        )
+        self.assertEqual(dados['alteracoes'][0]['dados'], {'nome': 'Produto A', 'preco_venda': '30.00', 'quantidade': 7})
+
+        vazio = self.client.get(self.url, {'since': dados['cursor']}).json()
+        self.assertEqual((vazio['alteracoes'], vazio['cursor']), ([], dados['cursor']))
+
+    def test_limite_menor_que_um_e_recusado(self):
+        for limite in ('0', '-1'):
+            response = self.client.get(self.url, {'since': 0, 'limite': limite})
+            self.assertEqual(response.status_code, 400, limite)
+
+        Produto.objects.create(nome='Produto B', preco_compra=1, preco_venda=2, loja=self.loja)
+        alteracoes, cursor, mais = alteracoes_desde(self.loja.id, 0, limite=0)
+        self.assertEqual((len(alteracoes), mais), (1, True))
+        self.assertEqual(cursor, AlteracaoCatalogo.objects.filter(loja=self.loja).order_by('id').first().id)
+
+    def test_produto_movido_de_loja(self):
+        cursor = self.client.get(self.url).json()['cursor']
+        self.produto.loja = self.outra_loja
+        self.produto.save()
+
+        dados = self.client.get(self.url, {'since': cursor}).json()
+        self.assertEqual(dados['alteracoes'][0]['operacao'], 'DELETE')
+        destino = reverse('alteracoes_catalogo', args=[self.outra_loja.id])
+        self.assertEqual(self.client.get(destino, {'since': 0}).json()['alteracoes'][0]['operacao'], 'INSERT')
+
+
+class RegistrarVendaEscalavelTests(TestCase):
+    def setUp(self):
+        User = get_user_model()
+        User.objects.create_user(username='staff', password='senha123', is_staff=True)
+        self.client.login(username='staff', password='senha123')
+
+        self.loja = Loja.objects.create(nome='Loja Teste', endereco='Rua A', cnpj_loja='00.000.000/0001-00')
+        outra_loja = Loja.objects.create(nome='Loja B', endereco='Rua B', cnpj_loja='00.000.000/0002-00')
+        self.produtos = [
+            Produto.objects.create(nome=f'Produto {i:02d}', preco_compra=1, preco_venda=2, loja=self.loja)
+            for i in range(20)
+        ]
+        self.produto_outra_loja = Produto.objects.create(
+            nome='Produto de outra loja', preco_compra=1, preco_venda=2, loja=outra_loja,
+        )
+        Estoque.objects.update(quantidade=5)
+
+    def _dados_itens(self, produtos, quantidade=1):
+        dados = {'form-TOTAL_FORMS': str(len(produtos)), 'form-INITIAL_FORMS': '0'}
+        for i, produto in enumerate(produtos):
+            dados[f'form-{i}-produto'] = produto.id
+            dados[f'form-{i}-quantidade'] = quantidade
+        return dados
+
+    def test_formulario_nao_renderiza_o_catalogo(self):
+        response = self.client.get(reverse('registrar_venda'))
+        self.assertEqual(response.status_code, 200)
+        self.assertNotContains(response, 'Produto 00')
+
+    def test_validacao_do_formset_faz_uma_consulta(self):
+        formset = ItemVendaFormSet(self._dados_itens(self.produtos), loja=self.loja)
+        with self.assertNumQueries(1):
+            self.assertTrue(formset.is_valid())
+        self.assertEqual(formset.forms[3].cleaned_data['produto'], self.produtos[3])
+
+    def test_produto_de_outra_loja_e_estoque_somado_sao_rejeitados(self):
+        formset = ItemVendaFormSet(self._dados_itens([self.produto_outra_loja]), loja=self.loja)
+        self.assertFalse(formset.is_valid())
+        self.assertIn('produto', formset.forms[0].errors)
+
+        formset = ItemVendaFormSet(self._dados_itens([self.produtos[0]] * 2, quantidade=3), loja=self.loja)
+        self.assertFalse(formset.is_valid())
+        self.assertIn('Estoque insuficiente', formset.non_form_errors()[0])
+
+    def test_registro_de_venda_com_varios_itens(self):
+        dados = self._dados_itens(self.produtos[:3], quantidade=2)
+        dados['loja'] = self.loja.id
+        response = self.client.post(reverse('registrar_venda'), dados)
+
+        self.assertRedirects(response, reverse('lista_vendas'))
+        venda = Venda.objects.get()
+        self.assertEqual(venda.valor_total, 12)
+        self.assertEqual(venda.itens.count(), 3)
+        self.assertEqual(Estoque.objects.get(produto=self.produtos[0]).quantidade, 3)
+
+    def test_estoque_vendido_por_outro_caixa_apos_a_validacao(self):
+        dados = self._dados_itens(self.produtos[:2], quantidade=3)
+        dados['loja'] = self.loja.id
+        venda_form = VendaForm(dados)
+        self.assertTrue(venda_form.is_valid())
+        formset = ItemVendaFormSet(dados, loja=self.loja)
+        self.assertTrue(formset.is_valid())
+
+        Estoque.objects.filter(produto=self.produtos[1]).update(quantidade=2)
+        with self.assertRaisesMessage(EstoqueInsuficiente, 'Disponível: 2'):
+            _gravar_venda(venda_form, formset, self.loja)
+        self.assertFalse(Venda.objects.exists())
+        self.assertEqual(Estoque.objects.get(produto=self.produtos[0]).quantidade, 5)
+
+    def test_cancelamento_devolve_o_estoque_uma_vez(self):
+        dados = self._dados_itens(self.produtos[:1], quantidade=2)
+        dados['loja'] = self.loja.id
+        self.client.post(reverse('registrar_venda'), dados)
+        venda = Venda.objects.get()
+        itens = list(venda.itens.all())
+
+        self.client.post(reverse('cancelar_venda', args=[venda.id]))
+        self.assertEqual(Estoque.objects.get(produto=self.produtos[0]).quantidade, 5)
+        # Um segundo caixa que já tinha carregado a venda não estorna de novo.
+        with self.assertRaises(VendaJaCancelada):
+            _estornar_venda(venda, itens)
+        self.assertEqual(Estoque.objects.get(produto=self.produtos[0]).quantidade, 5)
+
+    def test_tabelas_de_vendas_mantem_chaves_estrangeiras_no_banco(self):
+        esperadas = {Venda: {'loja_id', 'cliente_id'}, ItensVenda: {'produto_id'}, MovimentacaoEstoque: {'produto_id'}}
+        for modelo, colunas in esperadas.items():
+            with connection.cursor() as cursor:
+                restricoes = connection.introspection.get_constraints(cursor, modelo._meta.db_table)
+            com_chave = {
+                coluna for restricao in restricoes.values() if restricao['foreign_key']
+                for coluna in restricao['columns']
+            }
+            self.assertLessEqual(colunas, com_chave)
+
+    def test_busca_de_produtos_restrita_a_loja(self):
+        url = reverse('buscar_produtos')
+        nomes = [p['nome'] for p in self.client.get(url, {'loja': self.loja.id, 'q': 'produto 1'}).json()]
+        self.assertEqual(nomes, [f'Produto {i}' for i in range(10, 20)])
+
+        por_codigo = self.client.get(url, {'loja': self.loja.id, 'q': str(self.produto_outra_loja.id)}).json()
+        self.assertEqual(por_codigo, [])
+
+
+class BuscaClientesTests(TestCase):
+    def setUp(self):
+        User = get_user_model()
+        User.objects.create_user(username='staff', password='senha123', is_staff=True)
+        self.client.login(username='staff', password='senha123')
+
+        self.maria = Cliente.objects.create(nome='Maria', cpf='123.456.789-00', telefone='(11) 98888-7777')
+        self.joao = Cliente.objects.create(nome='João', cpf='987.654.321-00', telefone='(21) 3333-4444')
+        self.url = reverse('buscar_clientes')
+
+    def _ids(self, termo):
+        return [cliente['id'] for cliente in self.client.get(self.url, {'q': termo}).json()]
+
+    def test_documentos_sao_normalizados_inclusive_em_update_parcial(self):
+        self.assertEqual((self.maria.cpf_normalizado, self.maria.telefone_normalizado), ('12345678900', '11988887777'))
+
+        self.maria.telefone = '(11) 91111-2222'
+        self.maria.save(update_fields=['telefone'])
+        self.maria.refresh_from_db()
+        self.assertEqual(self.maria.telefone_normalizado, '11911112222')
+
+    def test_busca_por_cpf_telefone_e_nome(self):
+        self.assertEqual(self._ids('123.456.789-00'), [self.maria.id])
+        self.assertEqual(self._ids('9876'), [self.joao.id])
+        self.assertEqual(self._ids('(21) 3333'), [self.joao.id])
+        self.assertEqual(self._ids('mar'), [self.maria.id])
+        self.assertEqual(self._ids('555'), [])
+
+    def test_formulario_de_venda_nao_lista_clientes(self):
+        response = self.client.get(reverse('registrar_venda'))
+        self.assertNotContains(response, 'Maria')
+        self.assertContains(response, reverse('buscar_clientes'))
+
+
+class ValorEstoqueTests(TestCase):
+    def setUp(self):
+        get_user_model().objects.create_user(username='staff', password='senha123', is_staff=True)
+        self.client.login(username='staff', password='senha123')
+        self.loja = Loja.objects.create(nome='Loja Teste', endereco='Rua A', cnpj_loja='00.000.000/0001-00')
+        self.bebidas = Categoria.objects.create(nome='Bebidas')
+        self.limpeza = Categoria.objects.create(nome='Limpeza')
+        self.suco = Produto.objects.create(
+            nome='Suco', preco_compra=4, preco_venda=9, categoria=self.bebidas, loja=self.loja,
+        )
+        self.sabao = Produto.objects.create(
+            nome='Sabão', preco_compra='2.50', preco_venda=6, categoria=self.limpeza, loja=self.loja,
+        )
+        somar_ao_estoque({self.suco.id: 10, self.sabao.id: 4})
+
+    def _valores(self):
+        return {
+            categoria_id: (quantidade, valor)
+            for categoria_id, quantidade, valor in ValorEstoque.objects.values_list('categoria_id', 'quantidade', 'valor')
+        }
+
+    def test_movimentacoes_e_trocas_de_preco_atualizam_por_delta(self):
+        self.assertEqual(self._valores(), {self.bebidas.id: (10, 40), self.limpeza.id: (4, 10)})
+
+        self.client.post(reverse('registrar_venda'), {
+            'loja': self.loja.id, 'form-TOTAL_FORMS': '1', 'form-INITIAL_FORMS': '0',
+            'form-0-produto': self.suco.id, 'form-0-quantidade': 3,
+        })
+        self.assertEqual(self._valores()[self.bebidas.id], (7, 28))
+
+        # Novo preço de compra reavalia as unidades em estoque; trocar a categoria leva o valor junto.
+        self.client.patch(
+            reverse('editar_produto', args=[self.suco.id]),
+            data=json.dumps({'preco_compra': '5.00', 'categoria': self.limpeza.id}),
+            content_type='application/json',
+        )
+        self.assertEqual(self._valores(), {self.bebidas.id: (0, 0), self.limpeza.id: (11, 45)})
+
+        self.client.post(reverse('cancelar_venda', args=[Venda.objects.get().id]))
+        self.client.post(reverse('atualizar_estoque', args=[self.sabao.id]), {'quantidade': -1, 'descricao': 'Avaria'})
+        self.assertEqual(self._valores()[self.limpeza.id], (13, Decimal('57.50')))
+
+        self.limpeza.delete()
+        self.assertEqual(self._valores(), {self.bebidas.id: (0, 0), None: (13, Decimal('57.50'))})
+        self.assertEqual(verificar_valor_estoque(), [])
+
+    def test_ajuste_manual_soma_ao_estoque_atual(self):
+        # O produto (e o estoque) já carregados ficam velhos se outro ajuste entrar antes.
+        produto = Produto.objects.select_related('estoque').get(pk=self.sabao.pk)
+        somar_ao_estoque({self.sabao.id: 5})
+        _ajustar_estoque(produto, 2, 'Achado no depósito')
+
+        self.assertEqual(Estoque.objects.get(produto=self.sabao).quantidade, 11)
+        self.assertEqual(self._valores()[self.limpeza.id], (11, Decimal('27.50')))
+        self.assertEqual(verificar_valor_estoque(), [])
+        self.assertTrue(MovimentacaoEstoque.objects.filter(produto=self.sabao, tipo='ENTRADA', quantidade=2).exists())
+        self.assertEqual(AlteracaoCatalogo.objects.filter(produto_id=self.sabao.id).last().dados['quantidade'], 11)
+
+    def test_verificacao_aponta_divergencia_e_corrige(self):
+        ValorEstoque.objects.filter(categoria=self.bebidas).update(valor=41)
+        saida = StringIO()
+        with self.assertRaises(CommandError):
+            call_command('verificar_valor_estoque', stdout=saida)
+        self.assertIn('Bebidas: gravado 10 un. R$ 41.00, calculado 10 un. R$ 40.00', saida.getvalue())
+
+        call_command('verificar_valor_estoque', corrigir=True, stdout=StringIO())
+        self.assertEqual(verificar_valor_estoque(), [])
+        self.assertEqual(self._valores()[self.bebidas.id], (10, 40))
+
+    def test_api_e_painel(self):
+        dados = self.client.get(reverse('valor_estoque')).json()
+        self.assertEqual(dados['total'], '50.00')
+        loja = dados['lojas'][0]
+        self.assertEqual((loja['nome'], loja['quantidade'], loja['valor']), ('Loja Teste', 14, '50.00'))
+        self.assertEqual([categoria['nome'] for categoria in loja['categorias']], ['Bebidas', 'Limpeza'])
+
+        self.assertContains(self.client.get(reverse('home')), 'R$ 50.00')
+
+
+class LimitesTests(TestCase):
+    def setUp(self):
+        diretorio = tempfile.TemporaryDirectory()
+        self.addCleanup(diretorio.cleanup)
+        self.enterContext(override_settings(
+            CACHES={
+                'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'},
+                'limites': {'BACKEND': 'loja_app.limites.CacheDeBaldes', 'LOCATION': diretorio.name},
+                'referencias': settings.CACHES['referencias'],
+            },
+            LIMITES_REQUISICOES={'catalogo': '0.5/2', 'consultas': '1/1'},
+        ))
+        metricas.registro._reiniciar()
+        self.addCleanup(metricas.registro._reiniciar)
+        self.agora = 1000.0
+        relogio = SimpleNamespace(time=lambda: self.agora, monotonic=lambda: self.agora)
+        self.enterContext(mock.patch('loja_app.limites.time', relogio))
+
+        self.loja = Loja.objects.create(nome='Loja Teste', endereco='Rua A', cnpj_loja='00.000.000/0001-00')
+        self.url = reverse('get_produtos_por_loja') + f'?loja_id={self.loja.id}'
+
+    def test_balde_por_ip_com_retry_after_e_metrica(self):
+        self.assertEqual([self.client.get(self.url).status_code for _ in range(2)], [200, 200])
+        recusada = self.client.get(self.url)
+        self.assertEqual(recusada.status_code, 429)
+        self.assertEqual(recusada['Retry-After'], '2')
+
+        # Outro IP tem o próprio balde; o primeiro recebe uma ficha a cada 2 s.
+        self.assertEqual(self.client.get(self.url, REMOTE_ADDR='10.0.0.2').status_code, 200)
+        self.agora += 2
+        self.assertEqual([self.client.get(self.url).status_code for _ in range(2)], [200, 429])
+
+        contadores = metricas.registro.instantaneo()['contadores']
+        self.assertIn([metricas.REQUISICOES_LIMITADAS, ['catalogo'], 2], contadores)
+
+    def test_grupos_separados_e_por_usuario(self):
+        staff = get_user_model().objects.create_user(username='staff', password='senha123', is_staff=True)
+        produto = Produto.objects.create(nome='Produto A', preco_compra=10, preco_venda=25, loja=self.loja)
+        self.client.force_login(staff)
+        url = reverse('obter_produto', args=[produto.id])
+        self.assertEqual([self.client.get(url).status_code for _ in range(2)], [200, 429])
+        # Todos os obter_* gastam do mesmo grupo.
+        categoria = Categoria.objects.create(nome='Bebidas')
+        self.assertEqual(self.client.get(reverse('obter_categoria', args=[categoria.id])).status_code, 429)
+        # O catálogo continua com as fichas dele.
+        self.assertEqual(self.client.get(self.url).status_code, 200)
+
+        with override_settings(LIMITES_REQUISICOES={'consultas': ''}):
+            self.assertEqual(self.client.get(url).status_code, 200)
+
+    def test_cache_de_baldes_so_lista_o_diretorio_no_intervalo(self):
+        diretorio = tempfile.TemporaryDirectory()
+        self.addCleanup(diretorio.cleanup)
+        baldes = CacheDeBaldes(diretorio.name, {'OPTIONS': {'MAX_ENTRIES': 100, 'INTERVALO_LIMPEZA': 60}})
+        baldes.set('vencido', 1, timeout=1)
+        with mock.patch.object(baldes, '_list_cache_files', wraps=baldes._list_cache_files) as listar:
+            for numero in range(50):
+                baldes.set(f'cliente:{numero}', (1.0, 0.0), timeout=30)
+        self.assertEqual(listar.call_count, 0)  # a primeira limpeza foi no set de 'vencido'
+
+        baldes._proxima_limpeza = 0
+        with mock.patch('django.core.cache.backends.filebased.time.time', return_value=time.time() + 5):
+            baldes.set('outro', 1, timeout=30)
+        self.assertFalse(baldes.has_key('vencido'))
+        self.assertEqual(len(baldes._list_cache_files()), 51)
+
+    def test_configuracao(self):
+        self.assertEqual(_ler_limite('5/30'), (5.0, 30))
+        self.assertEqual(_ler_limite('2.5'), (2.5, 3))
+        self.assertIsNone(_ler_limite(''))
+        with self.assertRaises(ImproperlyConfigured):
+            _ler_limite('muitas')
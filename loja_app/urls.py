@@ -35,6 +35,10 @@ urlpatterns = [
     path('produtos/<int:id>/', views.obter_produto, name='obter_produto'),
     path('produtos/excluir/<int:id>/', views.excluir_produto, name='excluir_produto'),
     path('produtos/<int:produto_id>/atualizar_estoque/', views.atualizar_estoque, name='atualizar_estoque'),
+    path('recebimentos/', views.lista_recebimentos, name='lista_recebimentos'),
+    path('recebimentos/registrar/', views.registrar_recebimento, name='registrar_recebimento'),
+    path('inventarios/', views.lista_inventarios, name='lista_inventarios'),
+    path('inventarios/registrar/', views.registrar_inventario, name='registrar_inventario'),
     path('clientes/', views.lista_clientes, name='lista_clientes'),
     path('clientes/cadastrar/', views.cadastrar_cliente, name='cadastrar_cliente'),
     path('clientes/editar/<int:id>/', views.editar_cliente, name='editar_cliente'),
@@ -45,6 +49,21 @@ urlpatterns = [
     path('vendas/cancelar/<int:venda_id>/', views.cancelar_venda, name='cancelar_venda'),
     path('api/clientes/<int:cliente_id>/vendas/', views.relatorio_vendas_cliente, name='relatorio_vendas_cliente'),
     path('api/get-produtos-por-loja/', views.get_produtos_por_loja, name='get_produtos_por_loja'),
+    path('api/produtos/buscar/', views.buscar_produtos, name='buscar_produtos'),
+    path('api/clientes/buscar/', views.buscar_clientes, name='buscar_clientes'),
+    path('api/lojas/<int:loja_id>/catalogo/alteracoes/', views.alteracoes_catalogo, name='alteracoes_catalogo'),
     path('historico/itens-vendidos/', views.lista_itens_venda, name='lista_itens_venda'),
     path('historico/movimentacoes-estoque/', views.lista_movimentacoes_estoque, name='lista_movimentacoes_estoque'),
+    path('relatorios/margens/', views.relatorio_margens, name='relatorio_margens'),
+    path('relatorios/margens/exportar/', views.exportar_margens_csv, name='exportar_margens_csv'),
+    path('relatorios/margens/exportar/tarefa/', views.exportar_margens_tarefa, name='exportar_margens_tarefa'),
+    path('api/estoque/valor/', views.valor_estoque, name='valor_estoque'),
+    path('api/analises/vendas/', views.analise_vendas, name='analise_vendas'),
+    path('relatorios/reposicao/', views.sugestoes_reposicao, name='sugestoes_reposicao'),
+    path('relatorios/reposicao/calcular/', views.calcular_reposicao_tarefa, name='calcular_reposicao_tarefa'),
+    path('api/tarefas/<int:tarefa_id>/', views.status_tarefa, name='status_tarefa'),
+    path('tarefas/<int:tarefa_id>/resultado/', views.resultado_tarefa, name='resultado_tarefa'),
+    path('diagnostico/consultas-lentas/', views.lista_consultas_lentas, name='lista_consultas_lentas'),
+    # Sem barra no fim: é o caminho padrão que o Prometheus coleta.
+    path('metrics', views.metricas_prometheus, name='metricas'),
 ]
\ No newline at end of file
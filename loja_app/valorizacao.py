@@ -0,0 +1,208 @@
+"""
+Valor do estoque a preço de custo por loja e categoria.
+
+:class:`ValorEstoque` guarda ``quantidade`` e ``quantidade × preco_compra``
+somados por (loja, categoria) e é mantido por deltas: quem muda o estoque
+chama :func:`movimentar` na mesma transação, e as mudanças de preço de compra,
+loja ou categoria de um produto entram pelos signals abaixo (os updates em
+lote de preço usam :func:`reavaliar_precos`). :func:`verificar_valor_estoque`
+recalcula tudo do zero e aponta a diferença.
+"""
+from collections import defaultdict
+from decimal import Decimal
+
+from django.db import IntegrityError, transaction
+from django.db.models import DecimalField, ExpressionWrapper, F, Sum
+from django.db.models.signals import post_save, pre_delete, pre_save
+from django.dispatch import receiver
+
+from .models import Categoria, Estoque, Loja, Produto, ValorEstoque
+
+
+VALOR = DecimalField(max_digits=16, decimal_places=2)
+
+CAMPOS_DO_VALOR = {'preco_compra', 'loja', 'categoria'}
+LOTE = 900
+
+
+def _deltas():
+    return defaultdict(lambda: [0, Decimal('0')])
+
+
+def aplicar_no_valor(deltas):
+    """Soma ``{(loja_id, categoria_id): [quantidade, valor]}`` ao agregado (um ``UPDATE`` por linha)."""
+    for (loja_id, categoria_id), (quantidade, valor) in deltas.items():
+        if not quantidade and not valor:
+            continue
+        linhas = ValorEstoque.objects.filter(loja_id=loja_id, categoria_id=categoria_id)
+        mudancas = {'quantidade': F('quantidade') + quantidade, 'valor': F('valor') + valor}
+        if linhas.update(**mudancas):
+            continue
+        try:
+            with transaction.atomic():
+                ValorEstoque.objects.create(
+                    loja_id=loja_id, categoria_id=categoria_id, quantidade=quantidade, valor=valor,
+                )
+        except IntegrityError:
+            # Outra transação criou a linha entre o UPDATE e o INSERT.
+            linhas.update(**mudancas)
+
+
+def movimentar(quantidades, produtos=None):
+    """Aplica ``{produto_id: quantidade}`` somada ao estoque (negativa nas saídas).
+
+    ``produtos`` (``{id: Produto}``) evita reler loja, categoria e preço de
+    quem já os tem carregados, como a venda.
+    """
+    produtos = produtos or {}
+    deltas = _deltas()
+    faltando = [produto_id for produto_id, quantidade in quantidades.items() if quantidade and produto_id not in produtos]
+    dados = {
+        produto.pk: (produto.loja_id, produto.categoria_id, produto.preco_compra)
+        for produto in produtos.values()
+    }
+    for inicio in range(0, len(faltando), LOTE):
+        for produto_id, *resto in Produto.objects.filter(pk__in=faltando[inicio:inicio + LOTE]).values_list(
+            'id', 'loja_id', 'categoria_id', 'preco_compra',
+        ):
+            dados[produto_id] = resto
+    for produto_id, quantidade in quantidades.items():
+        if quantidade and produto_id in dados:
+            loja_id, categoria_id, preco_compra = dados[produto_id]
+            delta = deltas[(loja_id, categoria_id)]
+            delta[0] += quantidade
+            delta[1] += quantidade * preco_compra
+    aplicar_no_valor(deltas)
+
+
+def reavaliar_precos(produtos, preco):
+    """Aplica a troca do ``preco_compra`` dos ``produtos`` (QuerySet) para ``preco``; chame antes do ``UPDATE``."""
+    deltas = _deltas()
+    for loja_id, categoria_id, anterior, quantidade in produtos.exclude(preco_compra=preco).values_list(
+        'loja_id', 'categoria_id', 'preco_compra', 'estoque__quantidade',
+    ):
+        if quantidade:
+            deltas[(loja_id, categoria_id)][1] += quantidade * (preco - anterior)
+    aplicar_no_valor(deltas)
+
+
+@receiver(pre_save, sender=Produto)
+def guardar_valor_anterior(sender, instance, update_fields=None, **kwargs):
+    instance._valor_anterior = None
+    if instance.pk and (update_fields is None or CAMPOS_DO_VALOR.intersection(update_fields)):
+        instance._valor_anterior = (
+            Produto.objects.filter(pk=instance.pk)
+            .values_list('loja_id', 'categoria_id', 'preco_compra', 'estoque__quantidade')
+            .first()
+        )
+
+
+@receiver(post_save, sender=Produto)
+def reavaliar_produto(sender, instance, created, **kwargs):
+    anterior = getattr(instance, '_valor_anterior', None)
+    if created or not anterior or not anterior[3]:
+        return
+    loja_id, categoria_id, preco_compra, quantidade = anterior
+    # to_python: quem atribuiu o preço pode ter usado texto ou float.
+    preco_atual = Produto._meta.get_field('preco_compra').to_python(instance.preco_compra)
+    if (loja_id, categoria_id, preco_compra) == (instance.loja_id, instance.categoria_id, preco_atual):
+        return
+    deltas = _deltas()
+    deltas[(loja_id, categoria_id)][0] -= quantidade
+    deltas[(loja_id, categoria_id)][1] -= quantidade * preco_compra
+    deltas[(instance.loja_id, instance.categoria_id)][0] += quantidade
+    deltas[(instance.loja_id, instance.categoria_id)][1] += quantidade * preco_atual
+    aplicar_no_valor(deltas)
+
+
+@receiver(pre_delete, sender=Produto)
+def retirar_produto(sender, instance, origin=None, **kwargs):
+    # Excluir a loja já apaga as linhas dela.
+    if isinstance(origin, Loja):
+        return
+    quantidade = Estoque.objects.filter(produto_id=instance.pk).values_list('quantidade', flat=True).first()
+    if quantidade:
+        movimentar({instance.pk: -quantidade}, {instance.pk: instance})
+
+
+@receiver(pre_delete, sender=Categoria)
+def mover_para_sem_categoria(sender, instance, **kwargs):
+    # Os produtos ficam sem categoria (SET_NULL, sem signals): o valor vai junto.
+    deltas = _deltas()
+    for loja_id, quantidade, valor in ValorEstoque.objects.filter(categoria=instance).values_list(
+        'loja_id', 'quantidade', 'valor',
+    ):
+        deltas[(loja_id, None)] = [quantidade, valor]
+    ValorEstoque.objects.filter(categoria=instance).delete()
+    aplicar_no_valor(deltas)
+
+
+def _calcular():
+    """``{(loja_id, categoria_id): (quantidade, valor)}`` lido direto do estoque."""
+    return {
+        (loja_id, categoria_id): (quantidade, valor)
+        for loja_id, categoria_id, quantidade, valor in (
+            Estoque.objects.values_list('produto__loja_id', 'produto__categoria_id')
+            .annotate(
+                total_quantidade=Sum('quantidade'),
+                total_valor=Sum(ExpressionWrapper(F('quantidade') * F('produto__preco_compra'), output_field=VALOR)),
+            )
+            .order_by()
+        )
+    }
+
+
+def verificar_valor_estoque():
+    """Linhas em que o agregado difere do estoque, recalculado do zero.
+
+    Cada divergência é ``(loja_id, categoria_id, (quantidade, valor) gravados,
+    (quantidade, valor) calculados)``; linhas zeradas contam como ausentes.
+    """
+    calculado = {chave: total for chave, total in _calcular().items() if any(total)}
+    gravado = {
+        (loja_id, categoria_id): (quantidade, valor)
+        for loja_id, categoria_id, quantidade, valor in ValorEstoque.objects.values_list(
+            'loja_id', 'categoria_id', 'quantidade', 'valor',
+        )
+        if quantidade or valor
+    }
+    zero = (0, Decimal('0'))
+    return [
+        (loja_id, categoria_id, gravado.get((loja_id, categoria_id), zero), calculado.get((loja_id, categoria_id), zero))
+        for loja_id, categoria_id in sorted(gravado.keys() | calculado.keys(), key=lambda chave: (chave[0], chave[1] or 0))
+        if gravado.get((loja_id, categoria_id), zero) != calculado.get((loja_id, categoria_id), zero)
+    ]
+
+
+def recalcular_valor_estoque():
+    """Reconstrói o agregado a partir do estoque atual; retorna o número de linhas gravadas."""
+    novas = [
+        ValorEstoque(loja_id=loja_id, categoria_id=categoria_id, quantidade=quantidade, valor=valor)
+        for (loja_id, categoria_id), (quantidade, valor) in _calcular().items()
+    ]
+    ValorEstoque.objects.all().delete()
+    ValorEstoque.objects.bulk_create(novas, batch_size=500)
+    return len(novas)
+
+
+def valor_por_loja(loja_id=None):
+    """Lojas com o total e as categorias, da mais valiosa para a menos (para o painel e a API)."""
+    linhas = ValorEstoque.objects.select_related('loja', 'categoria').order_by('loja__nome', '-valor')
+    if loja_id:
+        linhas = linhas.filter(loja_id=loja_id)
+    lojas = {}
+    for linha in linhas:
+        loja = lojas.get(linha.loja_id)
+        if loja is None:
+            loja = lojas[linha.loja_id] = {
+                'id': linha.loja_id, 'nome': linha.loja.nome, 'quantidade': 0, 'valor': Decimal('0'), 'categorias': [],
+            }
+        loja['quantidade'] += linha.quantidade
+        loja['valor'] += linha.valor
+        loja['categorias'].append({
+            'id': linha.categoria_id,
+            'nome': linha.categoria.nome if linha.categoria else None,
+            'quantidade': linha.quantidade,
+            'valor': linha.valor,
+        })
+    return list(lojas.values())
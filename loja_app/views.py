@@ -1,26 +1,56 @@
+import contextvars
+import csv
+import hmac
 import json
+import re
+from collections import Counter
+from datetime import datetime
+from decimal import Decimal
+from itertools import islice
 from django.core.exceptions import FieldDoesNotExist
 from django.db import models as django_models
 from django.shortcuts import render, redirect, get_object_or_404
-from django.forms import formset_factory
 from django.db import transaction, IntegrityError
-from django.db.models import Prefetch
+from django.db.models import Count, ExpressionWrapper, F, Max, Prefetch, Q, Sum
 from django.contrib import messages
 from django.contrib.auth import login, logout
 from django.contrib.auth.decorators import login_required
 from django.contrib.admin.views.decorators import staff_member_required
-from django.http import JsonResponse
+from django.conf import settings
+from django.http import FileResponse, Http404, HttpResponse, JsonResponse, StreamingHttpResponse
+from django.template.loader import get_template, render_to_string
+from django.urls import reverse
+from django.utils.safestring import mark_safe
 
 # Importação de todos os Models
 from .models import (
     Loja, Categoria, Fornecedor, Produto, 
-    Estoque, MovimentacaoEstoque, Cliente, Venda, ItensVenda
+    Estoque, MovimentacaoEstoque, Cliente, Venda, ItensVenda, Tarefa, somente_digitos, ResumoCliente,
+    SugestaoReposicao, Recebimento, Inventario,
+    VendaArquivada, ItemVendaArquivado, MovimentacaoArquivada,
 )
+from .autenticacao import cliente_do_usuario
+from .arquivo import com_arquivo
+from .cubo import DIMENSOES, cubo_vendas, invalidar_cubo
+from .catalogo import alteracoes_desde, cursor_atual, registrar_alteracoes, snapshot_catalogo
+from .concorrencia import com_retentativas
+from .consultas_lentas import agrupar_por_impressao, consultas_registradas, limpar_registro
+from .estoque import criar_inventario, lancar_inventario, lancar_recebimento
+from .limites import limitar
+from .linhas import linhas_de
+from .metricas import VENDAS_CANCELADAS, VENDAS_REGISTRADAS, contar_movimentacoes, exportar, incrementar_no_commit
+from .referencias import referencia, referencia_ou_none
+from .resumo_clientes import aplicar_venda_no_resumo, historico_de_compras, ler_cursor
+from .routers import leitura_em_replica
+from .tarefas import diretorio_resultados, enfileirar
+from .valorizacao import movimentar, valor_por_loja
+from .margens import CABECALHO_CSV, aplicar_itens_na_margem, consultar_margens, linhas_csv
 
 # Importação de todos os Forms
 from .forms import (
     LojaForm, UserRegisterForm, CategoriaForm, FornecedorForm, 
-    ProdutoForm, MovimentacaoEstoqueForm, ClienteForm, VendaForm, ItemVendaForm
+    ProdutoForm, MovimentacaoEstoqueForm, ClienteForm, VendaForm, ItemVendaFormSet,
+    RecebimentoForm, ItemRecebimentoFormSet, InventarioForm, ItemInventarioFormSet,
 )
 
 def _is_json_request(request):
@@ -73,8 +103,12 @@ def _update_instance_from_data(instance, data, allowed_fields):
             if isinstance(value, related_model):
                 related_instance = value
             else:
+                # Categoria, Fornecedor e Loja vêm do cache local de referências.
+                buscar = referencia if related_model in (Categoria, Fornecedor, Loja) else (
+                    lambda modelo, pk: modelo.objects.get(pk=pk)
+                )
                 try:
-                    related_instance = related_model.objects.get(pk=value)
+                    related_instance = buscar(related_model, value)
                 except (related_model.DoesNotExist, ValueError, TypeError) as exc:
                     raise ValueError(
                         f'{related_model.__name__} com id "{value}" não encontrado.'
@@ -102,7 +136,10 @@ def _update_instance_from_data(instance, data, allowed_fields):
 # ------------------------------
 
 def home(request):
-    return render(request, 'loja_app/home.html')
+    contexto = {}
+    if request.user.is_staff:
+        contexto['valor_estoque'] = valor_por_loja()
+    return render(request, 'loja_app/home.html', contexto)
 
 def about_us_view(request):
     return render(request, 'loja_app/about_us.html')
@@ -129,6 +166,7 @@ def registrar_view(request):
 # LOJAS
 # ------------------------------
 
+@leitura_em_replica
 @login_required
 def lista_lojas(request):
     lojas = Loja.objects.all()
@@ -191,7 +229,9 @@ def editar_loja(request, id):
 def excluir_loja(request, id):
     loja = get_object_or_404(Loja, id=id)
     # Verifica se existem produtos ou vendas associados
-    if Produto.objects.filter(loja=loja).exists() or Venda.objects.filter(loja=loja).exists():
+    if Produto.objects.filter(loja=loja).exists() or Venda.objects.filter(loja=loja).exists() or (
+        VendaArquivada.objects.filter(loja=loja).exists()
+    ):
         messages.error(request, f'Não é possível excluir a loja "{loja.nome}", pois ela possui produtos ou vendas associadas.')
         return redirect('lista_lojas')
 
@@ -206,6 +246,7 @@ def excluir_loja(request, id):
 # CATEGORIAS
 # ------------------------------
 
+@leitura_em_replica
 @staff_member_required
 def lista_categorias(request):
     categorias = Categoria.objects.all()
@@ -222,6 +263,8 @@ def cadastrar_categoria(request):
         form = CategoriaForm()
     return render(request, 'loja_app/categoria_form.html', {'form': form})
 
+@leitura_em_replica
+@limitar('consultas')
 @staff_member_required
 def obter_categoria(request, id):
     categoria = get_object_or_404(Categoria, id=id)
@@ -250,6 +293,7 @@ def excluir_categoria(request, id):
 # FORNECEDORES
 # ------------------------------
 
+@leitura_em_replica
 @staff_member_required
 def lista_fornecedores(request):
     fornecedores = Fornecedor.objects.all()
@@ -308,6 +352,8 @@ def editar_fornecedor(request, id):
         form = FornecedorForm(instance=fornecedor)
     return render(request, 'loja_app/fornecedor_form.html', {'form': form})
 
+@leitura_em_replica
+@limitar('consultas')
 @staff_member_required
 def obter_fornecedor(request, id):
     fornecedor = get_object_or_404(Fornecedor, id=id)
@@ -339,6 +385,7 @@ def excluir_fornecedor(request, id):
 # PRODUTOS E ESTOQUE
 # ------------------------------
 
+@leitura_em_replica
 @staff_member_required
 def lista_produtos(request):
     produtos = Produto.objects.select_related('estoque').all()
@@ -376,9 +423,9 @@ def editar_produto(request, id):
                 'nome': produto.nome,
                 'preco_compra': str(produto.preco_compra),
                 'preco_venda': str(produto.preco_venda),
-                'categoria': produto.categoria.id if produto.categoria else None,
-                'fornecedor': produto.fornecedor.id if produto.fornecedor else None,
-                'loja': produto.loja.id if produto.loja else None,
+                'categoria': produto.categoria_id,
+                'fornecedor': produto.fornecedor_id,
+                'loja': produto.loja_id,
             },
         })
 
@@ -401,25 +448,30 @@ def editar_produto(request, id):
         form = ProdutoForm(instance=produto)
     return render(request, 'loja_app/produto_form.html', {'form': form})
 
+@leitura_em_replica
+@limitar('consultas')
 @staff_member_required
 def obter_produto(request, id):
-    produto = get_object_or_404(Produto.objects.select_related('categoria', 'fornecedor', 'estoque', 'loja'), id=id)
+    produto = get_object_or_404(Produto.objects.select_related('estoque'), id=id)
+    categoria = referencia_ou_none(Categoria, produto.categoria_id)
+    fornecedor = referencia_ou_none(Fornecedor, produto.fornecedor_id)
+    loja = referencia(Loja, produto.loja_id)
     dados = {
         'id': produto.id,
         'nome': produto.nome,
         'preco_compra': produto.preco_compra,
         'preco_venda': produto.preco_venda,
         'categoria': {
-            'id': produto.categoria.id if produto.categoria else None,
-            'nome': produto.categoria.nome if produto.categoria else None,
+            'id': categoria.id if categoria else None,
+            'nome': categoria.nome if categoria else None,
         },
         'fornecedor': {
-            'id': produto.fornecedor.id if produto.fornecedor else None,
-            'nome': produto.fornecedor.nome if produto.fornecedor else None,
+            'id': fornecedor.id if fornecedor else None,
+            'nome': fornecedor.nome if fornecedor else None,
         },
         'loja': {
-            'id': produto.loja.id,
-            'nome': produto.loja.nome,
+            'id': loja.id,
+            'nome': loja.nome,
         },
         'estoque': {
             'quantidade': produto.estoque.quantidade if hasattr(produto, 'estoque') else None,
@@ -431,7 +483,10 @@ def obter_produto(request, id):
 def excluir_produto(request, id):
     produto = get_object_or_404(Produto, id=id)
     # Bloqueia exclusão se tiver histórico
-    if ItensVenda.objects.filter(produto=produto).exists() or MovimentacaoEstoque.objects.filter(produto=produto).exists():
+    if any(
+        modelo.objects.filter(produto=produto).exists()
+        for modelo in (ItensVenda, MovimentacaoEstoque, ItemVendaArquivado, MovimentacaoArquivada)
+    ):
         messages.error(request, f'Não é possível excluir o produto "{produto.nome}", pois ele possui histórico de vendas ou movimentações de estoque.')
         return redirect('lista_produtos')
 
@@ -441,6 +496,22 @@ def excluir_produto(request, id):
         return redirect('lista_produtos')
     return render(request, 'loja_app/confirm_delete.html', {'objeto': produto, 'tipo': 'Produto'})
 
+def _ajustar_estoque(produto, quantidade, descricao):
+    """Soma ``quantidade`` ao estoque do produto com a movimentação, numa transação."""
+    with transaction.atomic():
+        # UPDATE com F(): dois ajustes ao mesmo tempo não sobrescrevem um ao outro.
+        Estoque.objects.filter(produto=produto).update(quantidade=F('quantidade') + quantidade)
+        movimentar({produto.id: quantidade}, {produto.id: produto})
+        movimentacao = MovimentacaoEstoque.objects.create(
+            produto=produto,
+            quantidade=quantidade,
+            tipo='ENTRADA' if quantidade > 0 else 'SAIDA',
+            descricao=descricao,
+        )
+        contar_movimentacoes([movimentacao])
+        registrar_alteracoes([produto.id])
+
+
 @staff_member_required
 def atualizar_estoque(request, produto_id):
     produto = get_object_or_404(Produto, id=produto_id)
@@ -451,15 +522,7 @@ def atualizar_estoque(request, produto_id):
         if form.is_valid():
             quantidade = form.cleaned_data['quantidade']
             descricao = form.cleaned_data['descricao']
-            estoque.quantidade += quantidade
-            estoque.save()
-            tipo_mov = 'ENTRADA' if quantidade > 0 else 'SAIDA'
-            MovimentacaoEstoque.objects.create(
-                produto=produto,
-                quantidade=quantidade,
-                tipo=tipo_mov,
-                descricao=descricao
-            )
+            com_retentativas(lambda: _ajustar_estoque(produto, quantidade, descricao), operacao='ajuste_estoque')
             return redirect('lista_produtos')
     else:
         form = MovimentacaoEstoqueForm()
@@ -468,10 +531,92 @@ def atualizar_estoque(request, produto_id):
     return render(request, 'loja_app/atualizar_estoque.html', context)
 
 
+# ------------------------------
+# RECEBIMENTO DE MERCADORIAS
+# ------------------------------
+
+@leitura_em_replica
+@staff_member_required
+def lista_recebimentos(request):
+    recebimentos = (
+        Recebimento.objects.select_related('fornecedor', 'loja')
+        .annotate(total_itens=Count('itens'), total_unidades=Sum('itens__quantidade'))
+        .order_by('-data')[:100]
+    )
+    return render(request, 'loja_app/recebimento_list.html', {'recebimentos': recebimentos})
+
+@staff_member_required
+def registrar_recebimento(request):
+    """Lança a entrega inteira de um fornecedor: itens digitados ou a nota em CSV."""
+    if request.method == 'POST':
+        recebimento_form = RecebimentoForm(request.POST, request.FILES)
+        loja = recebimento_form.cleaned_data['loja'] if recebimento_form.is_valid() else None
+        item_formset = ItemRecebimentoFormSet(request.POST, loja=loja)
+        if loja is not None and item_formset.is_valid():
+            linhas = recebimento_form.cleaned_data['arquivo'] or item_formset.linhas()
+            if linhas:
+                recebimento = recebimento_form.save(commit=False)
+                recebimento.criado_por = request.user
+                com_retentativas(lambda: lancar_recebimento(recebimento, linhas), operacao='recebimento')
+                messages.success(
+                    request, f'Recebimento #{recebimento.id} lançado: {len(linhas)} itens entraram no estoque.'
+                )
+                return redirect('lista_recebimentos')
+            recebimento_form.add_error(None, 'Informe os itens recebidos ou envie a nota em CSV.')
+    else:
+        recebimento_form = RecebimentoForm()
+        item_formset = ItemRecebimentoFormSet()
+
+    context = {'recebimento_form': recebimento_form, 'item_formset': item_formset}
+    return render(request, 'loja_app/recebimento_form.html', context)
+
+
+# ------------------------------
+# INVENTÁRIO (CONTAGEM FÍSICA)
+# ------------------------------
+
+@leitura_em_replica
+@staff_member_required
+def lista_inventarios(request):
+    inventarios = Inventario.objects.select_related('loja', 'criado_por').order_by('-criado_em')[:100]
+    return render(request, 'loja_app/inventario_list.html', {'inventarios': inventarios})
+
+@staff_member_required
+def registrar_inventario(request):
+    """Recebe a contagem (digitada ou em CSV) e lança as diferenças; contagens grandes vão para a fila."""
+    if request.method == 'POST':
+        inventario_form = InventarioForm(request.POST, request.FILES)
+        loja = inventario_form.cleaned_data['loja'] if inventario_form.is_valid() else None
+        item_formset = ItemInventarioFormSet(request.POST, loja=loja)
+        if loja is not None and item_formset.is_valid():
+            contagens = inventario_form.cleaned_data['arquivo'] or item_formset.contagens()
+            if contagens:
+                inventario = inventario_form.save(commit=False)
+                inventario.criado_por = request.user
+                criar_inventario(inventario, contagens)
+                if len(contagens) > settings.INVENTARIO_LINHAS_NA_REQUISICAO:
+                    enfileirar('lancar_inventario', usuario=request.user, inventario_id=inventario.id)
+                    messages.success(
+                        request, f'Inventário #{inventario.id} recebido; as diferenças serão lançadas em segundo plano.'
+                    )
+                else:
+                    ajustes = com_retentativas(lambda: lancar_inventario(inventario.id), operacao='inventario')
+                    messages.success(request, f'Inventário #{inventario.id} lançado: {ajustes} produtos ajustados.')
+                return redirect('lista_inventarios')
+            inventario_form.add_error(None, 'Informe as quantidades contadas ou envie a contagem em CSV.')
+    else:
+        inventario_form = InventarioForm()
+        item_formset = ItemInventarioFormSet()
+
+    context = {'inventario_form': inventario_form, 'item_formset': item_formset}
+    return render(request, 'loja_app/inventario_form.html', context)
+
+
 # ------------------------------
 # CLIENTES
 # ------------------------------
 
+@leitura_em_replica
 @staff_member_required
 def lista_clientes(request):
     clientes = Cliente.objects.all()
@@ -534,6 +679,8 @@ def editar_cliente(request, id):
         form = ClienteForm(instance=cliente)
     return render(request, 'loja_app/cliente_form.html', {'form': form, 'titulo': 'Editar Cliente'})
 
+@leitura_em_replica
+@limitar('consultas')
 @staff_member_required
 def obter_cliente(request, id):
     cliente = get_object_or_404(Cliente, id=id)
@@ -553,7 +700,7 @@ def obter_cliente(request, id):
 def excluir_cliente(request, id):
     cliente = get_object_or_404(Cliente, id=id)
     # Bloqueia exclusão se tiver vendas
-    if Venda.objects.filter(cliente=cliente).exists():
+    if Venda.objects.filter(cliente=cliente).exists() or VendaArquivada.objects.filter(cliente=cliente).exists():
         messages.error(request, f'Não é possível excluir o cliente "{cliente.nome}", pois ele possui vendas registradas.')
         return redirect('lista_clientes')
 
@@ -568,53 +715,95 @@ def excluir_cliente(request, id):
 # VENDAS
 # ------------------------------
 
+@leitura_em_replica
 @staff_member_required
 def lista_vendas(request):
-    vendas = Venda.objects.all().order_by('-data_venda')
-    return render(request, 'loja_app/venda_list.html', {'vendas': vendas})
+    desde, ate = _periodo(request)
+    # O arquivo entra sempre que o período o alcança; sem "desde" o período não tem início.
+    vendas = com_arquivo(
+        Venda.objects.order_by('-data_venda'),
+        VendaArquivada.objects.order_by('-data_venda'),
+        'data_venda', desde, ate, carregar=linhas_de,
+    )
+    return _listagem_em_partes(request, 'loja_app/venda_list.html', 'vendas', vendas, {'desde': desde, 'ate': ate})
+
+class EstoqueInsuficiente(Exception):
+    pass
+
+
+def _baixar_estoque(produto, quantidade):
+    """Baixa o estoque só se ainda houver ``quantidade`` disponível (sem ler e regravar o valor)."""
+    baixou = Estoque.objects.filter(produto=produto, quantidade__gte=quantidade).update(
+        quantidade=F('quantidade') - quantidade,
+    )
+    if not baixou:
+        disponivel = Estoque.objects.filter(produto=produto).values_list('quantidade', flat=True).first() or 0
+        raise EstoqueInsuficiente(
+            f"Estoque insuficiente para o produto: {produto.nome}. Disponível: {disponivel}"
+        )
+
+
+def _gravar_venda(venda_form, item_formset, loja):
+    # Um banco por loja foi avaliado e não adotado: a venda também grava Estoque, margens,
+    # resumo do cliente e catálogo no banco principal, e o ganho medido foi de ~0,99x.
+    # O limite de escrita se mede com o comando ``teste_carga``.
+    with transaction.atomic():
+        venda = Venda(loja=loja, cliente=venda_form.cleaned_data.get('cliente'), valor_total=0)
+        venda.save()
+        valor_total_venda = 0
+        itens_registrados = []
+        movimentacoes = []
+        baixas = Counter()
+
+        for form in item_formset:
+            if form.cleaned_data:
+                produto = form.cleaned_data['produto']
+                quantidade = form.cleaned_data['quantidade']
+                # Levanta EstoqueInsuficiente, o que desfaz a venda e os itens já gravados.
+                _baixar_estoque(produto, quantidade)
+                baixas[produto.id] -= quantidade
+
+                itens_registrados.append(ItensVenda(
+                    venda=venda,
+                    produto=produto,
+                    quantidade=quantidade,
+                    preco_unitario=produto.preco_venda,
+                    custo_unitario=produto.preco_compra,
+                ))
+                movimentacoes.append(MovimentacaoEstoque(
+                    produto=produto,
+                    quantidade=quantidade,
+                    tipo='SAIDA',
+                    descricao=f"Venda #{venda.id}"
+                ))
+                valor_total_venda += produto.preco_venda * quantidade
+
+        ItensVenda.objects.bulk_create(itens_registrados)
+        movimentar(baixas, {item.produto_id: item.produto for item in itens_registrados})
+        MovimentacaoEstoque.objects.bulk_create(movimentacoes)
+        contar_movimentacoes(movimentacoes)
+        incrementar_no_commit(VENDAS_REGISTRADAS, loja=loja.id)
+        registrar_alteracoes({item.produto_id for item in itens_registrados})
+        venda.valor_total = valor_total_venda
+        venda.save(update_fields=['valor_total'])
+        aplicar_itens_na_margem(venda, itens_registrados)
+        aplicar_venda_no_resumo(venda)
+    return venda
+
 
 @staff_member_required
-@transaction.atomic 
 def registrar_venda(request):
-    ItemVendaFormSet = formset_factory(ItemVendaForm, extra=1)
     if request.method == 'POST':
         venda_form = VendaForm(request.POST)
-        item_formset = ItemVendaFormSet(request.POST)
-        if venda_form.is_valid() and item_formset.is_valid():
-            venda = venda_form.save(commit=False)
-            venda.valor_total = 0
-            venda.save()
-            valor_total_venda = 0
-
-            for form in item_formset:
-                if form.cleaned_data:
-                    produto = form.cleaned_data['produto']
-                    quantidade = form.cleaned_data['quantidade']
-
-                    if produto.estoque.quantidade < quantidade:
-                        messages.error(request, f"Estoque insuficiente para o produto: {produto.nome}. Disponível: {produto.estoque.quantidade}")
-                        return redirect('registrar_venda')
-
-                    item = form.save(commit=False)
-                    item.venda = venda
-                    item.preco_unitario = produto.preco_venda
-                    item.save()
-
-                    estoque = produto.estoque
-                    estoque.quantidade -= quantidade
-                    estoque.save()
-
-                    MovimentacaoEstoque.objects.create(
-                        produto=produto,
-                        quantidade=quantidade,
-                        tipo='SAIDA',
-                        descricao=f"Venda #{venda.id}"
-                    )
-
-                    valor_total_venda += item.preco_unitario * item.quantidade
-
-            venda.valor_total = valor_total_venda
-            venda.save()
+        loja = venda_form.cleaned_data['loja'] if venda_form.is_valid() else None
+        item_formset = ItemVendaFormSet(request.POST, loja=loja)
+        if loja is not None and item_formset.is_valid():
+            # Erros de trava (outro caixa gravando ao mesmo tempo) repetem a venda inteira.
+            try:
+                com_retentativas(lambda: _gravar_venda(venda_form, item_formset, loja), operacao='registrar_venda')
+            except EstoqueInsuficiente as exc:
+                messages.error(request, str(exc))
+                return redirect('registrar_venda')
             return redirect('lista_vendas')
     else:
         venda_form = VendaForm()
@@ -624,8 +813,46 @@ def registrar_venda(request):
     return render(request, 'loja_app/venda_form.html', context)
 
 
+class VendaJaCancelada(Exception):
+    pass
+
+
+def _estornar_venda(venda, itens_venda):
+    quantidades = Counter()
+    for item in itens_venda:
+        quantidades[item.produto_id] += item.quantidade
+
+    # Cada transação começa gravando: no SQLite, ler antes de gravar faz a
+    # transação falhar na hora (em vez de esperar) se outro caixa estiver gravando.
+    with transaction.atomic():
+        # Marca a venda primeiro: dois cancelamentos simultâneos não estornam duas vezes.
+        if not Venda.objects.filter(pk=venda.pk).exclude(status='CANCELADA').update(status='CANCELADA'):
+            raise VendaJaCancelada
+        for produto_id, quantidade in quantidades.items():
+            Estoque.objects.filter(produto_id=produto_id).update(quantidade=F('quantidade') + quantidade)
+        movimentar(quantidades, {item.produto_id: item.produto for item in itens_venda})
+        estornos = MovimentacaoEstoque.objects.bulk_create([
+            MovimentacaoEstoque(
+                produto=item.produto,
+                quantidade=item.quantidade,
+                tipo='ENTRADA',
+                descricao=f'Estorno por cancelamento da Venda #{venda.id}'
+            )
+            for item in itens_venda
+        ])
+        contar_movimentacoes(estornos)
+        incrementar_no_commit(VENDAS_CANCELADAS, loja=venda.loja_id)
+        registrar_alteracoes(quantidades.keys())
+        transaction.on_commit(invalidar_cubo)
+
+        aplicar_itens_na_margem(venda, itens_venda, sinal=-1)
+        aplicar_venda_no_resumo(venda, sinal=-1)
+
+        venda.itens.all().delete()
+        venda.delete()
+
+
 @staff_member_required
-@transaction.atomic
 def cancelar_venda(request, venda_id):
     venda = get_object_or_404(Venda, id=venda_id)
     if venda.status == 'CANCELADA':
@@ -633,27 +860,18 @@ def cancelar_venda(request, venda_id):
         return redirect('lista_vendas')
 
     if request.method == 'POST':
-       venda_identificador = venda.id
-       itens_venda = list(venda.itens.select_related('produto', 'produto__estoque'))
-
-       for item in itens_venda:
-            estoque = item.produto.estoque
-            estoque.quantidade += item.quantidade
-            estoque.save()
-            MovimentacaoEstoque.objects.create(
-                produto=item.produto,
-                quantidade=item.quantidade,
-                tipo='ENTRADA',
-                descricao=f'Estorno por cancelamento da Venda #{venda_identificador}'
-            )
-    
-    venda.itens.all().delete()
-    venda.delete()
-    messages.success(
+        venda_identificador = venda.id
+        itens_venda = list(venda.itens.prefetch_related('produto'))
+        try:
+            com_retentativas(lambda: _estornar_venda(venda, itens_venda), operacao='cancelar_venda')
+        except VendaJaCancelada:
+            messages.error(request, 'Esta venda já foi cancelada.')
+            return redirect('lista_vendas')
+        messages.success(
             request,
             f'Venda #{venda_identificador} cancelada e removida com sucesso. O estoque foi atualizado.'
         )
-    return redirect('lista_vendas')
+        return redirect('lista_vendas')
 
     return render(request, 'loja_app/confirm_cancel.html', {'venda': venda})
 
@@ -662,28 +880,29 @@ def cancelar_venda(request, venda_id):
 # RELATÓRIOS / APIs
 # ------------------------------
 
+@leitura_em_replica
 @staff_member_required
 def relatorio_vendas_cliente(request, cliente_id):
     """Retorna as vendas de um cliente agregando itens no formato "Produto (xQuantidade)"."""
     cliente = get_object_or_404(Cliente, id=cliente_id)
 
-    vendas_queryset = (
+    vendas_queryset = com_arquivo(
         Venda.objects.filter(cliente_id=cliente_id)
         .select_related('loja')
-        .prefetch_related(
-            Prefetch(
-                'itens',
-                queryset=ItensVenda.objects.select_related('produto').order_by('produto__nome', 'id'),
-            )
-        )
-        .order_by('-data_venda')
+        .prefetch_related(Prefetch('itens', queryset=ItensVenda.objects.select_related('produto')))
+        .order_by('-data_venda'),
+        VendaArquivada.objects.filter(cliente_id=cliente_id)
+        .select_related('loja')
+        .prefetch_related(Prefetch('itens', queryset=ItemVendaArquivado.objects.select_related('produto')))
+        .order_by('-data_venda'),
+        'data_venda',
     )
 
     vendas_formatadas = []
     for venda in vendas_queryset:
         itens_descricao = [
             f"{item.produto.nome} (x{item.quantidade})"
-            for item in venda.itens.all()
+            for item in sorted(venda.itens.all(), key=lambda item: (item.produto.nome, item.id))
         ]
 
         vendas_formatadas.append({
@@ -706,50 +925,492 @@ def relatorio_vendas_cliente(request, cliente_id):
     return JsonResponse(resposta)
 
 
+class _Eco:
+    """Pseudo-buffer para o ``csv.writer`` devolver cada linha já formatada."""
+
+    def write(self, value):
+        return value
+
+
+def _periodo(request):
+    """Lê ``desde`` e ``ate`` (AAAA-MM-DD) da querystring; valores inválidos são ignorados."""
+    datas = []
+    for nome in ('desde', 'ate'):
+        valor = request.GET.get(nome, '').strip()
+        try:
+            datas.append(datetime.strptime(valor, '%Y-%m-%d').date() if valor else None)
+        except ValueError:
+            datas.append(None)
+    return tuple(datas)
+
+
+LINHAS_POR_PARTE = 500
+MARCADOR_LINHAS = mark_safe('<!-- linhas da tabela -->')
+
+
+def _listagem_em_partes(request, template, nome, linhas, contexto):
+    """Página de ``template`` com a tabela de ``linhas`` (iterável preguiçoso) enviada em partes.
+
+    O ``{% for %}`` transforma o iterável numa lista antes de começar. Aqui a
+    página é renderizada com ``MARCADOR_LINHAS`` no lugar do corpo da tabela, e
+    ``<template>_linhas.html`` recebe ``LINHAS_POR_PARTE`` linhas por vez em
+    ``nome``, de modo que só uma parte fica na memória. As linhas são lidas
+    enquanto o corpo é enviado, no contexto da view (réplica, se escolhida).
+    """
+    inicio, fim = render_to_string(template, {**contexto, 'linhas': MARCADOR_LINHAS}, request).split(MARCADOR_LINHAS)
+    template_linhas = get_template(template.replace('.html', '_linhas.html'))
+    contexto_da_view = contextvars.copy_context()
+    restantes = iter(linhas)
+
+    def proxima_parte():
+        return list(islice(restantes, LINHAS_POR_PARTE))
+
+    def gerar():
+        yield inicio
+        parte = contexto_da_view.run(proxima_parte)
+        # A primeira parte vai mesmo vazia: o {% empty %} do template mostra a mensagem.
+        yield template_linhas.render({nome: parte})
+        while len(parte) == LINHAS_POR_PARTE:
+            parte = contexto_da_view.run(proxima_parte)
+            if parte:
+                yield template_linhas.render({nome: parte})
+        yield fim
+
+    return StreamingHttpResponse(gerar())
+
+
+def _filtros_margem(request):
+    """Lê ``mes`` (AAAA-MM), ``loja`` e ``agrupar`` da querystring."""
+    mes = None
+    mes_param = request.GET.get('mes', '').strip()
+    if mes_param:
+        try:
+            mes = datetime.strptime(mes_param, '%Y-%m').date()
+        except ValueError:
+            mes = None
+
+    loja_id = request.GET.get('loja') or None
+    if loja_id and not loja_id.isdigit():
+        loja_id = None
+
+    agrupar = request.GET.get('agrupar', 'produto')
+    if agrupar not in ('loja', 'categoria', 'produto'):
+        agrupar = 'produto'
+    return mes, loja_id, agrupar
+
+
+@leitura_em_replica
+@staff_member_required
+def relatorio_margens(request):
+    mes, loja_id, agrupar = _filtros_margem(request)
+    linhas = consultar_margens(mes=mes, loja_id=loja_id, agrupar=agrupar)
+    context = {
+        'linhas': linhas,
+        'lojas': Loja.objects.all(),
+        'mes': request.GET.get('mes', ''),
+        'loja_id': loja_id,
+        'agrupar': agrupar,
+    }
+    return render(request, 'loja_app/relatorio_margens.html', context)
+
+
+@leitura_em_replica
+@staff_member_required
+def exportar_margens_csv(request):
+    mes, loja_id, agrupar = _filtros_margem(request)
+    linhas = consultar_margens(mes=mes, loja_id=loja_id, agrupar=agrupar)
+    # O corpo é gerado depois que a view retorna; fixa o banco escolhido agora.
+    linhas = linhas.using(linhas.db)
+    writer = csv.writer(_Eco())
+
+    def gerar():
+        yield writer.writerow(CABECALHO_CSV)
+        for linha in linhas_csv(linhas.iterator()):
+            yield writer.writerow(linha)
+
+    response = StreamingHttpResponse(gerar(), content_type='text/csv; charset=utf-8')
+    response['Content-Disposition'] = 'attachment; filename="margens.csv"'
+    return response
+
+
+@staff_member_required
+def exportar_margens_tarefa(request):
+    """Enfileira a exportação de margens e devolve a URL para acompanhar a tarefa."""
+    if request.method != 'POST':
+        return JsonResponse({'detalhe': 'Use POST para iniciar a exportação.'}, status=405)
+
+    mes, loja_id, agrupar = _filtros_margem(request)
+    tarefa = enfileirar(
+        'exportar_margens',
+        usuario=request.user,
+        mes=mes.isoformat() if mes else None,
+        loja_id=loja_id,
+        agrupar=agrupar,
+    )
+    return JsonResponse(_dados_tarefa(tarefa), status=202)
+
+
+@leitura_em_replica
+@staff_member_required
+def valor_estoque(request):
+    """Estoque a preço de custo por loja e categoria, lido do agregado mantido a cada movimentação."""
+    loja = request.GET.get('loja', '')
+    lojas = valor_por_loja(int(loja) if loja.isdigit() else None)
+    return JsonResponse({
+        'total': str(sum((loja['valor'] for loja in lojas), Decimal('0'))),
+        'lojas': [
+            {
+                **loja,
+                'valor': str(loja['valor']),
+                'categorias': [
+                    {**categoria, 'valor': str(categoria['valor'])} for categoria in loja['categorias']
+                ],
+            }
+            for loja in lojas
+        ],
+    })
+
+
+# ------------------------------
+# ANÁLISES (CUBO EM MEMÓRIA)
+# ------------------------------
+
+@leitura_em_replica
+@staff_member_required
+def analise_vendas(request):
+    """Quantidade e receita agrupadas por ``produto``, ``loja``, ``hora`` ou ``dia``, sem GROUP BY no banco."""
+    agrupar = request.GET.get('agrupar', 'produto')
+    if agrupar not in DIMENSOES:
+        return JsonResponse({'detalhe': f'Use agrupar={"|".join(DIMENSOES)}.'}, status=400)
+    filtros = {}
+    for nome in ('loja', 'produto'):
+        valor = request.GET.get(nome, '')
+        if valor.isdigit():
+            filtros[nome] = int(valor)
+    filtros['desde'], filtros['ate'] = _periodo(request)
+
+    totais = cubo_vendas().agrupar(agrupar, **filtros)
+    return JsonResponse({
+        'agrupar': agrupar,
+        'resultados': [
+            {
+                'chave': chave.isoformat() if agrupar == 'dia' else chave,
+                'quantidade': quantidade,
+                'receita': f'{receita_centavos / 100:.2f}',
+            }
+            for chave, (quantidade, receita_centavos) in sorted(totais.items())
+        ],
+    })
+
+
+# ------------------------------
+# REPOSIÇÃO (PREVISÃO DE DEMANDA)
+# ------------------------------
+
+def _filtros_reposicao(request):
+    filtros = {}
+    for nome in ('loja', 'fornecedor'):
+        valor = request.GET.get(nome, '')
+        if valor.isdigit():
+            filtros[f'{nome}_id'] = int(valor)
+    return filtros
+
+
+@leitura_em_replica
+@staff_member_required
+def sugestoes_reposicao(request):
+    """Sugestões de compra gravadas pelo cálculo de reposição, agrupadas por fornecedor."""
+    filtros = _filtros_reposicao(request)
+    sugestoes = (
+        SugestaoReposicao.objects.filter(quantidade_sugerida__gt=0, **filtros)
+        .select_related('produto', 'loja', 'fornecedor')
+        .annotate(valor_compra=ExpressionWrapper(
+            F('quantidade_sugerida') * F('produto__preco_compra'),
+            output_field=django_models.DecimalField(max_digits=14, decimal_places=2),
+        ))
+        .order_by(F('fornecedor__nome').asc(nulls_last=True), 'fornecedor_id', 'loja__nome', 'produto__nome')
+    )
+    context = {
+        'sugestoes': sugestoes,
+        'calculado_em': SugestaoReposicao.objects.aggregate(ultimo=Max('calculado_em'))['ultimo'],
+        'lojas': Loja.objects.all(),
+        'fornecedores': Fornecedor.objects.all(),
+        'loja_id': filtros.get('loja_id'),
+        'fornecedor_id': filtros.get('fornecedor_id'),
+    }
+    return render(request, 'loja_app/sugestoes_reposicao.html', context)
+
+
+@staff_member_required
+def calcular_reposicao_tarefa(request):
+    """Enfileira o recálculo das sugestões (todas ou de uma loja) e devolve a URL para acompanhar."""
+    if request.method != 'POST':
+        return JsonResponse({'detalhe': 'Use POST para iniciar o cálculo.'}, status=405)
+    tarefa = enfileirar(
+        'calcular_reposicao', usuario=request.user, loja_id=_filtros_reposicao(request).get('loja_id'),
+    )
+    return JsonResponse(_dados_tarefa(tarefa), status=202)
+
+
+# ------------------------------
+# TAREFAS EM SEGUNDO PLANO
+# ------------------------------
+
+def _obter_tarefa_do_usuario(request, tarefa_id):
+    tarefa = get_object_or_404(Tarefa, id=tarefa_id)
+    if not request.user.is_staff and tarefa.criado_por_id != request.user.id:
+        raise Http404('Tarefa não encontrada.')
+    return tarefa
+
+
+def _dados_tarefa(tarefa):
+    return {
+        'id': tarefa.id,
+        'tipo': tarefa.tipo,
+        'status': tarefa.status,
+        'progresso': tarefa.progresso,
+        'mensagem': tarefa.mensagem,
+        'erro': tarefa.erro.strip().splitlines()[-1] if tarefa.erro else None,
+        'criada_em': tarefa.criada_em.isoformat(),
+        'concluida_em': tarefa.concluida_em.isoformat() if tarefa.concluida_em else None,
+        'status_url': reverse('status_tarefa', args=[tarefa.id]),
+        'resultado_url': (
+            reverse('resultado_tarefa', args=[tarefa.id])
+            if tarefa.status == 'CONCLUIDA' and tarefa.arquivo_resultado else None
+        ),
+    }
+
+
+@login_required
+def status_tarefa(request, tarefa_id):
+    tarefa = _obter_tarefa_do_usuario(request, tarefa_id)
+    return JsonResponse(_dados_tarefa(tarefa))
+
+
+@login_required
+def resultado_tarefa(request, tarefa_id):
+    tarefa = _obter_tarefa_do_usuario(request, tarefa_id)
+    if tarefa.status != 'CONCLUIDA' or not tarefa.arquivo_resultado:
+        raise Http404('Resultado ainda não disponível.')
+
+    caminho = diretorio_resultados() / tarefa.arquivo_resultado
+    if not caminho.exists():
+        raise Http404('Arquivo de resultado não encontrado.')
+    return FileResponse(open(caminho, 'rb'), as_attachment=True, filename=caminho.name)
 
 
 # ------------------------------
 # AJAX
 # ------------------------------
 
+@leitura_em_replica
+@limitar('catalogo')
 def get_produtos_por_loja(request):
     loja_id = request.GET.get('loja_id')
     produtos = Produto.objects.filter(loja_id=loja_id).order_by('nome')
     return JsonResponse(list(produtos.values('id', 'nome')), safe=False)
 
+@leitura_em_replica
+@limitar('catalogo')
+def alteracoes_catalogo(request, loja_id):
+    """Sincronização incremental do catálogo de uma loja para os caixas.
+
+    Sem ``since`` devolve o catálogo completo e o cursor atual; com
+    ``since=<cursor>`` devolve só o que mudou depois dele.
+    """
+    loja = get_object_or_404(Loja, id=loja_id)
+    since = request.GET.get('since')
+
+    if since is None:
+        cursor = cursor_atual(loja.id)
+        return JsonResponse({
+            'loja': loja.id,
+            'completo': True,
+            'cursor': cursor,
+            'mais': False,
+            'alteracoes': snapshot_catalogo(loja.id),
+        })
+
+    try:
+        since = int(since)
+        limite = min(int(request.GET.get('limite', 500)), 5000)
+    except ValueError:
+        return JsonResponse({'detalhe': 'Parâmetros "since" e "limite" devem ser inteiros.'}, status=400)
+    if limite < 1:
+        return JsonResponse({'detalhe': 'Parâmetro "limite" deve ser maior que zero.'}, status=400)
+
+    alteracoes, cursor, mais = alteracoes_desde(loja.id, since, limite=limite)
+    return JsonResponse({
+        'loja': loja.id,
+        'completo': False,
+        'cursor': cursor,
+        'mais': mais,
+        'alteracoes': alteracoes,
+    })
+
+@leitura_em_replica
+@staff_member_required
+def buscar_produtos(request):
+    """Autocomplete de produtos da venda: busca por código ou início do nome dentro da loja."""
+    loja_id = request.GET.get('loja', '')
+    termo = request.GET.get('q', '').strip()
+    if not loja_id.isdigit() or not termo:
+        return JsonResponse([], safe=False)
+
+    produtos = Produto.objects.filter(loja_id=loja_id)
+    if termo.isdigit():
+        produtos = produtos.filter(Q(id=termo) | Q(nome__istartswith=termo))
+    else:
+        produtos = produtos.filter(nome__istartswith=termo)
+
+    resultado = produtos.order_by('nome').values('id', 'nome', 'preco_venda', 'estoque__quantidade')[:20]
+    return JsonResponse([
+        {
+            'id': produto['id'],
+            'nome': produto['nome'],
+            'preco_venda': str(produto['preco_venda']),
+            'estoque': produto['estoque__quantidade'],
+            'detalhe': f"R$ {produto['preco_venda']} - {produto['estoque__quantidade']} em estoque",
+        }
+        for produto in resultado
+    ], safe=False)
+
+def _faixa_prefixo(campo, prefixo):
+    """Filtro ``prefixo <= campo < próximo prefixo``, que usa o índice do campo."""
+    limite = prefixo[:-1] + chr(ord(prefixo[-1]) + 1)
+    return Q(**{f'{campo}__gte': prefixo, f'{campo}__lt': limite})
+
+@leitura_em_replica
+@staff_member_required
+def buscar_clientes(request):
+    """Autocomplete de clientes: CPF exato, prefixo de CPF/telefone ou início do nome."""
+    termo = request.GET.get('q', '').strip()
+    digitos = somente_digitos(termo)
+    if not termo:
+        return JsonResponse([], safe=False)
+
+    if digitos and re.fullmatch(r'[\d.\-/()+\s]+', termo):
+        # O termo é um CPF ou telefone, com ou sem pontuação.
+        if len(digitos) == 11:
+            clientes = Cliente.objects.filter(Q(cpf_normalizado=digitos) | Q(telefone_normalizado=digitos))
+        else:
+            clientes = Cliente.objects.filter(
+                _faixa_prefixo('cpf_normalizado', digitos) | _faixa_prefixo('telefone_normalizado', digitos)
+            )
+    else:
+        clientes = Cliente.objects.filter(nome__istartswith=termo)
+
+    resultado = clientes.order_by('nome').values('id', 'nome', 'cpf', 'telefone')[:20]
+    return JsonResponse([
+        {
+            'id': cliente['id'],
+            'nome': cliente['nome'],
+            'cpf': cliente['cpf'],
+            'telefone': cliente['telefone'],
+            'detalhe': ' - '.join(filter(None, [cliente['cpf'], cliente['telefone']])),
+        }
+        for cliente in resultado
+    ], safe=False)
+
+@leitura_em_replica
 @staff_member_required
 def lista_itens_venda(request):
-    itens_venda = ItensVenda.objects.all().order_by('-venda__data_venda')
-    return render(request, 'loja_app/itens_venda_list.html', {'itens_venda': itens_venda})
+    desde, ate = _periodo(request)
+    itens_venda = com_arquivo(
+        ItensVenda.objects.order_by('-venda__data_venda'),
+        ItemVendaArquivado.objects.order_by('-venda__data_venda'),
+        'venda__data_venda', desde, ate, carregar=linhas_de,
+    )
+    return _listagem_em_partes(
+        request, 'loja_app/itens_venda_list.html', 'itens_venda', itens_venda, {'desde': desde, 'ate': ate},
+    )
 
+@leitura_em_replica
 @staff_member_required
 def lista_movimentacoes_estoque(request):
-    movimentacoes = MovimentacaoEstoque.objects.all().order_by('-data')
-    return render(request, 'loja_app/movimentacao_estoque_list.html', {'movimentacoes': movimentacoes})
+    desde, ate = _periodo(request)
+    movimentacoes = com_arquivo(
+        MovimentacaoEstoque.objects.order_by('-data'),
+        MovimentacaoArquivada.objects.order_by('-data'),
+        'data', desde, ate, carregar=linhas_de,
+    )
+    return _listagem_em_partes(
+        request, 'loja_app/movimentacao_estoque_list.html', 'movimentacoes', movimentacoes,
+        {'desde': desde, 'ate': ate},
+    )
 
 # ------------------------------
 # HISTÓRICO DE COMPRAS (CLIENTE)
 # ------------------------------
+POR_PAGINA_HISTORICO = 25
+
+@leitura_em_replica
 @login_required
 def meu_historico_compras(request):
     vendas_cliente = []
     cliente_profile = None
+    resumo = None
+    proxima_pagina = None
     
     # Apenas usuários não-staff (clientes) devem ter um histórico de compras pessoal
     if not request.user.is_staff:
-        try:
-            # Tenta encontrar o perfil de cliente vinculado a este usuário
-            cliente_profile = Cliente.objects.get(user=request.user)
-            # Filtra as vendas apenas para este cliente
-            vendas_cliente = Venda.objects.filter(cliente=cliente_profile).order_by('-data_venda')
-        except Cliente.DoesNotExist:
+        # Perfil de cliente vinculado a este usuário (em cache junto com o usuário)
+        cliente_profile = cliente_do_usuario(request.user)
+        if cliente_profile is not None:
+            # Totais prontos no resumo; o histórico vem em páginas a partir do cursor "antes"
+            resumo = ResumoCliente.objects.filter(cliente=cliente_profile).select_related('loja_favorita').first()
+            vendas_cliente, proxima_pagina = historico_de_compras(
+                cliente_profile, ler_cursor(request.GET.get('antes')), POR_PAGINA_HISTORICO,
+            )
+        else:
             # O usuário logado não tem um perfil de cliente
             # (Talvez um usuário antigo antes da mudança ou um erro)
             messages.error(request, 'Não foi possível encontrar seu perfil de cliente.')
-            pass 
 
     context = {
         'vendas': vendas_cliente,
-        'cliente_profile': cliente_profile
+        'cliente_profile': cliente_profile,
+        'resumo': resumo,
+        'proxima_pagina': proxima_pagina,
+        'primeira_pagina': 'antes' not in request.GET,
+    }
+    return render(request, 'loja_app/meu_historico_compras.html', context)
+
+
+# ------------------------------
+# CONSULTAS LENTAS
+# ------------------------------
+
+@staff_member_required
+def lista_consultas_lentas(request):
+    if request.method == 'POST':
+        limpar_registro()
+        messages.success(request, 'Registro de consultas lentas esvaziado.')
+        return redirect('lista_consultas_lentas')
+
+    registros = consultas_registradas()
+    context = {
+        'grupos': agrupar_por_impressao(registros),
+        'total': len(registros),
+        'limiar_ms': settings.CONSULTAS_LENTAS_MS,
+        'maximo': settings.CONSULTAS_LENTAS_MAXIMO,
+        'arquivo': settings.CONSULTAS_LENTAS_ARQUIVO,
     }
-    return render(request, 'loja_app/meu_historico_compras.html', context)
\ No newline at end of file
+    return render(request, 'loja_app/consultas_lentas.html', context)
+
+
+# ------------------------------
+# MÉTRICAS (PROMETHEUS)
+# ------------------------------
+
+def metricas_prometheus(request):
+    """Métricas de todos os processos no formato de texto do Prometheus.
+
+    Com ``METRICAS_TOKEN`` configurado, aceita ``Authorization: Bearer <token>``;
+    fora isso, só usuários staff.
+    """
+    token = settings.METRICAS_TOKEN
+    autorizacao = request.headers.get('Authorization', '')
+    if not (token and hmac.compare_digest(autorizacao, f'Bearer {token}')) and not request.user.is_staff:
+        return HttpResponse('Acesso negado.', status=403, content_type='text/plain; charset=utf-8')
+    return HttpResponse(exportar(), content_type='text/plain; version=0.0.4; charset=utf-8')